@@ -0,0 +1,91 @@
+# bench_import.py
+#
+# Throughput of importer.import_paths() over a generated engagement
+# archive: a verbose Responder session log (mostly poisoning noise, with a
+# capture every ~20 lines) and the matching per-client hash files, so half
+# of the captures are repeats to be dropped.
+#
+# Runs the import in one process and with the process pool, and checks
+# both against an import that is not split into chunks.
+#
+# Usage (from the directory containing ghostrelay/):
+#   python3 -m ghostrelay.benchmarks.bench_import [MB]
+
+from __future__ import annotations
+import os
+import sys
+import tempfile
+from typing import List
+
+from ghostrelay.importer import import_paths
+from ghostrelay.sessions import SessionStore
+
+DEFAULT_MB = 200
+USERS = 5000
+CLIENTS = 50
+NOISE = 20      # poisoning lines per capture
+
+
+def build(root: str, mb: int) -> None:
+    logs = os.path.join(root, "logs")
+    os.makedirs(logs)
+    hashes = {}
+    with open(os.path.join(root, "Responder-Session.log"), "w") as log:
+        i = 0
+        while log.tell() < mb * 1_000_000:
+            client = f"10.0.0.{i % CLIENTS + 1}"
+            user = f"user{i % USERS}"
+            line = f"{user}::CORP:1122334455667788:{i:032x}:0101000000000000"
+            block = [
+                f"[*] [LLMNR]  Poisoned answer sent to 10.0.{i % 250}.{j} for name fs{j}"
+                for j in range(NOISE)
+            ]
+            block += [
+                f"[SMB] NTLMv2-SSP Client   : {client}",
+                f"[SMB] NTLMv2-SSP Username : CORP\\{user}",
+                f"[SMB] NTLMv2-SSP Hash     : {line}",
+            ]
+            log.write("\n".join(block) + "\n")
+            hashes.setdefault(client, []).append(line)
+            i += 1
+
+    for client, lines in hashes.items():
+        with open(os.path.join(logs, f"SMB-NTLMv2-SSP-{client}.txt"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def run(root: str, tmp: str, name: str, **kwargs):
+    d = os.path.join(tmp, name)
+    os.makedirs(d)
+    store = SessionStore(
+        path=os.path.join(d, "s.bin"),
+        journal_path=os.path.join(d, "s.journal"),
+        legacy_path=os.path.join(d, "s.json"),
+        archive_path=os.path.join(d, "a.gz"),
+        watch=False,
+    )
+    result = import_paths([root], store=store, **kwargs)
+    store.close()
+    return result
+
+
+def main(argv: List[str]) -> None:
+    mb = int(argv[0]) if argv else DEFAULT_MB
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, "archive")
+        build(root, mb)
+
+        whole = run(root, tmp, "whole", workers=1, chunk=1 << 62)
+        print(f"{whole.files} files, {whole.bytes / 1e6:.0f} MB, {whole.captures} captures\n")
+        print(f"  {'mode':<12} {'seconds':>8} {'MB/s':>8}")
+        for name, kwargs in (("1 process", dict(workers=1)), ("pool", dict())):
+            r = run(root, tmp, name.replace(" ", "-"), **kwargs)
+            assert (r.captures, r.duplicates, r.added, r.merged) == (
+                whole.captures, whole.duplicates, whole.added, whole.merged
+            ), (r, whole)
+            print(f"  {name:<12} {r.seconds:>8.2f} {r.bytes / 1e6 / r.seconds:>8.1f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,69 @@
+# bench_log_tail.py
+#
+# Cost of one /capture/logs poll against the size of ghostrelay.log.
+#
+#   before : read the whole file, keep the last 12 KB, strip ANSI codes
+#            (the original capture.logs handler)
+#   after  : log_tail.read_tail() with the cursor from the previous poll,
+#            after one new line was appended
+#
+# Usage (from the directory containing ghostrelay/):
+#   python3 -m ghostrelay.benchmarks.bench_log_tail [MB ...]
+
+from __future__ import annotations
+import os
+import re
+import sys
+import tempfile
+import time
+from typing import List
+
+from ghostrelay.log_tail import read_tail
+
+DEFAULT_SIZES_MB = (1, 10, 100)
+REPEAT = 20
+
+ANSI_RE = re.compile(r"\x1B\[[0-9;]*[A-Za-z]")
+LINE = b"[SMB] NTLMv2-SSP Client   : 10.0.0.23  \x1b[1;34mservice: FileServer\x1b[0m\n"
+
+
+def old_poll(path: str) -> str:
+    with open(path, "r", errors="ignore") as f:
+        data = f.read()[-12000:]
+    return ANSI_RE.sub("", data)
+
+
+def main(argv: List[str]) -> None:
+    sizes = [int(a) for a in argv] or list(DEFAULT_SIZES_MB)
+
+    print(f"{'log MB':>7}  {'before ms':>10}  {'after ms':>9}")
+    for mb in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "ghostrelay.log")
+            block = LINE * (1024 * 1024 // len(LINE))
+            with open(path, "wb") as f:
+                for _ in range(mb):
+                    f.write(block)
+
+            t0 = time.perf_counter()
+            for _ in range(REPEAT):
+                old_poll(path)
+            before = (time.perf_counter() - t0) / REPEAT * 1000.0
+
+            cursor = read_tail(path).cursor
+            elapsed = 0.0
+            with open(path, "ab", buffering=0) as log:
+                for _ in range(REPEAT):
+                    log.write(LINE)
+                    t0 = time.perf_counter()
+                    chunk = read_tail(path, cursor)
+                    elapsed += time.perf_counter() - t0
+                    assert chunk.data == LINE and not chunk.reset
+                    cursor = chunk.cursor
+            after = elapsed / REPEAT * 1000.0
+
+            print(f"{mb:>7}  {before:>10.3f}  {after:>9.3f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
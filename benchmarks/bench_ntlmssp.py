@@ -0,0 +1,121 @@
+# bench_ntlmssp.py
+#
+# Messages per second through ntlmssp.parse() for realistic NEGOTIATE,
+# CHALLENGE and AUTHENTICATE (NTLMv2, with MIC) messages, as sent by a
+# current Windows client and server:
+#
+#   parse        parse() alone: header, security buffers, AV pairs and the
+#                NTLMv2 response, no strings decoded
+#   metadata     sessions._parse_ntlm_metadata(), what a capture costs the
+#                session store (strings decoded)
+#
+# The builders here are shared with fuzz_ntlmssp.py.
+#
+# Usage (from the directory containing ghostrelay/):
+#   python3 -m ghostrelay.benchmarks.bench_ntlmssp [N]
+
+from __future__ import annotations
+import os
+import struct
+import sys
+import time
+from typing import Dict, List, Sequence, Tuple
+
+from ghostrelay import ntlmssp
+
+DEFAULT_N = 200000
+
+VERSION = struct.pack("<BBH3xB", 10, 0, 19041, 15)
+CLIENT_FLAGS = 0xE2088297
+SERVER_FLAGS = 0xE2898215
+
+
+def secbufs(base: int, fields: Sequence[bytes]) -> Tuple[bytes, bytes]:
+    """
+    Security buffer headers for `fields` laid out from offset `base`, and
+    the payload they point into.
+    """
+    hdrs, payload = b"", b""
+    for f in fields:
+        hdrs += struct.pack("<HHI", len(f), len(f), base + len(payload))
+        payload += f
+    return hdrs, payload
+
+
+def av_pairs(pairs: Sequence[Tuple[int, bytes]]) -> bytes:
+    out = b"".join(struct.pack("<HH", i, len(v)) + v for i, v in pairs)
+    return out + struct.pack("<HH", ntlmssp.MSV_AV_EOL, 0)
+
+
+def target_info(domain: str = "CORP", host: str = "FS01") -> bytes:
+    dns = f"{domain.lower()}.local"
+    return av_pairs([
+        (ntlmssp.MSV_AV_NB_DOMAIN_NAME, domain.encode("utf-16-le")),
+        (ntlmssp.MSV_AV_NB_COMPUTER_NAME, host.encode("utf-16-le")),
+        (ntlmssp.MSV_AV_DNS_DOMAIN_NAME, dns.encode("utf-16-le")),
+        (ntlmssp.MSV_AV_DNS_COMPUTER_NAME, f"{host.lower()}.{dns}".encode("utf-16-le")),
+        (ntlmssp.MSV_AV_DNS_TREE_NAME, dns.encode("utf-16-le")),
+        (ntlmssp.MSV_AV_TIMESTAMP, struct.pack("<Q", 133000000000000000)),
+    ])
+
+
+def negotiate(domain: bytes = b"", workstation: bytes = b"") -> bytes:
+    hdrs, payload = secbufs(40, (domain, workstation))
+    return ntlmssp.NTLM_MAGIC + struct.pack("<II", 1, CLIENT_FLAGS) + hdrs + VERSION + payload
+
+
+def challenge(domain: str = "CORP", host: str = "FS01") -> bytes:
+    name = domain.encode("utf-16-le")
+    info = target_info(domain, host)
+    hdrs, payload = secbufs(56, (name, info))
+    return (ntlmssp.NTLM_MAGIC + struct.pack("<I", 2) + hdrs[:8] + struct.pack("<I", SERVER_FLAGS)
+            + os.urandom(8) + bytes(8) + hdrs[8:] + VERSION + payload)
+
+
+def ntlmv2_response(domain: str = "CORP", host: str = "FS01") -> bytes:
+    blob = (struct.pack("<BB6xQ", 1, 1, 133000000000000000) + os.urandom(8) + bytes(4)
+            + target_info(domain, host)[:-4]
+            + av_pairs([(ntlmssp.MSV_AV_FLAGS, struct.pack("<I", 2)),
+                        (ntlmssp.MSV_AV_SINGLE_HOST, os.urandom(48)),
+                        (ntlmssp.MSV_AV_CHANNEL_BINDINGS, bytes(16)),
+                        (ntlmssp.MSV_AV_TARGET_NAME, f"cifs/{host}".encode("utf-16-le"))])
+            + bytes(4))
+    return os.urandom(16) + blob
+
+
+def authenticate(user: str = "alice", domain: str = "CORP", workstation: str = "WS01",
+                 nt_response: bytes = b"", mic: bool = True) -> bytes:
+    nt = nt_response or ntlmv2_response(domain)
+    fields = (bytes(24), nt, domain.encode("utf-16-le"), user.encode("utf-16-le"),
+              workstation.encode("utf-16-le"), os.urandom(16))
+    base = 88 if mic else 72
+    hdrs, payload = secbufs(base, fields)
+    msg = ntlmssp.NTLM_MAGIC + struct.pack("<I", 3) + hdrs + struct.pack("<I", CLIENT_FLAGS) + VERSION
+    if mic:
+        msg += os.urandom(16)
+    return msg + payload
+
+
+def samples() -> Dict[str, bytes]:
+    return {"NEGOTIATE": negotiate(), "CHALLENGE": challenge(), "AUTHENTICATE": authenticate()}
+
+
+def rate(fn, blob: bytes, n: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn(blob)
+    return n / (time.perf_counter() - t0)
+
+
+def main(argv: List[str]) -> None:
+    n = int(argv[0]) if argv else DEFAULT_N
+    from ghostrelay.sessions import _parse_ntlm_metadata
+
+    print(f"  {'message':<14} {'bytes':>6} {'parse msg/s':>12} {'metadata msg/s':>15}")
+    for name, blob in samples().items():
+        print(f"  {name:<14} {len(blob):>6} {rate(ntlmssp.parse, blob, n):>12,.0f} "
+              f"{rate(_parse_ntlm_metadata, blob, n):>15,.0f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
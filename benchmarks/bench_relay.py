@@ -0,0 +1,148 @@
+# bench_relay.py
+#
+# Bulk throughput of one tunnel through the SOCKS proxy on loopback.
+#
+# A sink process reads until EOF and answers with the byte count; this
+# process pushes SIZE MB through a tunnel to it, half-closes and waits for
+# the answer. Compared against the same transfer straight to the sink,
+# which is what loopback itself manages:
+#
+#   direct          no proxy
+#   threads ntlm    threaded engine with NTLM logging on: the dissector
+#                   reads the first INSPECT_BYTES, then the tunnel splices
+#   threads         threaded engine with NTLM logging off (splice(2) on Linux)
+#   asyncio         asyncio engine, NTLM logging off
+#
+# Usage (from the directory containing ghostrelay/):
+#   python3 -m ghostrelay.benchmarks.bench_relay [MB]
+
+from __future__ import annotations
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+from typing import List, Optional, Tuple
+
+from ghostrelay.benchmarks.bench_socks import PKG_DIR, free_port, proc_cpu, wait_listening
+
+DEFAULT_MB = 2000
+RUNS = 3
+CHUNK = 1 << 20
+
+PROXY = r"""
+import logging, sys
+sys.path[:0] = [sys.argv[1], sys.argv[2]]
+from config import CONFIG
+CONFIG.log_ntlm = sys.argv[4] == "1"
+from socks_proxy import GhostRelaySocksServer
+from socks_async import AsyncSocksServer
+engine, port = sys.argv[3], int(sys.argv[5])
+log = logging.getLogger("bench")
+if engine == "asyncio":
+    srv = AsyncSocksServer("127.0.0.1", port, log)
+else:
+    srv = GhostRelaySocksServer("127.0.0.1", port, log)
+srv.start()
+"""
+
+SINK = r"""
+import socket, struct, sys
+ls = socket.socket()
+ls.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+ls.bind(("127.0.0.1", int(sys.argv[1])))
+ls.listen(16)
+buf = bytearray(1 << 20)
+while True:
+    c, _ = ls.accept()
+    n = 0
+    while True:
+        k = c.recv_into(buf)
+        if not k:
+            break
+        n += k
+    c.sendall(struct.pack("!Q", n))
+    c.close()
+"""
+
+MODES = (
+    ("direct", None, False),
+    ("threads ntlm", "threads", True),
+    ("threads", "threads", False),
+    ("asyncio", "asyncio", False),
+)
+
+
+def connect(sink_port: int, proxy_port: Optional[int]) -> socket.socket:
+    if proxy_port is None:
+        return socket.create_connection(("127.0.0.1", sink_port))
+    s = socket.create_connection(("127.0.0.1", proxy_port))
+    s.sendall(b"\x05\x01\x00")
+    assert s.recv(2) == b"\x05\x00"
+    s.sendall(b"\x05\x01\x00\x01" + socket.inet_aton("127.0.0.1") + struct.pack("!H", sink_port))
+    reply = s.recv(10)
+    assert reply[1] == 0, reply
+    return s
+
+
+def transfer(sock: socket.socket, total: int) -> float:
+    payload = memoryview(os.urandom(CHUNK))
+    t0 = time.perf_counter()
+    sent = 0
+    while sent < total:
+        sock.sendall(payload)
+        sent += len(payload)
+    sock.shutdown(socket.SHUT_WR)
+    n = struct.unpack("!Q", sock.recv(8))[0]
+    elapsed = time.perf_counter() - t0
+    assert n == sent, (n, sent)
+    sock.close()
+    return elapsed
+
+
+def run(sink_port: int, engine: Optional[str], log_ntlm: bool, total: int) -> Tuple[float, float]:
+    proxy = proxy_port = None
+    if engine is not None:
+        proxy_port = free_port()
+        proxy = subprocess.Popen([
+            sys.executable, "-c", PROXY, os.path.dirname(PKG_DIR), PKG_DIR,
+            engine, "1" if log_ntlm else "0", str(proxy_port),
+        ])
+    try:
+        if proxy is not None:
+            wait_listening(proxy_port)
+        best, cpu = float("inf"), 0.0
+        for _ in range(RUNS):
+            cpu0 = proc_cpu(proxy.pid) if proxy else 0.0
+            elapsed = transfer(connect(sink_port, proxy_port), total)
+            if elapsed < best:
+                best = elapsed
+                cpu = (proc_cpu(proxy.pid) - cpu0) if proxy else 0.0
+        return best, cpu
+    finally:
+        if proxy is not None:
+            proxy.kill()
+            proxy.wait()
+
+
+def main(argv: List[str]) -> None:
+    mb = int(argv[0]) if argv else DEFAULT_MB
+    total = mb * CHUNK
+
+    sink_port = free_port()
+    sink = subprocess.Popen([sys.executable, "-c", SINK, str(sink_port)])
+    try:
+        wait_listening(sink_port)
+        print(f"{mb} MB per transfer, best of {RUNS}\n")
+        print(f"  {'mode':<16} {'seconds':>8} {'MB/s':>8} {'proxy cpu s':>12}")
+        for name, engine, log_ntlm in MODES:
+            elapsed, cpu = run(sink_port, engine, log_ntlm, total)
+            print(f"  {name:<16} {elapsed:>8.2f} {total / 1e6 / elapsed:>8.0f} {cpu:>12.2f}")
+    finally:
+        sink.kill()
+        sink.wait()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
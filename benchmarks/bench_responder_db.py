@@ -0,0 +1,99 @@
+# bench_responder_db.py
+#
+# Cost of one ResponderDBReader.poll() tick against a Responder.db that
+# already holds N rows, for a tick with no new rows and one with a burst of
+# new captures. The tick should not grow with N.
+#
+# The database is generated locally with Responder's own schema; rows are
+# written through a separate connection, as Responder would. Ingested
+# sessions go to a throwaway SessionStore and are checked against what was
+# written.
+#
+# Usage (from the directory containing ghostrelay/):
+#   python3 -m ghostrelay.benchmarks.bench_responder_db [N ...]
+
+from __future__ import annotations
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import List
+
+from ghostrelay.responder_db import RESPONDER_SCHEMA, ResponderDBReader
+from ghostrelay.sessions import SessionStore
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+BURST = 100
+REPEAT = 20
+
+
+def rows(start: int, n: int) -> List[tuple]:
+    out = []
+    for i in range(start, start + n):
+        user = f"user{i}"
+        out.append((
+            "2024-01-01 00:00:00", "SMB", "NTLMv2-SSP", f"10.0.{i // 250 % 250}.{i % 250 + 1}",
+            f"WS{i % 500}", f"CORP\\{user}", "", f"{i:032x}",
+            f"{user}::CORP:1122334455667788:{i:032x}:0101000000000000",
+        ))
+    return out
+
+
+def write(db: sqlite3.Connection, batch: List[tuple]) -> None:
+    db.executemany("INSERT INTO responder VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+    db.commit()
+
+
+def main(argv: List[str]) -> None:
+    sizes = [int(a) for a in argv] or list(DEFAULT_SIZES)
+
+    print(f"  {'rows in db':>10}  {'idle tick us':>12}  {f'+{BURST} rows ms':>12}")
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "Responder.db")
+            responder = sqlite3.connect(path)
+            responder.execute(RESPONDER_SCHEMA)
+            write(responder, rows(0, n))
+
+            store = SessionStore(
+                path=os.path.join(tmp, "s.bin"),
+                journal_path=os.path.join(tmp, "s.journal"),
+                legacy_path=os.path.join(tmp, "s.json"),
+                archive_path=os.path.join(tmp, "a.gz"),
+                watch=False,
+            )
+            # Existing rows belong to an earlier run and are skipped
+            reader = ResponderDBReader(path, store=store)
+            assert reader.poll() == 0 and len(store.snapshot()) == 0
+
+            t0 = time.perf_counter()
+            for _ in range(REPEAT):
+                reader.poll()
+            idle = (time.perf_counter() - t0) / REPEAT * 1e6
+
+            burst = 0.0
+            for r in range(REPEAT):
+                write(responder, rows(n + r * BURST, BURST))
+                t0 = time.perf_counter()
+                got = reader.poll()
+                burst += time.perf_counter() - t0
+                assert got == BURST, got
+            burst = burst / REPEAT * 1000.0
+
+            sessions = store.snapshot()
+            assert len(sessions) == REPEAT * BURST
+            s = sessions[0]
+            assert (s.username, s.domain, s.source_ip, s.hash_type) == (
+                f"user{n}", "CORP", f"10.0.{n // 250 % 250}.{n % 250 + 1}", "NetNTLMv2"
+            ), s
+
+            print(f"  {n:>10}  {idle:>12.1f}  {burst:>12.3f}")
+
+            reader.close()
+            responder.close()
+            store.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,84 @@
+# bench_responder_parser.py
+#
+# Replays recorded Responder output through the line parser and reports
+# lines/sec, against the chain of inline re.search calls and substring
+# checks _monitor_output used before responder_parser.py.
+#
+# Usage (from the directory containing ghostrelay/):
+#   python3 -m ghostrelay.benchmarks.bench_responder_parser [LOG] [LINES]
+#
+# LOG defaults to ghostrelay/ghostrelay.log; it is replayed repeatedly until
+# LINES lines (default 1,000,000) have been fed.
+
+from __future__ import annotations
+import os
+import re
+import sys
+import time
+from itertools import cycle, islice
+from typing import Callable, List
+
+from ghostrelay.responder_parser import ResponderOutputParser
+
+DEFAULT_LOG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ghostrelay.log")
+DEFAULT_LINES = 1_000_000
+
+
+def legacy(lines: List[str]) -> int:
+    # The loop body _monitor_output used to run, minus the logging
+    captures = 0
+    user = None
+    for clean in lines:
+        m_ip = re.search(r"sent to ([0-9]+\.[0-9]+\.[0-9]+\.[0-9]+)", clean)
+        if m_ip:
+            m_ip.group(1)
+        m_service = re.search(r"service:\s*([A-Za-z0-9_\-]+)", clean)
+        if m_service:
+            m_service.group(1)
+        if (
+            "NTLMv2-SSP Username" in clean
+            or "NTLMv2 Username" in clean
+            or "NTLMv1 Username" in clean
+            or "HTTP Basic Authentication" in clean
+        ):
+            user = clean.split(":", 1)[1].strip()
+            continue
+        if "NTLMv2-SSP Hash" in clean or "Hash" in clean or "Basic Authentication" in clean:
+            if not user:
+                continue
+            clean.split(":", 1)[1].strip()
+            captures += 1
+            user = None
+    return captures
+
+
+def current(lines: List[str]) -> int:
+    parser = ResponderOutputParser()
+    feed = parser.feed
+    return sum(1 for line in lines if feed(line) is not None)
+
+
+def run(name: str, fn: Callable[[List[str]], int], lines: List[str]) -> None:
+    t0 = time.perf_counter()
+    captures = fn(lines)
+    elapsed = time.perf_counter() - t0
+    print(f"  {name:<8} {len(lines) / elapsed:>12,.0f} lines/s  {captures:>7} captures")
+
+
+def main(argv: List[str]) -> None:
+    path = argv[0] if argv else DEFAULT_LOG
+    total = int(argv[1]) if len(argv) > 1 else DEFAULT_LINES
+
+    with open(path, "r", errors="ignore") as f:
+        recorded = f.read().splitlines()
+    if not recorded:
+        sys.exit(f"{path} is empty")
+
+    lines = list(islice(cycle(recorded), total))
+    print(f"{path}: {len(recorded)} recorded lines, replaying {len(lines):,}")
+    run("before", legacy, lines)
+    run("after", current, lines)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,96 @@
+# bench_responder_pipe.py
+#
+# CPU spent by the monitor thread to consume Responder output from a pipe.
+#
+#   before : text-mode pipe (bufsize=1) iterated line by line, ANSI regex,
+#            line-buffered log write and parser call per line
+#   after  : os.read() chunks via log_tail.iter_output_blocks(), one log
+#            write, decode and ring append per chunk (what _monitor_output
+#            does now)
+#
+# A child process replays ghostrelay.log into the pipe as fast as it can,
+# so this is Responder's worst case. CPU time is the reading thread's own.
+#
+# Usage (from the directory containing ghostrelay/):
+#   python3 -m ghostrelay.benchmarks.bench_responder_pipe [LINES]
+
+from __future__ import annotations
+import io
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import Callable, List, Tuple
+
+from ghostrelay.log_tail import LineRing, iter_output_blocks
+from ghostrelay.responder_parser import ResponderOutputParser
+
+DEFAULT_LINES = 1_000_000
+LOG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ghostrelay.log")
+
+# Child: write LOG's lines (with a colour code, as Responder does) N times over
+WRITER = r"""
+import sys
+from itertools import cycle, islice
+lines = [b"\x1b[1;32m" + l + b"\x1b[0m\n" for l in open(sys.argv[1], "rb").read().splitlines()]
+out = sys.stdout.buffer
+total = int(sys.argv[2])
+batch = 4096
+for i in range(0, total, batch):
+    out.write(b"".join(islice(cycle(lines), min(batch, total - i))))
+"""
+
+
+def before(proc: subprocess.Popen, log: io.IOBase) -> int:
+    ansi_re = re.compile(r"\x1B\[[0-9;]*[A-Za-z]")
+    parser = ResponderOutputParser()
+    ring = LineRing()
+    n = 0
+    for raw_line in io.TextIOWrapper(proc.stdout, line_buffering=True):
+        clean = ansi_re.sub("", raw_line.rstrip("\n"))
+        log.write((clean + "\n").encode())
+        ring.append(clean)
+        parser.feed(clean)
+        n += 1
+    return n
+
+
+def after(proc: subprocess.Popen, log: io.IOBase) -> int:
+    parser = ResponderOutputParser()
+    ring = LineRing()
+    n = 0
+    for block in iter_output_blocks(proc.stdout.fileno()):
+        log.write(block)
+        lines = block.decode(errors="replace").split("\n")
+        lines.pop()
+        ring.extend(lines)
+        for line in lines:
+            parser.feed(line)
+        n += len(lines)
+    return n
+
+
+def measure(fn: Callable[[subprocess.Popen, io.IOBase], int], total: int) -> Tuple[int, float, float]:
+    proc = subprocess.Popen(
+        [sys.executable, "-c", WRITER, LOG, str(total)], stdout=subprocess.PIPE, bufsize=0
+    )
+    with open(os.devnull, "wb", buffering=0) as log:
+        wall0, cpu0 = time.perf_counter(), time.thread_time()
+        n = fn(proc, log)
+        cpu = time.thread_time() - cpu0
+        wall = time.perf_counter() - wall0
+    proc.wait()
+    return n, cpu, wall
+
+
+def main(argv: List[str]) -> None:
+    total = int(argv[0]) if argv else DEFAULT_LINES
+    print(f"{'':<8} {'lines':>10}  {'cpu s':>7}  {'wall s':>7}  {'lines/cpu-s':>12}")
+    for name, fn in (("before", before), ("after", after)):
+        n, cpu, wall = measure(fn, total)
+        print(f"{name:<8} {n:>10,}  {cpu:>7.2f}  {wall:>7.2f}  {n / cpu:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,157 @@
+# bench_session_memory.py
+#
+# Bytes per session held in memory.
+#
+# objects   Like for like, raw_data in memory on both sides, so only the
+#           representation differs:
+#             before  plain @dataclass (per-instance __dict__), every string
+#                     a fresh object as json.load produces them
+#             after   slotted NTLMSession with interned strings
+#
+# store     A SessionStore loaded from a snapshot of N sessions, everything
+#           it keeps per session included: the session objects, the search
+#           indexes, dedup, LRU, snapshot payload references and the change
+#           log (payloads stay in the snapshot either way). Loaded with
+#           string interning turned off, then on.
+#
+# Usage (from the directory containing ghostrelay/):
+#   python3 -m ghostrelay.benchmarks.bench_session_memory [N ...]
+
+from __future__ import annotations
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from ghostrelay import sessions
+from ghostrelay.session_snapshot import write_snapshot
+from ghostrelay.sessions import NTLMSession, SessionStore, _session_meta
+
+DEFAULT_SIZES = (10_000, 100_000)
+
+# Roughly what a Responder capture looks like: a few dozen hosts, a couple
+# of domains, a few hundred users, ~750-byte NetNTLMv2 lines.
+HOSTS = 40
+USERS = 300
+DOMAINS = ("CORP", "LAB")
+RAW_LEN = 750
+
+
+@dataclass
+class LegacySession:
+    id: int
+    created_at: float
+    source_ip: str
+    dest_ip: str
+    direction: str
+    raw_data: bytes
+    note: str = ""
+
+    message_type: Optional[int] = None
+    message_type_name: Optional[str] = None
+    username: Optional[str] = None
+    domain: Optional[str] = None
+    workstation: Optional[str] = None
+    hash_type: Optional[str] = None
+
+
+def _fields(i: int):
+    # "".join() so every call yields new string objects, like a JSON decode
+    user = "".join(["user", str(i % USERS)])
+    domain = "".join([DOMAINS[i % len(DOMAINS)]])
+    return dict(
+        source_ip="".join(["10.0.0.", str(i % HOSTS)]),
+        dest_ip="".join(["File", "Server"]),
+        direction="".join(["capture"]),
+        note="".join(["Credential (", user, ")"]),
+        username=user,
+        domain=domain,
+        hash_type="".join(["NetNTLMv2"]),
+    )
+
+
+def make_before(i: int):
+    return LegacySession(
+        id=i, created_at=1.7e9 + i, raw_data=bytes(RAW_LEN), **_fields(i)
+    )
+
+
+def make_after(i: int):
+    return NTLMSession(id=i, created_at=1.7e9 + i, raw_data=bytes(RAW_LEN), **_fields(i))
+
+
+def measure(factory: Callable[[int], object], n: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+
+    rows: List[object] = [factory(i) for i in range(n)]
+
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    del rows
+    gc.collect()
+    return used / n
+
+
+def write_store(d: str, n: int) -> str:
+    path = os.path.join(d, "sessions.bin")
+    records = []
+    for i in range(1, n + 1):
+        sess = NTLMSession(id=i, created_at=1.7e9 + i, raw_data=None, raw_size=RAW_LEN, **_fields(i))
+        records.append((i, sess.created_at, _session_meta(sess), lambda: [bytes(RAW_LEN)]))
+    write_snapshot(path, records)
+    return path
+
+
+def measure_store(d: str, n: int, intern: bool) -> float:
+    saved = sessions._INTERNED_FIELDS
+    if not intern:
+        sessions._INTERNED_FIELDS = ()
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    try:
+        store = SessionStore(
+            path=os.path.join(d, "sessions.bin"),
+            journal_path=os.path.join(d, "sessions.journal"),
+            legacy_path=os.path.join(d, "sessions.json"),
+            archive_path=os.path.join(d, "sessions.archive.gz"),
+            watch=False,
+        )
+        assert store.count() == n
+        used = tracemalloc.get_traced_memory()[0] - base
+    finally:
+        tracemalloc.stop()
+        sessions._INTERNED_FIELDS = saved
+    store.close()
+    del store
+    gc.collect()
+    return used / n
+
+
+def main(argv: List[str]) -> None:
+    sizes = [int(a) for a in argv] or list(DEFAULT_SIZES)
+
+    print("objects, raw_data in memory")
+    print(f"  {'sessions':>10}  {'before B/sess':>14}  {'after B/sess':>13}  {'ratio':>6}")
+    for n in sizes:
+        before = measure(make_before, n)
+        after = measure(make_after, n)
+        print(f"  {n:>10}  {before:>14.0f}  {after:>13.0f}  {before / after:>5.1f}x")
+
+    print("\nloaded SessionStore")
+    print(f"  {'sessions':>10}  {'not interned B/sess':>20}  {'interned B/sess':>16}  {'ratio':>6}")
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as d:
+            write_store(d, n)
+            before = measure_store(d, n, intern=False)
+            after = measure_store(d, n, intern=True)
+        print(f"  {n:>10}  {before:>20.0f}  {after:>16.0f}  {before / after:>5.1f}x")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
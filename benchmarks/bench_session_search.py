@@ -0,0 +1,100 @@
+# bench_session_search.py
+#
+# Latency of SessionStore.search() over a populated store, against a plain
+# scan of the snapshot (what filtering cost before the indexes).
+#
+# Usage (from the directory containing ghostrelay/):
+#   python3 -m ghostrelay.benchmarks.bench_session_search [N ...]
+
+from __future__ import annotations
+import ipaddress
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, List
+
+from ghostrelay.sessions import SessionStore
+
+DEFAULT_SIZES = (10_000, 100_000)
+REPEAT = 50
+
+HOSTS = 4000
+USERS = 3000
+DOMAINS = ("CORP", "LAB", "DEV", "PROD")
+
+QUERIES = {
+    "facet domain=LAB": dict(domain="LAB"),
+    "prefix user1*": dict(username_prefix="user1"),
+    "cidr 10.0.3.0/24": dict(cidr="10.0.3.0/24"),
+    "user + domain": dict(username="user42", domain="DEV"),
+    "last 1% by time": None,   # filled in once the store is built
+}
+
+
+def build(n: int, tmp: str) -> SessionStore:
+    store = SessionStore(
+        path=os.path.join(tmp, "s.bin"),
+        journal_path=os.path.join(tmp, "s.journal"),
+        legacy_path=os.path.join(tmp, "s.json"),
+        archive_path=os.path.join(tmp, "a.gz"),
+        dedup=False,
+        watch=False,
+    )
+    for i in range(n):
+        line = f"user{i % USERS}::{DOMAINS[i % len(DOMAINS)]}:1122334455667788:{i:032x}:0101"
+        ip = str(ipaddress.IPv4Address(0x0A000000 + i % HOSTS))
+        store.add_session(ip, "FileServer", "capture", line.encode())
+    return store
+
+
+def scan(store: SessionStore, query: dict) -> List:
+    # Reference: the linear filter the store used to do
+    net = ipaddress.ip_network(query["cidr"]) if "cidr" in query else None
+    out = []
+    for s in store.snapshot():
+        if "domain" in query and (s.domain or "").lower() != query["domain"].lower():
+            continue
+        if "username" in query and (s.username or "").lower() != query["username"].lower():
+            continue
+        if "username_prefix" in query and not (s.username or "").lower().startswith(query["username_prefix"]):
+            continue
+        if net is not None and ipaddress.ip_address(s.source_ip) not in net:
+            continue
+        if "since" in query and s.created_at < query["since"]:
+            continue
+        out.append(s)
+    return out
+
+
+def timed(fn: Callable[[], List]) -> float:
+    t0 = time.perf_counter()
+    for _ in range(REPEAT):
+        fn()
+    return (time.perf_counter() - t0) / REPEAT * 1000.0
+
+
+def main(argv: List[str]) -> None:
+    sizes = [int(a) for a in argv] or list(DEFAULT_SIZES)
+
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = build(n, tmp)
+            rows = store.snapshot()
+            queries = dict(QUERIES)
+            queries["last 1% by time"] = dict(since=rows[n - n // 100].created_at)
+
+            print(f"\n{n} sessions")
+            print(f"  {'query':<20} {'hits':>7}  {'search ms':>10}  {'scan ms':>9}")
+            for name, q in queries.items():
+                hits = store.search(**q)
+                assert len(hits) == len(scan(store, q)), name
+                fast = timed(lambda: store.search(**q))
+                slow = timed(lambda: scan(store, q))
+                print(f"  {name:<20} {len(hits):>7}  {fast:>10.3f}  {slow:>9.3f}")
+
+            store.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
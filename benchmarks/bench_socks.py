@@ -0,0 +1,186 @@
+# bench_socks.py
+#
+# The threaded SOCKS server (GhostRelaySocksServer) against the asyncio
+# engine (AsyncSocksServer) with N concurrent tunnels open at once.
+#
+# The proxy and an echo server each run in their own process; this process
+# opens N tunnels through the proxy (SOCKS5 handshake + CONNECT to the echo
+# server), keeps them all open, then runs ROUNDS rounds in which every
+# tunnel sends MSG bytes and waits for the echo. Reported per engine:
+#
+#   setup s      time to get all N tunnels connected
+#   round ms     wall time of one round over all N tunnels
+#   p99 ms       99th percentile round trip of a single message
+#   cpu s        proxy CPU time (user + sys) over the rounds
+#   rss MB       proxy resident memory with N tunnels open
+#   threads      proxy threads with N tunnels open
+#
+# The proxy needs two descriptors per tunnel, so N is capped by
+# RLIMIT_NOFILE.
+#
+# Usage (from the directory containing ghostrelay/):
+#   python3 -m ghostrelay.benchmarks.bench_socks [N ...]
+
+from __future__ import annotations
+import asyncio
+import os
+import resource
+import socket
+import struct
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+DEFAULT_SIZES = (1000, 10000)
+ENGINES = ("threads", "asyncio")
+ROUNDS = 5
+MSG = 512
+CONNECT_CONCURRENCY = 100
+
+PKG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Child processes; ghostrelay.py's modules import each other bare
+PROXY = r"""
+import logging, resource, sys
+sys.path[:0] = [sys.argv[1], sys.argv[2]]
+soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+from config import CONFIG
+CONFIG.log_ntlm = False
+from socks_proxy import GhostRelaySocksServer
+from socks_async import AsyncSocksServer
+engine, port = sys.argv[3], int(sys.argv[4])
+log = logging.getLogger("bench")
+if engine == "asyncio":
+    srv = AsyncSocksServer("127.0.0.1", port, log, max_connections=1 << 20, idle_timeout=0)
+else:
+    srv = GhostRelaySocksServer("127.0.0.1", port, log)
+srv.start()
+"""
+
+ECHO = r"""
+import asyncio, resource, sys
+soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+class Echo(asyncio.Protocol):
+    def connection_made(self, t): self.t = t
+    def data_received(self, d): self.t.write(d)
+async def main():
+    srv = await asyncio.get_running_loop().create_server(Echo, "127.0.0.1", int(sys.argv[1]), backlog=4096)
+    await srv.serve_forever()
+asyncio.run(main())
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_listening(port: int) -> None:
+    for _ in range(200):
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"nothing listening on {port}")
+
+
+def proc_status(pid: int) -> Dict[str, str]:
+    out = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            k, _, v = line.partition(":")
+            out[k] = v.strip()
+    return out
+
+
+def proc_cpu(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def open_tunnel(proxy_port: int, echo_port: int, sem: asyncio.Semaphore):
+    async with sem:
+        reader, writer = await asyncio.open_connection("127.0.0.1", proxy_port)
+        writer.write(b"\x05\x01\x00")
+        assert await reader.readexactly(2) == b"\x05\x00"
+        writer.write(b"\x05\x01\x00\x01" + socket.inet_aton("127.0.0.1") + struct.pack("!H", echo_port))
+        reply = await reader.readexactly(10)
+        assert reply[1] == 0, reply
+        return reader, writer
+
+
+async def round_trip(reader, writer, payload: bytes) -> float:
+    t0 = time.perf_counter()
+    writer.write(payload)
+    await reader.readexactly(len(payload))
+    return time.perf_counter() - t0
+
+
+async def run(engine: str, n: int) -> Tuple[float, float, float, float, float, int]:
+    proxy_port, echo_port = free_port(), free_port()
+    echo = subprocess.Popen([sys.executable, "-c", ECHO, str(echo_port)])
+    proxy = subprocess.Popen([
+        sys.executable, "-c", PROXY, os.path.dirname(PKG_DIR), PKG_DIR, engine, str(proxy_port)
+    ])
+    try:
+        wait_listening(echo_port)
+        wait_listening(proxy_port)
+
+        sem = asyncio.Semaphore(CONNECT_CONCURRENCY)
+        t0 = time.perf_counter()
+        tunnels = await asyncio.gather(*(open_tunnel(proxy_port, echo_port, sem) for _ in range(n)))
+        setup = time.perf_counter() - t0
+
+        payload = os.urandom(MSG)
+        cpu0 = proc_cpu(proxy.pid)
+        rounds: List[float] = []
+        latencies: List[float] = []
+        for _ in range(ROUNDS):
+            t0 = time.perf_counter()
+            latencies += await asyncio.gather(*(round_trip(r, w, payload) for r, w in tunnels))
+            rounds.append(time.perf_counter() - t0)
+        cpu = proc_cpu(proxy.pid) - cpu0
+
+        st = proc_status(proxy.pid)
+        rss = int(st["VmRSS"].split()[0]) / 1024.0
+        threads = int(st["Threads"])
+
+        for _, w in tunnels:
+            w.close()
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99)]
+        return setup, sum(rounds) / len(rounds) * 1000, p99 * 1000, cpu, rss, threads
+    finally:
+        proxy.kill()
+        echo.kill()
+        proxy.wait()
+        echo.wait()
+
+
+def main(argv: List[str]) -> None:
+    sizes = [int(a) for a in argv] or list(DEFAULT_SIZES)
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    cap = (hard - 64) // 2
+
+    print(f"  {'engine':<8} {'tunnels':>8} {'setup s':>8} {'round ms':>9} {'p99 ms':>8} "
+          f"{'cpu s':>7} {'rss MB':>7} {'threads':>8}")
+    for n in sizes:
+        if n > cap:
+            print(f"  ({n} tunnels need {2 * n} descriptors; capped at {cap} by RLIMIT_NOFILE)")
+            n = cap
+        for engine in ENGINES:
+            setup, rnd, p99, cpu, rss, threads = asyncio.run(run(engine, n))
+            print(f"  {engine:<8} {n:>8} {setup:>8.2f} {rnd:>9.1f} {p99:>8.1f} "
+                  f"{cpu:>7.2f} {rss:>7.1f} {threads:>8}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
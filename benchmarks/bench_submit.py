@@ -0,0 +1,107 @@
+# bench_submit.py
+#
+# What storing a capture costs the thread that found it: SessionStore
+# add_session() (parse + lock + journal queue, inline) against submit()
+# (append to the ingest deque; the ingest thread does the rest).
+#
+# THREADS threads, standing in for SOCKS relays, each hand over N binary
+# NTLMSSP AUTHENTICATE messages from distinct users (no dedup hits) while
+# timing every call. Reported per mode:
+#
+#   call p50/p99/max us   latency of one add_session() / submit() call
+#   caller s              wall time until every thread has handed over
+#   stored s              wall time until everything is in the store
+#   dropped               captures submit() turned away (ingest queue full)
+#
+# submit() runs once with an ingest queue that holds the whole burst and
+# once with one a tenth of that, to show overflow being counted instead of
+# blocking the callers.
+#
+# Usage (from the directory containing ghostrelay/):
+#   python3 -m ghostrelay.benchmarks.bench_submit [N]
+
+from __future__ import annotations
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import List, Tuple
+
+from ghostrelay.benchmarks.bench_ntlmssp import authenticate
+from ghostrelay.sessions import SessionStore
+
+DEFAULT_N = 5000
+THREADS = 8
+
+
+def open_store(d: str, ingest_queue_max: int) -> SessionStore:
+    return SessionStore(
+        path=os.path.join(d, "s.bin"),
+        journal_path=os.path.join(d, "s.journal"),
+        legacy_path=os.path.join(d, "s.json"),
+        archive_path=os.path.join(d, "a.gz"),
+        watch=False,
+        ingest_queue_max=ingest_queue_max,
+    )
+
+
+def run(mode: str, n: int, ingest_queue_max: int) -> Tuple[List[float], float, float, int, int]:
+    msgs = [[authenticate(f"user{t}_{i}") for i in range(n)] for t in range(THREADS)]
+    with tempfile.TemporaryDirectory() as d:
+        store = open_store(d, ingest_queue_max)
+        call = store.submit if mode == "submit" else store.add_session
+        latencies: List[List[float]] = [[] for _ in range(THREADS)]
+        start = threading.Barrier(THREADS + 1)
+
+        def relay(t: int) -> None:
+            lat = latencies[t]
+            clock = time.perf_counter
+            start.wait()
+            for msg in msgs[t]:
+                t0 = clock()
+                call("10.0.0.%d" % (t + 1), "10.0.1.1", "client->server", msg)
+                lat.append(clock() - t0)
+
+        threads = [threading.Thread(target=relay, args=(t,)) for t in range(THREADS)]
+        for th in threads:
+            th.start()
+        start.wait()
+        t0 = time.perf_counter()
+        for th in threads:
+            th.join()
+        caller = time.perf_counter() - t0
+        store.flush()
+        stored = time.perf_counter() - t0
+
+        count = store.count()
+        dropped = store.persistence_stats().get("ingest_dropped", 0)
+        store.close()
+
+    flat = sorted(x for lat in latencies for x in lat)
+    return flat, caller, stored, count, dropped
+
+
+def pct(xs: List[float], p: float) -> float:
+    return xs[min(len(xs) - 1, int(len(xs) * p))] * 1e6
+
+
+def main(argv: List[str]) -> None:
+    n = int(argv[0]) if argv else DEFAULT_N
+    total = n * THREADS
+    print(f"{THREADS} threads x {n} captures\n")
+    print(f"  {'mode':<22} {'p50 us':>8} {'p99 us':>8} {'max us':>9} {'caller s':>9} "
+          f"{'stored s':>9} {'stored':>8} {'dropped':>8}")
+    for name, mode, qmax in (
+        ("add_session", "add_session", total),
+        (f"submit (queue {total})", "submit", total),
+        (f"submit (queue {total // 10})", "submit", total // 10),
+    ):
+        lat, caller, stored, count, dropped = run(mode, n, qmax)
+        assert count + dropped == total, (count, dropped, total)
+        print(f"  {name:<22} {pct(lat, .5):>8.1f} {pct(lat, .99):>8.1f} {lat[-1] * 1e6:>9.0f} "
+              f"{caller:>9.2f} {stored:>9.2f} {count:>8} {dropped:>8}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
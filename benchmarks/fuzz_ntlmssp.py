@@ -0,0 +1,163 @@
+# fuzz_ntlmssp.py
+#
+# Mutation fuzzing of ntlmssp.parse(), ntlmssp.message_length() and the
+# proxy-side dissector, from the well-formed messages in bench_ntlmssp.
+#
+# Each round mutates a message (bit flips, byte overwrites, truncation,
+# extension, random security buffer fields) and checks that:
+#
+#   - parse() either returns or raises NTLMSSPError, nothing else;
+#   - every field of a parsed message lies inside the message, and its
+#     strings decode;
+#   - message_length() never claims more than MAX_MESSAGE, and for a
+#     message that parses it covers every security buffer;
+#   - FlowDissector fed the mutant in random pieces never raises.
+#
+# Also checks the unmutated messages field by field. Exits non-zero on the
+# first failure, printing the input.
+#
+# Usage (from the directory containing ghostrelay/):
+#   python3 -m ghostrelay.benchmarks.fuzz_ntlmssp [ROUNDS] [SEED]
+
+from __future__ import annotations
+import base64
+import random
+import struct
+import sys
+from typing import List
+
+from ghostrelay import ntlmssp
+from ghostrelay.benchmarks import bench_ntlmssp as build
+from ghostrelay.benchmarks.bench_socks import PKG_DIR
+
+# The proxy-side modules import each other bare
+sys.path.append(PKG_DIR)
+from ntlm_dissector import FlowDissector  # noqa: E402
+
+DEFAULT_ROUNDS = 200000
+
+
+def _discard(src: str, dst: str, direction: str, msg: bytes) -> None:
+    pass
+
+
+def check_known() -> None:
+    neg = ntlmssp.parse(build.negotiate(b"CORP", b"WS01"))
+    assert isinstance(neg, ntlmssp.Negotiate)
+    assert (neg.domain, neg.workstation, neg.version) == ("CORP", "WS01", (10, 0, 19041, 15))
+
+    chal = ntlmssp.parse(build.challenge("CORP", "FS01"))
+    assert isinstance(chal, ntlmssp.Challenge) and chal.target_name == "CORP"
+    assert chal.av_text(ntlmssp.MSV_AV_NB_COMPUTER_NAME) == "FS01"
+    assert len(chal.server_challenge) == 8
+
+    nt = build.ntlmv2_response("CORP", "FS01")
+    auth = ntlmssp.parse(build.authenticate("alice", "CORP", "WS01", nt_response=nt))
+    assert isinstance(auth, ntlmssp.Authenticate)
+    assert (auth.user, auth.domain, auth.workstation) == ("alice", "CORP", "WS01")
+    assert auth.hash_type == "NetNTLMv2" and auth.mic is not None and auth.version is not None
+    assert bytes(auth.nt_response) == nt
+    v2 = auth.ntlmv2
+    assert (v2.resp_type, v2.hi_resp_type) == (1, 1)
+    assert bytes(v2.nt_proof_str) == nt[:16] and bytes(v2.client_challenge) == nt[32:40]
+    assert str(v2.av_pairs[ntlmssp.MSV_AV_TARGET_NAME], "utf-16-le") == "cifs/FS01"
+
+    v1 = ntlmssp.parse(build.authenticate("bob", nt_response=bytes(24), mic=False))
+    assert v1.hash_type == "NetNTLMv1" and v1.ntlmv2 is None and v1.mic is None
+
+    for blob in build.samples().values():
+        assert ntlmssp.message_length(blob) == len(blob)
+        assert ntlmssp.message_length(blob[:11]) is None
+
+
+def mutate(rng: random.Random, blob: bytes) -> bytes:
+    b = bytearray(blob)
+    for _ in range(rng.randint(1, 4)):
+        op = rng.randrange(6)
+        if op == 0 and b:
+            i = rng.randrange(len(b))
+            b[i] ^= 1 << rng.randrange(8)
+        elif op == 1 and b:
+            b[rng.randrange(len(b))] = rng.randrange(256)
+        elif op == 2:
+            del b[rng.randrange(len(b) + 1):]
+        elif op == 3:
+            b += bytes(rng.randrange(256) for _ in range(rng.randint(1, 64)))
+        elif op == 4 and len(b) >= 64:
+            # A security buffer pointing somewhere interesting
+            at = rng.choice((12, 16, 20, 24, 28, 36, 40, 44, 52))
+            length = rng.choice((0, 1, 2, 0xFFFF, rng.randrange(len(b) + 8)))
+            offset = rng.choice((0, at, len(b), len(b) - 1, 0xFFFFFFFF, rng.randrange(len(b) + 8)))
+            b[at:at + 8] = struct.pack("<HHI", length, length, offset & 0xFFFFFFFF)
+        elif op == 5 and len(b) >= 12:
+            b[8:12] = struct.pack("<I", rng.choice((0, 1, 2, 3, 4, 0xFFFFFFFF)))
+    return bytes(b)
+
+
+# Security buffer headers of each message type
+_SECBUFS = {ntlmssp.NEGOTIATE: (16, 24), ntlmssp.CHALLENGE: (12, 40),
+            ntlmssp.AUTHENTICATE: (12, 20, 28, 36, 44, 52)}
+
+
+def check(blob: bytes, rng: random.Random) -> None:
+    try:
+        msg = ntlmssp.parse(blob)
+    except ntlmssp.NTLMSSPError:
+        msg = None
+
+    n = ntlmssp.message_length(blob)
+    assert n is None or n == -1 or 0 < n <= ntlmssp.MAX_MESSAGE, n
+
+    if msg is not None:
+        ends = []
+        for at in _SECBUFS[msg.message_type]:
+            length, _, offset = struct.unpack_from("<HHI", blob, at)
+            if length:
+                ends.append(offset + length)
+        # Everything parse() accepted lies inside the message, and
+        # message_length() covers all of it
+        assert all(end <= len(blob) for end in ends), ends
+        assert n is not None and n >= max(ends, default=0), (n, ends)
+        assert msg.view.obj is not None
+        for name in ("domain", "workstation", "user", "target_name", "hash_type", "message_type_name"):
+            getattr(msg, name, None)
+        if isinstance(msg, ntlmssp.Authenticate) and msg.ntlmv2 is not None:
+            assert len(msg.ntlmv2.client_challenge) == 8
+            msg.ntlmv2.unix_time
+
+    dissector = FlowDissector("a", "b", sink=_discard)
+    if rng.random() < 0.5:
+        data = rng.choice((b"", b"\xfeSMB")) + blob
+    else:
+        data = b"Authorization: NTLM " + base64.b64encode(blob) + b"\r\n"
+    pos = 0
+    while pos < len(data) and dissector.active:
+        k = rng.randint(1, 64)
+        dissector.feed("client->server", data[pos:pos + k])
+        pos += k
+
+
+def main(argv: List[str]) -> None:
+    rounds = int(argv[0]) if argv else DEFAULT_ROUNDS
+    seed = int(argv[1]) if len(argv) > 1 else random.randrange(1 << 32)
+    rng = random.Random(seed)
+
+    check_known()
+    seeds = list(build.samples().values()) + [
+        build.negotiate(b"CORP", b"WS01"),
+        build.authenticate("bob", nt_response=bytes(24), mic=False),
+    ]
+    parsed = 0
+    for i in range(rounds):
+        blob = mutate(rng, rng.choice(seeds))
+        try:
+            check(blob, rng)
+        except Exception:
+            print(f"seed {seed} round {i}: {blob.hex()}")
+            raise
+        parsed += 1
+    print(f"seed {seed}: {parsed} mutants, no failures")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
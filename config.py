@@ -10,6 +10,36 @@ class ResponderConfig:
     db_path: str = "/usr/share/responder/Responder.db"
     multirelay_path: str = "/usr/share/responder/tools/MultiRelay.py"
 
+    # Interfaces to capture on, one Responder each; empty = the interface
+    # of the default route
+    interfaces: list[str] = field(default_factory=list)
+
+    # Where captures are read from: "stdout" (parse Responder's console
+    # output) or "db" (poll db_path for new rows)
+    ingest: str = "stdout"
+
+
+RETENTION_POLICIES = ("lru", "oldest")
+
+
+@dataclass
+class RetentionConfig:
+    # 0 disables a limit
+    max_sessions: int = 0
+    max_age: float = 0.0          # seconds
+    max_raw_bytes: int = 0
+
+    # "lru" evicts the least recently seen session first and ages sessions
+    # by last_seen; "oldest" evicts and ages by first seen (created_at).
+    policy: str = "lru"
+
+    # Evicted sessions are appended here (gzip); None = next to sessions.py
+    archive_path: str | None = None
+
+    def __post_init__(self) -> None:
+        if self.policy not in RETENTION_POLICIES:
+            raise ValueError(f"Unknown retention policy: {self.policy}")
+
 
 @dataclass
 class GhostRelayConfig:
@@ -18,8 +48,30 @@ class GhostRelayConfig:
     log_ntlm: bool = True
     log_file: str | None = "ghostrelay.log"
 
+    # SOCKS server engine: "threads" (a thread per client) or "asyncio"
+    # (one event loop for every tunnel)
+    socks_engine: str = "threads"
+    socks_connect_timeout: float = 10.0
+    # asyncio engine only. Clients past the cap are refused; a tunnel with
+    # no traffic either way for socks_idle_timeout seconds is closed (0 =
+    # never); stopping waits up to socks_drain_timeout for open tunnels.
+    socks_max_connections: int = 10000
+    socks_idle_timeout: float = 300.0
+    socks_drain_timeout: float = 10.0
+
+    # Session persistence: "json" (snapshot + journal, fully in memory) or
+    # "sqlite" (indexed database, queried on demand).
+    session_backend: str = "json"
+    session_db_path: str | None = None   # None = sessions.db next to sessions.py
+
+    # Fold repeat captures of the same user/domain/client/hash type into one
+    # session with a hit counter and up to dedup_max_samples distinct hashes.
+    dedup_sessions: bool = True
+    dedup_max_samples: int = 8
+
     # Python 3.13 requires default_factory for nested dataclasses
     responder: ResponderConfig = field(default_factory=ResponderConfig)
+    retention: RetentionConfig = field(default_factory=RetentionConfig)
 
 
 CONFIG = GhostRelayConfig()
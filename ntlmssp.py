@@ -0,0 +1,357 @@
+# ntlmssp.py
+#
+# Parser for binary NTLMSSP messages (MS-NLMP 2.2.1): NEGOTIATE, CHALLENGE
+# and AUTHENTICATE, with their security buffers, flags, version, AV pairs
+# and the NTLMv2 response.
+#
+# The fixed header is read with struct.unpack_from() and every security
+# buffer is bounds-checked against the message. Payload fields are
+# memoryview slices of the caller's buffer: nothing is copied until a string
+# property is read (and decoded).
+#
+#   msg = parse(blob)
+#   if msg.message_type == AUTHENTICATE:
+#       msg.user, msg.domain, msg.hash_type, msg.ntlmv2.client_challenge
+#
+# Anything that is not a well-formed message raises NTLMSSPError.
+
+from __future__ import annotations
+import struct
+from typing import Dict, Optional, Tuple, Union
+
+NTLM_MAGIC = b"NTLMSSP\x00"
+
+NEGOTIATE, CHALLENGE, AUTHENTICATE = 1, 2, 3
+MESSAGE_TYPE_NAMES = {NEGOTIATE: "NEGOTIATE", CHALLENGE: "CHALLENGE", AUTHENTICATE: "AUTHENTICATE"}
+
+# Negotiate flags (MS-NLMP 2.2.2.5)
+NEGOTIATE_UNICODE = 0x00000001
+NEGOTIATE_OEM = 0x00000002
+REQUEST_TARGET = 0x00000004
+NEGOTIATE_SIGN = 0x00000010
+NEGOTIATE_SEAL = 0x00000020
+NEGOTIATE_LM_KEY = 0x00000080
+NEGOTIATE_NTLM = 0x00000200
+NEGOTIATE_ANONYMOUS = 0x00000800
+NEGOTIATE_OEM_DOMAIN_SUPPLIED = 0x00001000
+NEGOTIATE_OEM_WORKSTATION_SUPPLIED = 0x00002000
+NEGOTIATE_ALWAYS_SIGN = 0x00008000
+TARGET_TYPE_DOMAIN = 0x00010000
+TARGET_TYPE_SERVER = 0x00020000
+NEGOTIATE_EXTENDED_SESSIONSECURITY = 0x00080000
+NEGOTIATE_IDENTIFY = 0x00100000
+REQUEST_NON_NT_SESSION_KEY = 0x00400000
+NEGOTIATE_TARGET_INFO = 0x00800000
+NEGOTIATE_VERSION = 0x02000000
+NEGOTIATE_128 = 0x20000000
+NEGOTIATE_KEY_EXCH = 0x40000000
+NEGOTIATE_56 = 0x80000000
+
+# AV pair ids (MS-NLMP 2.2.2.1)
+MSV_AV_EOL = 0
+MSV_AV_NB_COMPUTER_NAME = 1
+MSV_AV_NB_DOMAIN_NAME = 2
+MSV_AV_DNS_COMPUTER_NAME = 3
+MSV_AV_DNS_DOMAIN_NAME = 4
+MSV_AV_DNS_TREE_NAME = 5
+MSV_AV_FLAGS = 6
+MSV_AV_TIMESTAMP = 7
+MSV_AV_SINGLE_HOST = 8
+MSV_AV_TARGET_NAME = 9
+MSV_AV_CHANNEL_BINDINGS = 10
+
+# Largest message message_length() vouches for
+MAX_MESSAGE = 65536
+
+# NTLMv1 responses are exactly this long; NTLMv2 ones are longer
+NTLMV1_RESPONSE_SIZE = 24
+
+_U32 = struct.Struct("<I")
+_SECBUF = struct.Struct("<HHI")             # Len, MaxLen, BufferOffset
+_AV_HDR = struct.Struct("<HH")              # AvId, AvLen
+_VERSION = struct.Struct("<BBH3xB")         # major, minor, build, NTLM revision
+_NTLMV2_CLIENT = struct.Struct("<BB6xQ")   # RespType, HiRespType, TimeStamp
+# AUTHENTICATE's six security buffers and flags, in one read
+_AUTHENTICATE_HDR = struct.Struct("<" + "HHI" * 6 + "I")
+
+_NEGOTIATE_SIZE = 32
+_CHALLENGE_SIZE = 48
+_AUTHENTICATE_SIZE = 64
+_VERSION_SIZE = 8
+_MIC_SIZE = 16
+_NT_PROOF_SIZE = 16
+# NTLMv2_CLIENT_CHALLENGE up to its AV pairs: the fields above, then
+# ChallengeFromClient (8) and Reserved3 (4)
+_NTLMV2_CLIENT_SIZE = 28
+
+# FILETIME of the unix epoch
+_EPOCH_FILETIME = 116444736000000000
+
+# message type -> (fixed header size, offset of the flags, offsets of the
+# security buffers)
+_LAYOUT = {
+    NEGOTIATE: (_NEGOTIATE_SIZE, 12, (16, 24)),
+    CHALLENGE: (_CHALLENGE_SIZE, 20, (12, 40)),
+    AUTHENTICATE: (_AUTHENTICATE_SIZE, 60, (12, 20, 28, 36, 44, 52)),
+}
+
+Version = Tuple[int, int, int, int]
+
+
+class NTLMSSPError(ValueError):
+    pass
+
+
+def message_length(buf, start: int = 0) -> Optional[int]:
+    """
+    Length of the NTLMSSP message at buf[start:], from its header: None if
+    more bytes are needed to tell, -1 if it is not a message. The payload
+    follows the header; with no payload, a VERSION flag still adds 8 bytes.
+    """
+    if len(buf) - start < 12:
+        return None
+    layout = _LAYOUT.get(_U32.unpack_from(buf, start + 8)[0])
+    if layout is None:
+        return -1
+    fixed, flags, secbufs = layout
+    if len(buf) - start < fixed:
+        return None
+    end = fixed
+    if flags < fixed and _U32.unpack_from(buf, start + flags)[0] & NEGOTIATE_VERSION:
+        end += _VERSION_SIZE
+    for off in secbufs:
+        length, _, offset = _SECBUF.unpack_from(buf, start + off)
+        if length:
+            end = max(end, offset + length)
+    return end if end <= MAX_MESSAGE else -1
+
+
+def parse_av_pairs(view) -> Dict[int, memoryview]:
+    """
+    AV_PAIR list -> {AvId: value}, up to MsvAvEOL or the end of `view`. A
+    repeated id keeps its first value.
+    """
+    view = memoryview(view)
+    unpack = _AV_HDR.unpack_from
+    pairs: Dict[int, memoryview] = {}
+    pos, end = 0, len(view)
+    while pos + 4 <= end:
+        av_id, av_len = unpack(view, pos)
+        pos += 4
+        if av_id == MSV_AV_EOL:
+            break
+        nxt = pos + av_len
+        if nxt > end:
+            raise NTLMSSPError(f"AV pair {av_id} runs past the end of the list")
+        if av_id not in pairs:
+            pairs[av_id] = view[pos:nxt]
+        pos = nxt
+    return pairs
+
+
+def filetime_to_unix(ft: int) -> float:
+    return (ft - _EPOCH_FILETIME) / 1e7
+
+
+def _secbuf(view: memoryview, at: int, fixed: int, size: int) -> Tuple[int, int]:
+    # (offset, length) of the security buffer at `at`, which must lie in
+    # the payload; empty buffers may point anywhere
+    length, _, offset = _SECBUF.unpack_from(view, at)
+    if not length:
+        return size, 0
+    if offset < fixed or offset + length > size:
+        raise NTLMSSPError(f"security buffer at {at} ({offset}+{length}) outside the {size}-byte message")
+    return offset, length
+
+
+def _version(view: memoryview, flags: int, at: int, payload: int) -> Optional[Version]:
+    # VERSION follows the fixed header when the flag says so and the
+    # payload leaves room for it
+    if flags & NEGOTIATE_VERSION and at + _VERSION_SIZE <= payload:
+        return _VERSION.unpack_from(view, at)
+    return None
+
+
+def _text(view: memoryview, unicode: bool) -> Optional[str]:
+    if not view:
+        return None
+    return str(view, "utf-16-le" if unicode else "latin-1", "replace")
+
+
+class _Message:
+    __slots__ = ("view", "flags", "version")
+
+    message_type = 0
+
+    @property
+    def message_type_name(self) -> str:
+        return MESSAGE_TYPE_NAMES[self.message_type]
+
+    @property
+    def unicode(self) -> bool:
+        return bool(self.flags & NEGOTIATE_UNICODE)
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} flags=0x{self.flags:08x} {len(self.view)} bytes>"
+
+
+class Negotiate(_Message):
+    __slots__ = ("domain_view", "workstation_view")
+
+    message_type = NEGOTIATE
+
+    def __init__(self, view: memoryview) -> None:
+        size = len(view)
+        if size < _NEGOTIATE_SIZE:
+            raise NTLMSSPError("NEGOTIATE shorter than its header")
+        self.view = view
+        self.flags = _U32.unpack_from(view, 12)[0]
+        d_off, d_len = _secbuf(view, 16, _NEGOTIATE_SIZE, size)
+        w_off, w_len = _secbuf(view, 24, _NEGOTIATE_SIZE, size)
+        self.domain_view = view[d_off:d_off + d_len]
+        self.workstation_view = view[w_off:w_off + w_len]
+        self.version = _version(view, self.flags, _NEGOTIATE_SIZE, min(d_off, w_off))
+
+    # Always OEM in a NEGOTIATE
+    @property
+    def domain(self) -> Optional[str]:
+        return _text(self.domain_view, False)
+
+    @property
+    def workstation(self) -> Optional[str]:
+        return _text(self.workstation_view, False)
+
+
+class Challenge(_Message):
+    __slots__ = ("server_challenge", "target_name_view", "target_info")
+
+    message_type = CHALLENGE
+
+    def __init__(self, view: memoryview) -> None:
+        size = len(view)
+        if size < _CHALLENGE_SIZE:
+            raise NTLMSSPError("CHALLENGE shorter than its header")
+        self.view = view
+        self.flags = _U32.unpack_from(view, 20)[0]
+        self.server_challenge = view[24:32]
+        n_off, n_len = _secbuf(view, 12, _CHALLENGE_SIZE, size)
+        i_off, i_len = _secbuf(view, 40, _CHALLENGE_SIZE, size)
+        self.target_name_view = view[n_off:n_off + n_len]
+        self.target_info = parse_av_pairs(view[i_off:i_off + i_len])
+        self.version = _version(view, self.flags, _CHALLENGE_SIZE, min(n_off, i_off))
+
+    @property
+    def target_name(self) -> Optional[str]:
+        return _text(self.target_name_view, self.unicode)
+
+    def av_text(self, av_id: int) -> Optional[str]:
+        value = self.target_info.get(av_id)
+        return None if value is None else _text(value, True)
+
+
+class NTLMv2Response:
+    """
+    NTLMv2_RESPONSE: NTProofStr followed by the client's NTLMv2_CLIENT_CHALLENGE.
+    """
+
+    __slots__ = ("nt_proof_str", "resp_type", "hi_resp_type", "timestamp", "client_challenge", "av_pairs")
+
+    def __init__(self, view: memoryview) -> None:
+        if len(view) < _NT_PROOF_SIZE + _NTLMV2_CLIENT_SIZE:
+            raise NTLMSSPError("NTLMv2 response too short")
+        self.nt_proof_str = view[:_NT_PROOF_SIZE]
+        self.resp_type, self.hi_resp_type, self.timestamp = _NTLMV2_CLIENT.unpack_from(view, _NT_PROOF_SIZE)
+        at = _NT_PROOF_SIZE + _NTLMV2_CLIENT.size
+        self.client_challenge = view[at:at + 8]
+        self.av_pairs = parse_av_pairs(view[_NT_PROOF_SIZE + _NTLMV2_CLIENT_SIZE:])
+
+    @property
+    def unix_time(self) -> float:
+        return filetime_to_unix(self.timestamp)
+
+
+class Authenticate(_Message):
+    __slots__ = (
+        "lm_response", "nt_response", "domain_view", "user_view", "workstation_view",
+        "session_key", "mic", "ntlmv2",
+    )
+
+    message_type = AUTHENTICATE
+
+    def __init__(self, view: memoryview) -> None:
+        size = len(view)
+        if size < _AUTHENTICATE_SIZE:
+            raise NTLMSSPError("AUTHENTICATE shorter than its header")
+        self.view = view
+        hdr = _AUTHENTICATE_HDR.unpack_from(view, 12)
+        self.flags = hdr[18]
+        payload = size
+        fields = []
+        for i in range(0, 18, 3):
+            length, offset = hdr[i], hdr[i + 2]
+            if not length:
+                fields.append(view[0:0])
+                continue
+            if offset < _AUTHENTICATE_SIZE or offset + length > size:
+                raise NTLMSSPError(
+                    f"security buffer at {12 + i // 3 * 8} ({offset}+{length}) "
+                    f"outside the {size}-byte message"
+                )
+            if offset < payload:
+                payload = offset
+            fields.append(view[offset:offset + length])
+        (self.lm_response, self.nt_response, self.domain_view,
+         self.user_view, self.workstation_view, self.session_key) = fields
+        self.version = _version(view, self.flags, _AUTHENTICATE_SIZE, payload)
+
+        # The MIC is only there if the payload starts after room for it
+        mic = _AUTHENTICATE_SIZE + _VERSION_SIZE
+        self.mic = view[mic:mic + _MIC_SIZE] if payload >= mic + _MIC_SIZE else None
+
+        self.ntlmv2 = None
+        if len(self.nt_response) > NTLMV1_RESPONSE_SIZE:
+            self.ntlmv2 = NTLMv2Response(self.nt_response)
+
+    @property
+    def domain(self) -> Optional[str]:
+        return _text(self.domain_view, self.unicode)
+
+    @property
+    def user(self) -> Optional[str]:
+        return _text(self.user_view, self.unicode)
+
+    @property
+    def workstation(self) -> Optional[str]:
+        return _text(self.workstation_view, self.unicode)
+
+    @property
+    def anonymous(self) -> bool:
+        return not self.user_view and len(self.nt_response) == 0
+
+    @property
+    def hash_type(self) -> Optional[str]:
+        n = len(self.nt_response)
+        if n == NTLMV1_RESPONSE_SIZE:
+            return "NetNTLMv1"
+        if n > NTLMV1_RESPONSE_SIZE:
+            return "NetNTLMv2"
+        return None
+
+
+Message = Union[Negotiate, Challenge, Authenticate]
+
+_TYPES = {NEGOTIATE: Negotiate, CHALLENGE: Challenge, AUTHENTICATE: Authenticate}
+
+
+def parse(data) -> Message:
+    """
+    Parse the NTLMSSP message at the start of `data` (bytes, bytearray or
+    memoryview). Trailing bytes after the message are allowed.
+    """
+    view = memoryview(data)
+    if len(view) < 12 or view[:8] != NTLM_MAGIC:
+        raise NTLMSSPError("not an NTLMSSP message")
+    cls = _TYPES.get(_U32.unpack_from(view, 8)[0])
+    if cls is None:
+        raise NTLMSSPError(f"unknown NTLMSSP message type {_U32.unpack_from(view, 8)[0]}")
+    return cls(view)
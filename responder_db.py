@@ -0,0 +1,225 @@
+# responder_db.py
+#
+# Ingests captures straight from Responder's own database (Responder.db)
+# instead of scraping its console output.
+#
+# Responder appends one row per captured credential to its `responder`
+# table (RESPONDER_SCHEMA below). The reader keeps the rowid of the last
+# row it ingested as a watermark and each poll asks only for rows past it,
+# which SQLite answers from the rowid b-tree: a tick costs O(new rows)
+# however large the database has grown, and nothing when PRAGMA
+# data_version says no one has committed since the previous tick. New
+# rows go to the session store as one add_sessions() batch, with client,
+# module, user and hash taken from their own columns rather than from
+# interleaved console lines.
+
+from __future__ import annotations
+import os
+import sqlite3
+import threading
+import urllib.parse
+from typing import Any, Dict, Optional, Tuple
+
+from ghostrelay.config import CONFIG
+from ghostrelay.responder_parser import hash_type
+from ghostrelay.sessions import SESSION_STORE
+
+# Responder's table, as created by Responder itself (utils.py); used to
+# build test databases
+RESPONDER_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS responder (timestamp TEXT, module TEXT, type TEXT, "
+    "client TEXT, hostname TEXT, user TEXT, cleartext TEXT, hash TEXT, fullhash TEXT)"
+)
+
+# Seconds between polls, and most rows ingested per poll (the rest wait
+# for the next one)
+DB_POLL_INTERVAL = 1.0
+DB_BATCH_MAX = 1000
+
+_SELECT_NEW = (
+    "SELECT rowid, module, type, client, hostname, user, cleartext, fullhash "
+    "FROM responder WHERE rowid > ? ORDER BY rowid LIMIT ?"
+)
+
+
+def row_to_entry(row: Tuple[Any, ...], interface: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    An add_sessions() entry for one row of _SELECT_NEW, or None if the row
+    carries no credential.
+    """
+    _, module, kind, client, hostname, user, cleartext, fullhash = row
+    credential = fullhash or cleartext
+    if not credential:
+        return None
+
+    # NTLM users are stored as DOMAIN\user
+    domain, _, name = (user or "").rpartition("\\")
+    return {
+        "source_ip": client or "Responder",
+        "dest_ip": module or "GhostRelay",
+        "direction": "capture",
+        "raw_data": credential.encode(),
+        "note": f"Credential ({user})",
+        "interface": interface,
+        "username": name or None,
+        "domain": domain or None,
+        "workstation": hostname or None,
+        "hash_type": hash_type(kind),
+    }
+
+
+class ResponderDBReader:
+    """
+    Polls a Responder.db for rows added since the last poll.
+
+    With from_start=False, rows already in the database when it is first
+    opened (earlier Responder runs) are skipped. A database that is
+    replaced or emptied is read again from its first row.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        store=None,
+        interface: Optional[str] = None,
+        from_start: bool = False,
+    ) -> None:
+        self.path = path or CONFIG.responder.db_path
+        self.store = store or SESSION_STORE
+        self.interface = interface
+
+        self._db: Optional[sqlite3.Connection] = None
+        self._ino: Optional[int] = None
+        self._seen_version: Optional[int] = None
+        self._skip_existing = not from_start
+        self.watermark = 0
+
+        self.rows = 0          # rows ingested
+        self.polls = 0
+        self.last_error: Optional[str] = None
+
+        # poll() may be called from the polling thread and a final caller
+        self._poll_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------------------------
+    def _open(self, ino: int) -> None:
+        self._close()
+        uri = "file:" + urllib.parse.quote(os.path.abspath(self.path)) + "?mode=ro"
+        self._db = sqlite3.connect(uri, uri=True, timeout=5.0, check_same_thread=False)
+        self._seen_version = None
+        if ino != self._ino:
+            # A different file (or the first one): the watermark is void
+            self._ino = ino
+            self.watermark = self._max_rowid() if self._skip_existing else 0
+        # Only the database found at start holds earlier runs' rows
+        self._skip_existing = False
+
+    def _max_rowid(self) -> int:
+        try:
+            return self._db.execute("SELECT MAX(rowid) FROM responder").fetchone()[0] or 0
+        except sqlite3.OperationalError:
+            # Responder has not created its table yet
+            return 0
+
+    # ---------------------------
+    def poll(self) -> int:
+        """
+        Ingest rows added since the last poll; returns how many were read.
+        """
+        with self._poll_lock:
+            return self._poll()
+
+    def _poll(self) -> int:
+        self.polls += 1
+        try:
+            ino = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            # Whatever Responder creates later is this run's
+            self._skip_existing = False
+            return 0
+
+        if self._db is None or ino != self._ino:
+            self._open(ino)
+
+        try:
+            # Bumped whenever another connection commits
+            version = self._db.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._seen_version:
+                return 0
+            rows = self._db.execute(_SELECT_NEW, (self.watermark, DB_BATCH_MAX)).fetchall()
+            if not rows and self._max_rowid() < self.watermark:
+                # Emptied or rebuilt in place: start over
+                self.watermark = 0
+                rows = self._db.execute(_SELECT_NEW, (0, DB_BATCH_MAX)).fetchall()
+        except sqlite3.OperationalError as e:
+            # Locked mid-write or table not there yet: try again next tick
+            self.last_error = str(e)
+            return 0
+
+        if len(rows) < DB_BATCH_MAX:
+            # Caught up; nothing more until the next commit
+            self._seen_version = version
+
+        entries = []
+        for row in rows:
+            entry = row_to_entry(row, self.interface)
+            if entry is not None:
+                entries.append(entry)
+        if entries:
+            self.store.add_sessions(entries)
+        if rows:
+            self.watermark = rows[-1][0]
+        self.rows += len(entries)
+        return len(rows)
+
+    # ---------------------------
+    def start(self, interval: float = DB_POLL_INTERVAL) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(interval,), name="ghostrelay-responder-db", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, interval: float) -> None:
+        while not self._stop.is_set():
+            try:
+                n = self.poll()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"[GhostRelay][ResponderDB] Poll failed: {e}")
+                n = 0
+            if n < DB_BATCH_MAX:
+                self._stop.wait(interval)
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+        self.close()
+
+    def close(self) -> None:
+        with self._poll_lock:
+            self._close()
+
+    def _close(self) -> None:
+        if self._db is not None:
+            try:
+                self._db.close()
+            except sqlite3.Error:
+                pass
+            self._db = None
+            # Keep _ino and the watermark: reopening the same file resumes
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "watermark": self.watermark,
+            "rows": self.rows,
+            "polls": self.polls,
+            "last_error": self.last_error,
+        }
@@ -2,12 +2,19 @@ from __future__ import annotations
 
 import os
 import re
+import selectors
 import shutil
 import subprocess
 import threading
 import time
-from typing import Optional
-
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from ghostrelay.config import CONFIG
+from ghostrelay.events import EVENT_BUS
+from ghostrelay.log_tail import PIPE_READ_SIZE, LineRing, OutputSplitter, read_tail
+from ghostrelay.responder_db import ResponderDBReader
+from ghostrelay.responder_parser import ResponderOutputParser
 from ghostrelay.sessions import SESSION_STORE
 
 
@@ -39,12 +46,85 @@ def find_responder_path() -> str:
 
 RESPONDER_PATH = find_responder_path()
 
+# Capture rates are reported over this many trailing seconds
+RATE_WINDOW = 60.0
+
+# Lifecycle (ResponderManager.state):
+#   stopped -> starting -> running -> stopping -> stopped
+# starting lasts until every Responder has printed READY_BANNER or exited;
+# running ends when all of them have exited or stop_responder() is called.
+STOPPED = "stopped"
+STARTING = "starting"
+RUNNING = "running"
+STOPPING = "stopping"
+
+# Printed by Responder once its servers are listening
+READY_BANNER = "Listening for events"
+
+# Longest wait for the banner, and for a Responder to exit on SIGTERM
+# before it is sent SIGKILL
+START_TIMEOUT = 10.0
+STOP_TIMEOUT = 5.0
+
+_READY_BANNER = READY_BANNER.encode()
+
+
+class ResponderInstance:
+    """
+    One Responder process, on one interface, and the state of its output.
+    """
+
+    def __init__(self, interface: str, process: subprocess.Popen):
+        self.interface = interface
+        self.process = process
+        self.splitter = OutputSplitter()
+        self.parser = ResponderOutputParser()
+        self.running = True     # until its output reaches EOF
+        self.ready = False      # READY_BANNER seen
+
+        self.started_at = time.time()
+        self.lines = 0
+        self.captures = 0
+        self.recent: Deque[float] = deque()   # capture times, last RATE_WINDOW
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        while self.recent and self.recent[0] < now - RATE_WINDOW:
+            self.recent.popleft()
+        uptime = max(now - self.started_at, 1e-9)
+        return {
+            "running": self.running,
+            "ready": self.ready,
+            "pid": self.process.pid,
+            "returncode": self.process.returncode,
+            "lines": self.lines,
+            "captures": self.captures,
+            "lines_per_sec": self.lines / uptime,
+            "captures_per_min": len(self.recent) * 60.0 / RATE_WINDOW,
+        }
+
 
 class ResponderManager:
+    """
+    Runs one Responder per capture interface. A single supervisor thread
+    multiplexes all their stdout pipes with a selector, so adding an
+    interface adds a process but no thread.
+    """
+
     def __init__(self):
-        self.process: Optional[subprocess.Popen] = None
+        self.instances: Dict[str, ResponderInstance] = {}
         self.interface: Optional[str] = None
-        self.running: bool = False
+        self._selector: Optional[selectors.BaseSelector] = None
+        self._thread: Optional[threading.Thread] = None
+
+        # Guards state and the instances' running / ready flags
+        self.state: str = STOPPED
+        self._state_cond = threading.Condition()
+
+        # "stdout" or "db"; in db mode captures come from db_reader and the
+        # console output only feeds the log
+        self.ingest: str = CONFIG.responder.ingest
+        self.db_reader: Optional[ResponderDBReader] = None
 
         self.last_source_ip = None
         self.last_dest_ip = None
@@ -57,6 +137,43 @@ class ResponderManager:
 
         self.log_file = None
 
+        # Recent cleaned lines for the web UI; the file is only the
+        # persistent copy. Seeded with the end of the previous run's log.
+        self.lines = LineRing()
+        try:
+            for line in read_tail(self.log_path).data.decode(errors="ignore").splitlines():
+                self.lines.append(line)
+        except FileNotFoundError:
+            pass
+
+    @property
+    def running(self) -> bool:
+        return self.state in (STARTING, RUNNING)
+
+    def _set_state(self, state: str, only_from: Optional[str] = None) -> bool:
+        """
+        Move to `state` (if currently `only_from`, when given) and tell
+        waiters and /events subscribers. Returns whether it moved.
+        """
+        with self._state_cond:
+            if state == self.state or (only_from is not None and self.state != only_from):
+                return False
+            self.state = state
+            self._state_cond.notify_all()
+        EVENT_BUS.publish("status", {
+            "running": self.running,
+            "state": state,
+            "interfaces": self.interface_stats(),
+        })
+        return True
+
+    def wait_for_state(self, *states: str, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the manager is in one of `states`; False on timeout.
+        """
+        with self._state_cond:
+            return self._state_cond.wait_for(lambda: self.state in states, timeout)
+
     # ---------------------------
     # Detect interface
     # ---------------------------
@@ -106,106 +223,241 @@ class ResponderManager:
             f.write(patched)
 
     # ---------------------------
-    def start_capture_mode(self):
+    def start_capture_mode(self, interfaces: Optional[List[str]] = None, ingest: Optional[str] = None):
         if os.geteuid() != 0:
             raise PermissionError("Run as sudo/root")
 
+        ingest = ingest or CONFIG.responder.ingest
+        if ingest not in ("stdout", "db"):
+            raise ValueError(f"Unknown ingest mode: {ingest}")
+
+        if self.state != STOPPED:
+            raise RuntimeError(f"Responder is already {self.state}")
+
         self.verify_responder()
-        iface = self.interface or self.detect_interface()
+        ifaces = list(interfaces or CONFIG.responder.interfaces)
+        if not ifaces:
+            ifaces = [self.interface or self.detect_interface()]
         self.backup_config()
 
-        cmd = [RESPONDER_PATH, "-I", iface, "-wdv", "-v", "--verbose"]
-        print(f"[GhostRelay] Starting capture mode: {' '.join(cmd)}")
+        cmds = {}
+        for iface in ifaces:
+            cmds[iface] = [RESPONDER_PATH, "-I", iface, "-wdv", "-v", "--verbose"]
+            print(f"[GhostRelay] Starting capture mode: {' '.join(cmds[iface])}")
+
+        self.ingest = ingest
+        if ingest == "db":
+            # Responder.db has no interface column; only a single
+            # interface can be attributed
+            self.db_reader = ResponderDBReader(
+                CONFIG.responder.db_path,
+                interface=ifaces[0] if len(ifaces) == 1 else None,
+            )
+            print(f"[GhostRelay] Reading captures from {self.db_reader.path}")
+        else:
+            self.db_reader = None
+
+        self._start_responders(cmds)
+        if self.db_reader is not None:
+            self.db_reader.start()
 
-        self._start_responder(cmd)
+    # ---------------------------
+    @property
+    def process(self) -> Optional[subprocess.Popen]:
+        # First instance; for callers that only ever ran one
+        for inst in self.instances.values():
+            return inst.process
+        return None
 
     # ---------------------------
-    def _start_responder(self, cmd):
-        self.running = True
+    def _start_responders(self, cmds: Dict[str, List[str]]):
+        if not self._set_state(STARTING, only_from=STOPPED):
+            raise RuntimeError(f"Responder is already {self.state}")
+
+        # Clean log file; written one block of lines at a time
+        self.log_file = open(self.log_path, "wb", buffering=0)
+        self.lines.clear()
+
+        self._selector = selectors.DefaultSelector()
+        self.instances = {}
+        error: Optional[OSError] = None
+        for iface, cmd in cmds.items():
+            # Raw binary pipe: the supervisor reads it in large chunks
+            try:
+                process = subprocess.Popen(
+                    cmd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    bufsize=0,
+                )
+            except OSError as e:
+                error = e
+                break
+            inst = ResponderInstance(iface, process)
+            self.instances[iface] = inst
+            self._selector.register(process.stdout, selectors.EVENT_READ, inst)
+
+        self._thread = threading.Thread(target=self._supervise, name="ghostrelay-responder", daemon=True)
+        self._thread.start()
+
+        if error is not None:
+            # Take down the ones already started
+            self.stop_responder()
+            raise error
+
+        # Up when every Responder has printed its banner or died trying
+        insts = list(self.instances.values())
+        with self._state_cond:
+            self._state_cond.wait_for(
+                lambda: all(i.ready or not i.running for i in insts), START_TIMEOUT
+            )
+
+        exited = [i.interface for i in insts if not i.running]
+        if len(exited) == len(insts):
+            self.stop_responder()
+            raise RuntimeError("Responder exited during startup; check ghostrelay.log")
+        for iface in exited:
+            print(f"[GhostRelay] Responder on {iface} exited during startup; check ghostrelay.log")
+        for inst in insts:
+            if inst.running and not inst.ready:
+                print(f"[GhostRelay] No startup banner from Responder on {inst.interface} "
+                      f"after {START_TIMEOUT:.0f}s; assuming it is up")
+
+        # Unless it all stopped in the meantime
+        self._set_state(RUNNING, only_from=STARTING)
 
-        # Clean log file
-        self.log_file = open(self.log_path, "w", encoding="utf8", buffering=1)
+    # ---------------------------
+    def _supervise(self):
+        sel = self._selector
+        # With several interfaces, log lines say which one they came from
+        tag = len(self.instances) > 1
+
+        while sel.get_map():
+            for key, _ in sel.select(timeout=1.0):
+                inst = key.data
+                chunk = os.read(key.fd, PIPE_READ_SIZE)
+                if chunk:
+                    block = inst.splitter.feed(chunk)
+                else:
+                    # EOF: this Responder exited
+                    block = inst.splitter.flush()
+                    sel.unregister(key.fileobj)
+                    key.fileobj.close()
+                    inst.process.poll()     # reap it if it is gone already
+                    with self._state_cond:
+                        inst.running = False
+                        self._state_cond.notify_all()
+                    print(f"[GhostRelay] Responder on {inst.interface} exited")
+
+                if not block:
+                    continue
+                if not inst.ready and _READY_BANNER in block:
+                    with self._state_cond:
+                        inst.ready = True
+                        self._state_cond.notify_all()
+                self._handle_output(inst, block, tag)
 
-        self.process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1,
-        )
+        sel.close()
+        self._stop_db_reader()
 
-        time.sleep(0.5)
-        if self.process.poll() is not None:
-            raise RuntimeError("Responder crashed immediately")
+        try:
+            self.log_file.close()
+        except:
+            pass
 
-        threading.Thread(target=self._monitor_output, daemon=True).start()
+        # Exited on their own (a stop in progress finishes the transition)
+        if self.state != STOPPING:
+            self._set_state(STOPPED)
 
     # ---------------------------
-    def _monitor_output(self):
-        ansi_re = re.compile(r"\x1B\[[0-9;]*[A-Za-z]")
-
-        user = None
-
-        for raw_line in self.process.stdout:
-            clean = ansi_re.sub("", raw_line.rstrip("\n"))
-
-            # Write clean log
-            self.log_file.write(clean + "\n")
-
-            # Extract IP
-            m_ip = re.search(r"sent to ([0-9]+\.[0-9]+\.[0-9]+\.[0-9]+)", clean)
-            if m_ip:
-                self.last_source_ip = m_ip.group(1)
-
-            # Extract service/resource
-            m_service = re.search(r"service:\s*([A-Za-z0-9_\-]+)", clean)
-            if m_service:
-                self.last_dest_ip = m_service.group(1)
-
-            # Username
-            if (
-                "NTLMv2-SSP Username" in clean
-                or "NTLMv2 Username" in clean
-                or "NTLMv1 Username" in clean
-                or "HTTP Basic Authentication" in clean
-            ):
-                user = clean.split(":", 1)[1].strip()
-                continue
+    def _handle_output(self, inst: ResponderInstance, block: bytes, tag: bool):
+        lines = block.decode(errors="replace").split("\n")
+        lines.pop()     # after the final newline
+        inst.lines += len(lines)
 
-            # Hash or credential
-            if (
-                "NTLMv2-SSP Hash" in clean
-                or "Hash" in clean
-                or "Basic Authentication" in clean
-            ):
-                if not user:
-                    continue
+        # In db mode the console output is only logged
+        if self.db_reader is None:
+            self._parse_captures(inst, lines)
 
-                cred = clean.split(":", 1)[1].strip()
+        if tag:
+            prefix = f"[{inst.interface}] "
+            lines = [prefix + line for line in lines]
+            block = "".join(line + "\n" for line in lines).encode()
 
-                SESSION_STORE.add_session(
-                    source_ip=self.last_source_ip or "Responder",
-                    dest_ip=self.last_dest_ip or "GhostRelay",
-                    direction="capture",
-                    raw_data=cred.encode(),
-                    note=f"Credential ({user})"
-                )
+        # Write clean log
+        self.log_file.write(block)
+        seq = self.lines.extend(lines)
+        EVENT_BUS.publish("log", {"lines": lines, "seq": seq})
+
+        self.last_source_ip = inst.parser.source_ip
+        self.last_dest_ip = inst.parser.service
+
+    # ---------------------------
+    def _parse_captures(self, inst: ResponderInstance, lines: List[str]):
+        for line in lines:
+            capture = inst.parser.feed(line)
+            if capture is None:
+                continue
 
-                user = None
+            SESSION_STORE.add_session(
+                source_ip=capture.source_ip or "Responder",
+                dest_ip=capture.service or "GhostRelay",
+                direction="capture",
+                raw_data=capture.credential.encode(),
+                note=f"Credential ({capture.user})",
+                interface=inst.interface,
+            )
+            inst.captures += 1
+            inst.recent.append(time.time())
 
-        self.running = False
+    # ---------------------------
+    def interface_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Per-interface process state, line and capture counts and rates.
+        """
+        return {iface: inst.stats() for iface, inst in list(self.instances.items())}
 
+    # ---------------------------
+    def _stop_db_reader(self):
+        reader = self.db_reader
+        if reader is None:
+            return
+        reader.stop()
+        # Rows Responder wrote while shutting down
         try:
-            self.log_file.close()
-        except:
-            pass
+            reader.poll()
+        finally:
+            reader.close()
 
     # ---------------------------
     def stop_responder(self):
-        if self.process:
-            self.process.terminate()
-            time.sleep(1)
+        """
+        SIGTERM every Responder, SIGKILL those still running after
+        STOP_TIMEOUT, reap them all and wait for the supervisor to finish.
+        Returns as soon as they are gone.
+        """
+        self._set_state(STOPPING)
+
+        procs = [i.process for i in self.instances.values()]
+        for proc in procs:
+            if proc.poll() is None:
+                proc.terminate()
+
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for proc in procs:
+            try:
+                proc.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                print(f"[GhostRelay] Responder (pid {proc.pid}) ignored SIGTERM; killing it")
+                proc.kill()
+                proc.wait()
+
+        # Their pipes are at EOF now, so the supervisor is about to exit
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=STOP_TIMEOUT)
+        self._thread = None
+        self._stop_db_reader()
 
         self.restore_config()
-        self.running = False
-
+        self._set_state(STOPPED)
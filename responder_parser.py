@@ -0,0 +1,116 @@
+# responder_parser.py
+#
+# Classifies Responder's console output one line at a time and pulls out
+# the captured credentials.
+#
+# The lines that matter, as Responder prints them:
+#
+#   [*] [NBT-NS] Poisoned answer sent to 10.0.0.5 for name FS (service: File Server)
+#   [SMB] NTLMv2-SSP Client   : 10.0.0.5
+#   [SMB] NTLMv2-SSP Username : CORP\alice
+#   [SMB] NTLMv2-SSP Hash     : alice::CORP:1122334455667788:...
+#
+# One compiled alternation finds the first line kind present and its
+# fields in a single scan. Each branch ends in a group named after its
+# kind, so feed() dispatches on m.lastgroup. Every branch starts with a
+# literal, which lets re skip ahead to the positions a branch could start
+# at; a branch opening with a group would turn that off.
+#
+# A Username line arms the parser; the next Hash / credential line produces
+# a Capture for that user.
+
+from __future__ import annotations
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+_IPV4 = r"[0-9]+\.[0-9]+\.[0-9]+\.[0-9]+"
+_NAME = r"[A-Za-z0-9_\-]+"
+
+_LINE_RE = re.compile(
+    # Poisoned answer: client address, and the service when on the same line
+    rf"sent to (?P<ip>{_IPV4}).*?service:\s*(?P<poisoned_service>{_NAME})"
+    rf"|sent to (?P<poisoned>{_IPV4})"
+    rf"|service:\s*(?P<service>{_NAME})"
+    # Version, optional -SSP, field name, value
+    r"|NTLMv[12](?:-SSP)? (?P<ntlm_field>Client|Username|Hash)\s*:\s*(?P<ntlm>.*)"
+    # "HTTP Basic Authentication" names the user; the other carries the
+    # credential
+    r"|HTTP Basic Authentication[^:]*:\s*(?P<basic_user>.*)"
+    r"|Basic Authentication[^:]*:\s*(?P<basic>.*)"
+)
+
+
+# Responder's names for hash types (its `type` column and hash file names)
+# -> ours
+_HASH_TYPES = {
+    "NTLMv1": "NetNTLMv1",
+    "NTLMv1-SSP": "NetNTLMv1",
+    "NTLMv2": "NetNTLMv2",
+    "NTLMv2-SSP": "NetNTLMv2",
+}
+
+
+def hash_type(kind: Optional[str]) -> Optional[str]:
+    return _HASH_TYPES.get(kind, kind)
+
+
+@dataclass
+class Capture:
+    source_ip: Optional[str]
+    service: Optional[str]
+    user: str
+    credential: str
+
+
+class ResponderOutputParser:
+    """
+    Stateful parser for one Responder process's output. Feed it cleaned
+    (ANSI-free) lines in order.
+    """
+
+    __slots__ = ("source_ip", "service", "_user")
+
+    def __init__(self) -> None:
+        # Most recent client address and service seen
+        self.source_ip: Optional[str] = None
+        self.service: Optional[str] = None
+        self._user: Optional[str] = None
+
+    def feed(self, line: str) -> Optional[Capture]:
+        """
+        Update state from one line; return a Capture if it completed one.
+        """
+        m = _LINE_RE.search(line)
+        if m is None:
+            return None
+        kind = m.lastgroup
+        value = m.group(kind)
+
+        if kind == "poisoned_service":
+            self.source_ip = m.group("ip")
+            self.service = value
+        elif kind == "poisoned":
+            self.source_ip = value
+        elif kind == "service":
+            self.service = value
+        elif kind == "ntlm":
+            field, value = m.group("ntlm_field"), value.strip()
+            if field == "Client":
+                self.source_ip = value or self.source_ip
+            elif field == "Username":
+                self._user = value
+            else:
+                return self._credential(value)
+        elif kind == "basic_user":
+            self._user = value.strip()
+        else:
+            return self._credential(value.strip())
+        return None
+
+    def _credential(self, value: str) -> Optional[Capture]:
+        if not self._user:
+            return None
+        capture = Capture(self.source_ip, self.service, self._user, value)
+        self._user = None
+        return capture
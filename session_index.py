@@ -0,0 +1,232 @@
+# session_index.py
+#
+# In-memory inverted indexes over the session table, maintained by
+# SessionStore as sessions are added and evicted.
+#
+#   facets     : domain, hash_type, direction, interface -> {value: ids}
+#   username   : {lowercased name: ids} + sorted distinct names (prefix match)
+#   source_ip  : {address: ids} + sorted distinct addresses (CIDR match)
+#                and {source_ip string: ids} (exact match)
+#   created_at : sorted (created_at, id) pairs (time ranges)
+#
+# Sorted lists only hold distinct values except for created_at, which is
+# appended to in (nearly) time order, so keeping them sorted is cheap.
+
+from __future__ import annotations
+import ipaddress
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+# Low-cardinality fields that can be filtered on and counted
+FACETS = ("domain", "hash_type", "direction", "interface")
+
+# Facets compared case-insensitively (like the username filter)
+_FOLDED = ("domain",)
+
+_IpKey = Tuple[int, int]   # (IP version, address as int)
+
+Terms = Union[str, Iterable[str], None]
+
+
+def _ip_key(value: Optional[str]) -> Optional[_IpKey]:
+    try:
+        addr = ipaddress.ip_address(value or "")
+    except ValueError:
+        return None
+    return addr.version, int(addr)
+
+
+def _terms(value: Terms) -> Optional[List[str]]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+
+class _Postings:
+    """
+    value -> set of session ids, plus the distinct values in sorted order.
+    """
+
+    __slots__ = ("ids", "keys")
+
+    def __init__(self) -> None:
+        self.ids: Dict[Any, Set[int]] = {}
+        self.keys: List[Any] = []
+
+    def add(self, key: Any, sid: int) -> None:
+        bucket = self.ids.get(key)
+        if bucket is None:
+            bucket = self.ids[key] = set()
+            insort(self.keys, key)
+        bucket.add(sid)
+
+    def remove(self, key: Any, sid: int) -> None:
+        bucket = self.ids.get(key)
+        if bucket is None:
+            return
+        bucket.discard(sid)
+        if not bucket:
+            del self.ids[key]
+            del self.keys[bisect_left(self.keys, key)]
+
+    def range(self, lo: Any, hi: Any) -> Set[int]:
+        # Union of the buckets for lo <= key <= hi
+        out: Set[int] = set()
+        for key in self.keys[bisect_left(self.keys, lo): bisect_right(self.keys, hi)]:
+            out |= self.ids[key]
+        return out
+
+
+class SessionIndex:
+    """
+    Inverted indexes answering SessionStore.search(). Not thread-safe; the
+    store updates and queries it under its own lock.
+    """
+
+    def __init__(self) -> None:
+        self._facets: Dict[str, _Postings] = {f: _Postings() for f in FACETS}
+        self._display: Dict[str, Dict[str, str]] = {f: {} for f in FACETS}
+        self._users = _Postings()
+        self._sources: Dict[str, Set[int]] = {}
+        self._ips = _Postings()
+        self._times: List[Tuple[float, int]] = []
+        self._created_at: Dict[int, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._times)
+
+    @staticmethod
+    def _facet_key(name: str, value: Optional[str]) -> str:
+        value = value or ""
+        return value.lower() if name in _FOLDED else value
+
+    def add(self, sess) -> None:
+        for name, postings in self._facets.items():
+            value = getattr(sess, name)
+            key = self._facet_key(name, value)
+            postings.add(key, sess.id)
+            self._display[name].setdefault(key, value or "")
+
+        self._users.add((sess.username or "").lower(), sess.id)
+
+        self._sources.setdefault(sess.source_ip, set()).add(sess.id)
+        ip = _ip_key(sess.source_ip)
+        if ip is not None:
+            self._ips.add(ip, sess.id)
+
+        self._created_at[sess.id] = sess.created_at
+        entry = (sess.created_at, sess.id)
+        if not self._times or entry > self._times[-1]:
+            self._times.append(entry)
+        else:
+            insort(self._times, entry)
+
+    def remove(self, sess) -> None:
+        for name, postings in self._facets.items():
+            postings.remove(self._facet_key(name, getattr(sess, name)), sess.id)
+
+        self._users.remove((sess.username or "").lower(), sess.id)
+
+        bucket = self._sources.get(sess.source_ip)
+        if bucket is not None:
+            bucket.discard(sess.id)
+            if not bucket:
+                del self._sources[sess.source_ip]
+        ip = _ip_key(sess.source_ip)
+        if ip is not None:
+            self._ips.remove(ip, sess.id)
+
+        self._created_at.pop(sess.id, None)
+        entry = (sess.created_at, sess.id)
+        i = bisect_left(self._times, entry)
+        if i < len(self._times) and self._times[i] == entry:
+            del self._times[i]
+
+    def query(
+        self,
+        username: Optional[str] = None,
+        username_prefix: Optional[str] = None,
+        source_ip: Optional[str] = None,
+        cidr: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        **facets: Terms,
+    ) -> List[int]:
+        """
+        Ids of the sessions matching every given condition, oldest first.
+
+        Facet arguments (see FACETS) take one value or several (any of them
+        matches). username is exact and username_prefix a prefix, both
+        case-insensitive; source_ip is exact and cidr a network such as
+        "10.0.0.0/24"; since <= created_at < until. Raises ValueError for an
+        unknown facet or a malformed cidr.
+        """
+        sets: List[Set[int]] = []
+
+        for name, value in facets.items():
+            if name not in self._facets:
+                raise ValueError(f"unknown facet {name!r}")
+            terms = _terms(value)
+            if terms is None:
+                continue
+            postings = self._facets[name]
+            found: Set[int] = set()
+            for t in terms:
+                found |= postings.ids.get(self._facet_key(name, t), set())
+            sets.append(found)
+
+        if username is not None:
+            sets.append(self._users.ids.get(username.lower(), set()))
+        if username_prefix:
+            lo = username_prefix.lower()
+            sets.append(self._users.range(lo, lo + "\U0010ffff"))
+
+        if source_ip is not None:
+            sets.append(self._sources.get(source_ip, set()))
+        if cidr is not None:
+            net = ipaddress.ip_network(cidr, strict=False)
+            sets.append(self._ips.range(
+                (net.version, int(net.network_address)),
+                (net.version, int(net.broadcast_address)),
+            ))
+
+        lo = 0 if since is None else bisect_left(self._times, (since, -1))
+        hi = len(self._times) if until is None else bisect_left(self._times, (until, -1))
+
+        if not sets:
+            return [sid for _, sid in self._times[lo:hi]]
+
+        sets.sort(key=len)
+        hits = sets[0].intersection(*sets[1:]) if len(sets) > 1 else set(sets[0])
+        if not hits:
+            return []
+
+        # Few hits: sort them by time; many: walk the time range instead
+        if len(hits) * 8 < hi - lo:
+            created = self._created_at
+            return [sid for _, sid in sorted(
+                e for e in ((created[sid], sid) for sid in hits)
+                if (since is None or e[0] >= since) and (until is None or e[0] < until)
+            )]
+        return [sid for _, sid in self._times[lo:hi] if sid in hits]
+
+    def facet_counts(self, ids: Optional[Iterable[int]] = None) -> Dict[str, Dict[str, int]]:
+        """
+        {facet: {value: number of sessions}}, over `ids` or every session.
+        """
+        out: Dict[str, Dict[str, int]] = {}
+        wanted = None if ids is None else set(ids)
+        for name, postings in self._facets.items():
+            display = self._display[name]
+            counts: Dict[str, int] = {}
+            for key, bucket in postings.ids.items():
+                n = len(bucket) if wanted is None else len(bucket & wanted)
+                if n:
+                    counts[display.get(key, key)] = n
+            out[name] = counts
+        return out
+
+    def clear(self) -> None:
+        self.__init__()
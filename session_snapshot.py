@@ -0,0 +1,127 @@
+# session_snapshot.py
+#
+# Binary snapshot format used by SessionStore compaction.
+#
+#   header : magic (8s) | record count (u32)
+#   index  : count x fixed-size entry
+#            id (u64) | created_at (f64) | meta offset (u64) | meta length (u32)
+#                     | raw offset (u64) | raw length (u32)
+#   meta   : one compact JSON object per record (everything except raw bytes)
+#   raw    : per record, a run of length-prefixed payloads (u32 length + bytes),
+#            the first one being NTLMSession.raw_data
+#
+# The index and metadata are read eagerly; payloads stay in the memory-mapped
+# file until somebody asks for them.
+
+from __future__ import annotations
+import json
+import mmap
+import os
+import struct
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+MAGIC = b"GRSNAP\x00\x01"
+
+_HEADER = struct.Struct("<8sI")
+_ENTRY = struct.Struct("<QdQIQI")
+_FRAME = struct.Struct("<I")
+
+# (id, created_at, metadata, callable returning the payloads)
+SnapshotRecord = Tuple[int, float, Dict[str, Any], Callable[[], List[bytes]]]
+
+
+def write_snapshot(path: str, records: List[SnapshotRecord]) -> Dict[int, Tuple[int, int]]:
+    """
+    Write records to path (atomically, via a .tmp file) and return
+    {id: (raw offset, raw length)} for the new file.
+
+    Payload callables are invoked one record at a time while the raw section
+    is streamed out, so payloads never all have to sit in memory at once.
+    """
+    metas = [json.dumps(meta, separators=(",", ":")).encode() for _, _, meta, _ in records]
+
+    meta_off = _HEADER.size + _ENTRY.size * len(records)
+    raw_off = meta_off + sum(len(m) for m in metas)
+
+    tmp = path + ".tmp"
+    offsets: Dict[int, Tuple[int, int]] = {}
+
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(records)))
+
+        # Index is written last, once raw lengths are known
+        f.seek(raw_off)
+        entries = []
+        for (sid, created_at, _, payloads), meta in zip(records, metas):
+            start = f.tell()
+            for p in payloads():
+                f.write(_FRAME.pack(len(p)))
+                f.write(p)
+            raw_len = f.tell() - start
+
+            entries.append(_ENTRY.pack(sid, created_at, meta_off, len(meta), start, raw_len))
+            offsets[sid] = (start, raw_len)
+            meta_off += len(meta)
+
+        f.seek(_HEADER.size)
+        f.write(b"".join(entries))
+        f.write(b"".join(metas))
+
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp, path)
+    return offsets
+
+
+class SnapshotReader:
+    """
+    Memory-mapped view of a snapshot written by write_snapshot().
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.count = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a GhostRelay session snapshot")
+
+    def __iter__(self) -> Iterator[Tuple[int, float, Dict[str, Any], int, int]]:
+        """
+        Yield (id, created_at, metadata, raw offset, raw length) per record.
+        """
+        view = memoryview(self._map)
+        try:
+            index = view[_HEADER.size: _HEADER.size + _ENTRY.size * self.count]
+            for sid, created_at, moff, mlen, roff, rlen in _ENTRY.iter_unpack(index):
+                meta = json.loads(bytes(view[moff: moff + mlen]))
+                yield sid, created_at, meta, roff, rlen
+            index.release()
+        finally:
+            view.release()
+
+    def read_payloads(self, offset: int, length: int) -> List[bytes]:
+        out: List[bytes] = []
+        pos, end = offset, offset + length
+        while pos < end:
+            (n,) = _FRAME.unpack_from(self._map, pos)
+            pos += _FRAME.size
+            out.append(self._map[pos: pos + n])
+            pos += n
+        return out
+
+    def read_raw(self, offset: int, length: int) -> bytes:
+        if length < _FRAME.size:
+            return b""
+        (n,) = _FRAME.unpack_from(self._map, offset)
+        start = offset + _FRAME.size
+        return self._map[start: start + n]
+
+    def close(self) -> None:
+        try:
+            self._map.close()
+        finally:
+            self._file.close()
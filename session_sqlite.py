@@ -0,0 +1,614 @@
+# session_sqlite.py
+
+from __future__ import annotations
+import ipaddress
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ghostrelay.config import RETENTION_POLICIES, RetentionConfig
+from ghostrelay.session_index import FACETS, _FOLDED, Terms, _terms
+from ghostrelay.sessions import (
+    ARCHIVE_FILE, CHANGE_LOG_MAX, DEDUP_MAX_SAMPLES, EVICT_BATCH, EVICT_LOW_WATER, INGEST_QUEUE_MAX,
+    CaptureIngest, NTLMSession, SessionDelta, _META_OVERRIDES, _append_archive,
+    _parse_ntlm_metadata, _scan_archive, _session_meta,
+)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id                INTEGER PRIMARY KEY,
+    created_at        REAL NOT NULL,
+    source_ip         TEXT,
+    dest_ip           TEXT,
+    direction         TEXT,
+    raw_data          BLOB,
+    note              TEXT DEFAULT '',
+    message_type      INTEGER,
+    message_type_name TEXT,
+    username          TEXT COLLATE NOCASE,
+    domain            TEXT COLLATE NOCASE,
+    workstation       TEXT,
+    hash_type         TEXT,
+    hit_count         INTEGER DEFAULT 1,
+    last_seen         REAL,
+    sample_count      INTEGER DEFAULT 1,
+    interface         TEXT,
+    change_seq        INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS session_samples (
+    session_id INTEGER NOT NULL,
+    payload    BLOB NOT NULL
+);
+-- Store version, shared by every process using the file: each write
+-- transaction bumps it and stamps the rows it touched (change_seq) or
+-- removed. Cursors before the horizon are no longer covered.
+CREATE TABLE IF NOT EXISTS store_meta (
+    key   TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO store_meta (key, value) VALUES ('version', 0), ('horizon', 0);
+CREATE TABLE IF NOT EXISTS removed_sessions (
+    id         INTEGER NOT NULL,
+    change_seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_removed_change_seq  ON removed_sessions(change_seq);
+CREATE INDEX IF NOT EXISTS idx_samples_session     ON session_samples(session_id);
+CREATE INDEX IF NOT EXISTS idx_sessions_username   ON sessions(username);
+CREATE INDEX IF NOT EXISTS idx_sessions_domain     ON sessions(domain);
+CREATE INDEX IF NOT EXISTS idx_sessions_source_ip  ON sessions(source_ip);
+CREATE INDEX IF NOT EXISTS idx_sessions_hash_type  ON sessions(hash_type);
+CREATE INDEX IF NOT EXISTS idx_sessions_created_at ON sessions(created_at);
+CREATE INDEX IF NOT EXISTS idx_sessions_direction  ON sessions(direction);
+CREATE INDEX IF NOT EXISTS idx_sessions_interface  ON sessions(interface);
+CREATE INDEX IF NOT EXISTS idx_sessions_last_seen  ON sessions(last_seen);
+CREATE INDEX IF NOT EXISTS idx_sessions_change_seq ON sessions(change_seq);
+"""
+
+_COLUMNS = (
+    "id, created_at, source_ip, dest_ip, direction, raw_data, note, "
+    "message_type, message_type_name, username, domain, workstation, hash_type, "
+    "hit_count, last_seen, sample_count, interface"
+)
+
+# Columns added after the first release of this backend, with their types
+_ADDED_COLUMNS = (
+    ("hit_count", "INTEGER DEFAULT 1"),
+    ("last_seen", "REAL"),
+    ("sample_count", "INTEGER DEFAULT 1"),
+    ("interface", "TEXT"),
+    ("change_seq", "INTEGER DEFAULT 0"),
+)
+
+
+def _row_to_session(row: Tuple[Any, ...]) -> NTLMSession:
+    return NTLMSession(
+        id=row[0],
+        created_at=row[1],
+        source_ip=row[2],
+        dest_ip=row[3],
+        direction=row[4],
+        raw_data=bytes(row[5] or b""),
+        note=row[6] or "",
+        message_type=row[7],
+        message_type_name=row[8],
+        username=row[9],
+        domain=row[10],
+        workstation=row[11],
+        hash_type=row[12],
+        hit_count=row[13] or 1,
+        last_seen=row[14] or 0.0,
+        sample_count=row[15] or 1,
+        interface=row[16],
+    )
+
+
+class SQLiteSessionStore:
+    """
+    SessionStore backed by an indexed SQLite database.
+
+    Same API as SessionStore, but nothing is cached in memory: filters,
+    ranges and counts are pushed down to the database, so the size of the
+    store only costs disk space.
+
+    Retention works as for SessionStore, checked after every batch and on
+    flush(); evicted sessions go to the same gzip archive format.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        dedup: bool = True,
+        max_samples: int = DEDUP_MAX_SAMPLES,
+        ingest_queue_max: int = INGEST_QUEUE_MAX,
+        retention: Optional[RetentionConfig] = None,
+        archive_path: str = ARCHIVE_FILE,
+    ) -> None:
+        self._lock = threading.RLock()
+        self._path = path
+        self._dedup = dedup
+        self._max_samples = max_samples
+        self._retention = retention or RetentionConfig()
+        if self._retention.policy not in RETENTION_POLICIES:
+            raise ValueError(f"Unknown retention policy: {self._retention.policy}")
+        self._archive_path = self._retention.archive_path or archive_path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+        # The stored version, re-read only once PRAGMA data_version says
+        # another connection has committed
+        self._data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        self._version = self._meta("version")
+        self._ingest = CaptureIngest(self, ingest_queue_max)
+
+    def add_session(
+        self,
+        source_ip: str,
+        dest_ip: str,
+        direction: str,
+        raw_data: bytes,
+        note: str = "",
+        interface: Optional[str] = None,
+    ) -> NTLMSession:
+        return self.add_sessions([{
+            "source_ip": source_ip,
+            "dest_ip": dest_ip,
+            "direction": direction,
+            "raw_data": raw_data,
+            "note": note,
+            "interface": interface,
+        }])[0]
+
+    def submit(
+        self,
+        source_ip: str,
+        dest_ip: str,
+        direction: str,
+        raw_data: bytes,
+        note: str = "",
+        interface: Optional[str] = None,
+    ) -> bool:
+        """
+        add_session() without waiting for it; see SessionStore.submit().
+        """
+        return self._ingest.put({
+            "source_ip": source_ip,
+            "dest_ip": dest_ip,
+            "direction": direction,
+            "raw_data": raw_data,
+            "note": note,
+            "interface": interface,
+        })
+
+    def add_sessions(
+        self,
+        entries: Iterable[Dict[str, Any]],
+        created: Optional[List[NTLMSession]] = None,
+    ) -> List[NTLMSession]:
+        """
+        add_session() for a batch, in one transaction. Entries and `created`
+        are as for SessionStore.add_sessions().
+        """
+        prepared = []
+        for entry in entries:
+            meta = _parse_ntlm_metadata(entry["raw_data"])
+            for k in _META_OVERRIDES:
+                if entry.get(k):
+                    meta[k] = entry[k]
+            prepared.append((entry, meta))
+        if not prepared:
+            return []
+
+        now = time.time()
+        added: List[NTLMSession] = []
+        hits: List[Tuple[int, int]] = []    # (position in added, session id)
+
+        with self._lock:
+            # Taking the write lock first also keeps another process from
+            # creating the same session between our dedup lookup and insert
+            seq = self._bump()
+            for entry, meta in prepared:
+                source_ip = entry["source_ip"]
+                raw_data = entry["raw_data"]
+                created_at = entry.get("created_at") or now
+                last_seen = entry.get("last_seen") or created_at
+                hit_count = entry.get("hit_count") or 1
+
+                if self._dedup and meta.get("username"):
+                    row = self._db.execute(
+                        "SELECT id, raw_data, sample_count FROM sessions "
+                        "WHERE username = ? AND IFNULL(domain, '') = ? COLLATE NOCASE "
+                        "AND source_ip = ? AND hash_type IS ? ORDER BY id LIMIT 1",
+                        (meta["username"], meta.get("domain") or "", source_ip, meta.get("hash_type")),
+                    ).fetchone()
+                    if row is not None:
+                        if entry.get("created_at") and self._holds(row, raw_data):
+                            # Imported before
+                            hits.append((len(added), row[0]))
+                            added.append(None)
+                            continue
+                        self._record_hit(row, raw_data, last_seen, hit_count, seq)
+                        hits.append((len(added), row[0]))
+                        added.append(None)
+                        continue
+
+                cur = self._db.execute(
+                    "INSERT INTO sessions (created_at, source_ip, dest_ip, direction, "
+                    "raw_data, note, message_type, message_type_name, username, domain, "
+                    "workstation, hash_type, last_seen, hit_count, interface, change_seq) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        created_at, source_ip, entry["dest_ip"], entry["direction"],
+                        raw_data, entry.get("note", ""),
+                        meta.get("message_type"), meta.get("message_type_name"),
+                        meta.get("username"), meta.get("domain"),
+                        meta.get("workstation"), meta.get("hash_type"), last_seen,
+                        hit_count, entry.get("interface"), seq,
+                    ),
+                )
+                session = NTLMSession(
+                    id=cur.lastrowid,
+                    created_at=created_at,
+                    source_ip=source_ip,
+                    dest_ip=entry["dest_ip"],
+                    direction=entry["direction"],
+                    raw_data=raw_data,
+                    note=entry.get("note", ""),
+                    message_type=meta.get("message_type"),
+                    message_type_name=meta.get("message_type_name"),
+                    username=meta.get("username"),
+                    domain=meta.get("domain"),
+                    workstation=meta.get("workstation"),
+                    hash_type=meta.get("hash_type"),
+                    interface=entry.get("interface"),
+                    hit_count=hit_count,
+                    last_seen=last_seen,
+                )
+                added.append(session)
+                if created is not None:
+                    created.append(session)
+
+            self._db.commit()
+            self._version = seq
+
+            # Dedup hits return the stored session, read after the commit
+            for i, sid in hits:
+                added[i] = self.get_session(sid)
+            self._enforce_retention()
+        return added
+
+    def _enforce_retention(self) -> None:
+        # Called with the lock held. Picks the same victims, in the same
+        # order, as SessionStore._pick_victims().
+        r = self._retention
+        if not (r.max_sessions or r.max_age or r.max_raw_bytes):
+            return
+        lru = r.policy == "lru"
+        order = "last_seen" if lru else "created_at"
+        target_count = int(r.max_sessions * EVICT_LOW_WATER) if r.max_sessions else None
+        target_bytes = int(r.max_raw_bytes * EVICT_LOW_WATER) if r.max_raw_bytes else None
+        cutoff = time.time() - r.max_age if r.max_age else None
+
+        while True:
+            count, nbytes, first = self._db.execute(
+                f"SELECT COUNT(*), IFNULL(SUM(LENGTH(raw_data)), 0), MIN({order}) FROM sessions"
+            ).fetchone()
+            shrink = bool(
+                (r.max_sessions and count > r.max_sessions)
+                or (r.max_raw_bytes and nbytes > r.max_raw_bytes)
+            )
+            if not shrink and (cutoff is None or first is None or first >= cutoff):
+                return
+
+            victims: List[int] = []
+            for sid, size, ts in self._db.execute(
+                f"SELECT id, LENGTH(raw_data), {order} FROM sessions ORDER BY {order}, id LIMIT ?",
+                (EVICT_BATCH,),
+            ):
+                expired = cutoff is not None and (ts or 0.0) < cutoff
+                too_many = shrink and target_count is not None and count > target_count
+                too_big = shrink and target_bytes is not None and nbytes > target_bytes
+                if not (expired or too_many or too_big):
+                    break
+                victims.append(sid)
+                count -= 1
+                nbytes -= size or 0
+            if not victims:
+                return
+
+            archived = []
+            for sid in victims:
+                sess = self.get_session(sid)
+                archived.append(dict(_session_meta(sess), id=sess.id, created_at=sess.created_at,
+                                     payloads=[p.hex() for p in self.load_samples(sess)]))
+
+            # Archive first: a crash between the two steps leaves a session
+            # both live and archived rather than lost.
+            if not _append_archive(self._archive_path, archived):
+                return
+            seq = self._bump()
+            ids = [(sid,) for sid in victims]
+            self._db.executemany("DELETE FROM sessions WHERE id = ?", ids)
+            self._db.executemany("DELETE FROM session_samples WHERE session_id = ?", ids)
+            self._log_removed(victims, seq)
+            self._db.commit()
+            self._version = seq
+
+            if len(victims) < EVICT_BATCH:
+                return
+
+    def _meta(self, key: str) -> int:
+        return self._db.execute("SELECT value FROM store_meta WHERE key = ?", (key,)).fetchone()[0]
+
+    def _bump(self) -> int:
+        # Called with the lock held, as the first write of a transaction: it
+        # takes the database write lock, so versions follow commit order
+        # across processes
+        self._db.execute("UPDATE store_meta SET value = value + 1 WHERE key = 'version'")
+        return self._meta("version")
+
+    def _log_removed(self, ids: List[int], seq: int) -> None:
+        # Keep the newest CHANGE_LOG_MAX removals; older cursors get a full delta
+        self._db.executemany(
+            "INSERT INTO removed_sessions (id, change_seq) VALUES (?, ?)", [(sid, seq) for sid in ids]
+        )
+        cut = self._db.execute(
+            "SELECT change_seq FROM removed_sessions ORDER BY change_seq DESC LIMIT 1 OFFSET ?",
+            (CHANGE_LOG_MAX,),
+        ).fetchone()
+        if cut is not None:
+            self._db.execute("DELETE FROM removed_sessions WHERE change_seq <= ?", cut)
+            self._db.execute("UPDATE store_meta SET value = ? WHERE key = 'horizon'", cut)
+
+    def _migrate(self) -> None:
+        cols = {r[1] for r in self._db.execute("PRAGMA table_info(sessions)")}
+        if not cols:
+            return
+        for name, decl in _ADDED_COLUMNS:
+            if name not in cols:
+                self._db.execute(f"ALTER TABLE sessions ADD COLUMN {name} {decl}")
+
+    def _holds(self, row: Tuple[Any, ...], raw_data: bytes) -> bool:
+        sid, first_raw, _ = row
+        if bytes(first_raw or b"") == raw_data:
+            return True
+        return self._db.execute(
+            "SELECT 1 FROM session_samples WHERE session_id = ? AND payload = ?", (sid, raw_data)
+        ).fetchone() is not None
+
+    def _record_hit(
+        self, row: Tuple[Any, ...], raw_data: bytes, ts: float, n: int, seq: int
+    ) -> None:
+        sid, first_raw, sample_count = row
+        self._db.execute(
+            "UPDATE sessions SET hit_count = hit_count + ?, "
+            "last_seen = MAX(IFNULL(last_seen, 0), ?), change_seq = ? WHERE id = ?",
+            (n, ts, seq, sid),
+        )
+
+        if sample_count < self._max_samples and bytes(first_raw or b"") != raw_data:
+            dup = self._db.execute(
+                "SELECT 1 FROM session_samples WHERE session_id = ? AND payload = ?",
+                (sid, raw_data),
+            ).fetchone()
+            if dup is None:
+                self._db.execute(
+                    "INSERT INTO session_samples (session_id, payload) VALUES (?, ?)",
+                    (sid, raw_data),
+                )
+                self._db.execute(
+                    "UPDATE sessions SET sample_count = sample_count + 1 WHERE id = ?",
+                    (sid,),
+                )
+
+    def _query(self, sql: str, params: Tuple[Any, ...] = ()) -> List[NTLMSession]:
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [_row_to_session(r) for r in rows]
+
+    def list_sessions(self) -> List[NTLMSession]:
+        return self._query(f"SELECT {_COLUMNS} FROM sessions ORDER BY id")
+
+    def snapshot(self) -> List[NTLMSession]:
+        # SQLite reads are already consistent; a fresh list is the snapshot
+        return self.list_sessions()
+
+    @property
+    def version(self) -> int:
+        """
+        Changes whenever this or any other process changes the store.
+        """
+        with self._lock:
+            data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                self._data_version = data_version
+                self._version = self._meta("version")
+            return self._version
+
+    def changes_since(self, version: int) -> SessionDelta:
+        """
+        Sessions added or changed and ids removed after `version`, as for
+        SessionStore.changes_since(), by whichever process made the change.
+        """
+        current = self.version
+        with self._lock:
+            horizon = self._meta("horizon")
+        if version < horizon or version > current:
+            return SessionDelta(current, True, self.list_sessions())
+        if version == current:
+            return SessionDelta(current, False, [])
+
+        changed = self._query(
+            f"SELECT {_COLUMNS} FROM sessions WHERE change_seq > ? ORDER BY change_seq, id",
+            (version,),
+        )
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id FROM removed_sessions WHERE change_seq > ? ORDER BY change_seq",
+                (version,),
+            ).fetchall()
+        return SessionDelta(current, False, changed, [r[0] for r in rows])
+
+    def get_session(self, sid: int) -> Optional[NTLMSession]:
+        found = self._query(f"SELECT {_COLUMNS} FROM sessions WHERE id = ?", (sid,))
+        return found[0] if found else None
+
+    def load_raw(self, sess: NTLMSession) -> bytes:
+        return sess.raw_data or b""
+
+    def load_samples(self, sess: NTLMSession) -> List[bytes]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT payload FROM session_samples WHERE session_id = ? ORDER BY rowid",
+                (sess.id,),
+            ).fetchall()
+        return [self.load_raw(sess)] + [bytes(r[0]) for r in rows]
+
+    def clear(self) -> None:
+        with self._lock:
+            seq = self._bump()
+            self._db.execute("DELETE FROM sessions")
+            self._db.execute("DELETE FROM session_samples")
+            self._db.execute("DELETE FROM removed_sessions")
+            self._db.execute("UPDATE store_meta SET value = ? WHERE key = 'horizon'", (seq,))
+            self._db.commit()
+            self._version = seq
+
+    @staticmethod
+    def _where(
+        username: Optional[str] = None,
+        username_prefix: Optional[str] = None,
+        source_ip: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        **facets: Terms,
+    ) -> Tuple[str, Tuple[Any, ...]]:
+        clauses: List[str] = []
+        params: List[Any] = []
+
+        for col, val in (("username", username), ("source_ip", source_ip)):
+            if val is not None:
+                clauses.append(f"{col} = ?")
+                params.append(val)
+
+        if username_prefix:
+            escaped = username_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            clauses.append("username LIKE ? ESCAPE '\\'")
+            params.append(escaped + "%")
+
+        for col, val in facets.items():
+            if col not in FACETS:
+                raise ValueError(f"unknown facet {col!r}")
+            terms = _terms(val)
+            if terms is None:
+                continue
+            # The bare column keeps its index usable; folded facets compare
+            # case-insensitively, as SessionIndex does. The index files a
+            # missing value under "", so "" also matches NULL.
+            collate = " COLLATE NOCASE" if col in _FOLDED else ""
+            clause = f"{col}{collate} IN ({', '.join('?' * len(terms))})"
+            if "" in terms:
+                clause = f"({clause} OR {col} IS NULL)"
+            clauses.append(clause)
+            params.extend(terms)
+
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+
+        where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+        return where, tuple(params)
+
+    def filter_sessions(self, limit: Optional[int] = None, **filters: Any) -> List[NTLMSession]:
+        where, params = self._where(**filters)
+        sql = f"SELECT {_COLUMNS} FROM sessions{where} ORDER BY created_at, id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params += (int(limit),)
+        return self._query(sql, params)
+
+    def search(
+        self,
+        limit: Optional[int] = None,
+        cidr: Optional[str] = None,
+        **query: Any,
+    ) -> List[NTLMSession]:
+        if cidr is None:
+            return self.filter_sessions(limit=limit, **query)
+
+        # SQLite cannot compare addresses; narrow in SQL, then by network
+        net = ipaddress.ip_network(cidr, strict=False)
+        out: List[NTLMSession] = []
+        for sess in self.filter_sessions(**query):
+            try:
+                if ipaddress.ip_address(sess.source_ip or "") not in net:
+                    continue
+            except ValueError:
+                continue
+            out.append(sess)
+            if limit is not None and len(out) >= limit:
+                break
+        return out
+
+    def facet_counts(self, **query: Any) -> Dict[str, Dict[str, int]]:
+        out: Dict[str, Dict[str, int]] = {f: {} for f in FACETS}
+        if query:
+            for sess in self.search(**query):
+                for f in FACETS:
+                    value = getattr(sess, f) or ""
+                    out[f][value] = out[f].get(value, 0) + 1
+            return out
+
+        with self._lock:
+            for f in FACETS:
+                rows = self._db.execute(
+                    f"SELECT IFNULL({f}, ''), COUNT(*) FROM sessions GROUP BY 1"
+                ).fetchall()
+                out[f] = {value: n for value, n in rows}
+        return out
+
+    def sessions_between(self, start: float, end: float) -> List[NTLMSession]:
+        return self.filter_sessions(since=start, until=end)
+
+    def count(self, **filters: Any) -> int:
+        if "cidr" in filters:
+            return len(self.search(**filters))
+        where, params = self._where(**filters)
+        with self._lock:
+            return self._db.execute(f"SELECT COUNT(*) FROM sessions{where}", params).fetchone()[0]
+
+    def search_archive(self, limit: Optional[int] = None, **filters: Any) -> List[NTLMSession]:
+        return _scan_archive(self._archive_path, limit, filters)
+
+    def compact(self) -> None:
+        with self._lock:
+            self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def flush(self) -> None:
+        self._ingest.join()
+        with self._lock:
+            self._db.commit()
+            self._enforce_retention()
+
+    def persistence_stats(self) -> dict:
+        # Writes are committed inline; there is no writer queue to report on
+        st = {"queue_depth": 0}
+        st.update(self._ingest.stats())
+        return st
+
+    def close(self) -> None:
+        self._ingest.join()
+        with self._lock:
+            try:
+                self._db.commit()
+                self._db.close()
+            except sqlite3.ProgrammingError:
+                # Already closed
+                pass
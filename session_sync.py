@@ -0,0 +1,157 @@
+# session_sync.py
+#
+# Helpers that let several GhostRelay processes (CLI, web UI) share one
+# on-disk session store: an inter-process file lock and a watcher that
+# reports when the store files change.
+
+from __future__ import annotations
+import ctypes
+import ctypes.util
+import fcntl
+import os
+import select
+import struct
+import threading
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# Fallback polling period when inotify is unavailable
+WATCH_POLL_INTERVAL = 0.5
+
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = os.O_CLOEXEC
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_EVENT = struct.Struct("iIII")   # wd, mask, cookie, name length
+
+
+class FileLock:
+    """
+    Exclusive lock shared by threads of this process and by other processes.
+
+    flock() locks belong to the open file, so threads of one process would
+    not exclude each other through it alone; a threading.Lock is taken first.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._mutex = threading.Lock()
+        self._fd: Optional[int] = None
+
+    def __enter__(self) -> "FileLock":
+        self._mutex.acquire()
+        try:
+            if self._fd is None:
+                self._fd = os.open(self._path, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except Exception:
+            self._mutex.release()
+            raise
+        return self
+
+    def __exit__(self, *exc) -> None:
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            self._mutex.release()
+
+
+def _load_inotify():
+    name = ctypes.util.find_library("c")
+    if not name:
+        return None
+    try:
+        libc = ctypes.CDLL(name, use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class FileWatcher:
+    """
+    Call `callback` (from a daemon thread) whenever one of `names` inside
+    `directory` is written, created or replaced.
+
+    Uses inotify when the platform has it and falls back to comparing
+    os.stat() results every WATCH_POLL_INTERVAL seconds.
+    """
+
+    def __init__(self, directory: str, names: Iterable[str], callback: Callable[[], None]) -> None:
+        self._dir = directory
+        self._names = {n.encode() for n in names}
+        self._callback = callback
+        self._stop = threading.Event()
+        self._fd: Optional[int] = None
+        self.mode = "poll"
+
+        libc = _load_inotify()
+        if libc is not None:
+            fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+            if fd >= 0:
+                mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+                if libc.inotify_add_watch(fd, os.fsencode(directory), mask) >= 0:
+                    self._fd = fd
+                    self.mode = "inotify"
+                else:
+                    os.close(fd)
+
+        target = self._run_inotify if self._fd is not None else self._run_poll
+        self._thread = threading.Thread(target=target, name="ghostrelay-session-watch", daemon=True)
+        self._thread.start()
+
+    def _fire(self) -> None:
+        try:
+            self._callback()
+        except Exception as e:
+            print(f"[GhostRelay][Sessions] Reload after file change failed: {e}")
+
+    def _run_inotify(self) -> None:
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self._fd], [], [], WATCH_POLL_INTERVAL)
+            if not ready:
+                continue
+
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+
+            hit = False
+            pos = 0
+            while pos + _EVENT.size <= len(data):
+                _, _, _, ln = _EVENT.unpack_from(data, pos)
+                name = data[pos + _EVENT.size: pos + _EVENT.size + ln].rstrip(b"\0")
+                pos += _EVENT.size + ln
+                if name in self._names:
+                    hit = True
+
+            if hit:
+                self._fire()
+
+    def _stat_all(self) -> Dict[bytes, Optional[Tuple[int, int, int]]]:
+        out: Dict[bytes, Optional[Tuple[int, int, int]]] = {}
+        for n in self._names:
+            try:
+                st = os.stat(os.path.join(os.fsencode(self._dir), n))
+                out[n] = (st.st_ino, st.st_size, st.st_mtime_ns)
+            except FileNotFoundError:
+                out[n] = None
+        return out
+
+    def _run_poll(self) -> None:
+        last = self._stat_all()
+        while not self._stop.wait(WATCH_POLL_INTERVAL):
+            now = self._stat_all()
+            if now != last:
+                last = now
+                self._fire()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=2 * WATCH_POLL_INTERVAL)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -1,27 +1,114 @@
 # sessions.py  (persistent version)
 
 from __future__ import annotations
-from dataclasses import dataclass, asdict
-from typing import Dict, List, Optional, Any
+from dataclasses import dataclass, field, fields, replace
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Any, Tuple
+from collections import OrderedDict, deque
+from itertools import islice
+import atexit
+import fcntl
+import gzip
+import queue
 import time
 import threading
 import json
 import os
+import sys
+
+from ghostrelay import ntlmssp
+from ghostrelay.config import CONFIG, RETENTION_POLICIES, RetentionConfig
+from ghostrelay.events import EVENT_BUS
+from ghostrelay.session_index import SessionIndex
+from ghostrelay.session_snapshot import SnapshotReader, write_snapshot
+from ghostrelay.session_sync import FileLock, FileWatcher
 
 NTLM_MAGIC = b"NTLMSSP\x00"
 
-# Always store sessions.json next to this file (inside ghostrelay/)
+# Always store session files next to this file (inside ghostrelay/)
 SESS_FILE = os.path.join(os.path.dirname(__file__), "sessions.json")
 
+# Compacted binary snapshot (see session_snapshot.py). Supersedes the legacy
+# hex-encoded sessions.json, which is only read when no snapshot exists yet.
+SNAPSHOT_FILE = os.path.join(os.path.dirname(__file__), "sessions.bin")
 
-@dataclass
+# New captures are appended here instead of rewriting the snapshot; the
+# journal holds everything captured since the last compaction.
+JOURNAL_FILE = os.path.join(os.path.dirname(__file__), "sessions.journal")
+
+# Journal writes happen on a background thread. It waits up to
+# PERSIST_WINDOW seconds (or PERSIST_BATCH_MAX batches) to group captures
+# into one write + fsync. add_session() only blocks once PERSIST_QUEUE_MAX
+# batches are waiting.
+PERSIST_WINDOW = 0.05
+PERSIST_BATCH_MAX = 256
+PERSIST_QUEUE_MAX = 10000
+
+# submit() hands captures to an ingest thread, which stores them in batches
+# of up to INGEST_BATCH_MAX. Past INGEST_QUEUE_MAX waiting captures,
+# submit() drops new ones and counts them instead of blocking the caller.
+INGEST_QUEUE_MAX = 10000
+INGEST_BATCH_MAX = 256
+
+# How often a caller waiting on the writer thread checks that it is alive
+WRITER_CHECK_INTERVAL = 1.0
+
+# Fold the journal into the snapshot once it holds this many records.
+JOURNAL_COMPACT_EVERY = 5000
+
+# Repeat captures of the same (user, domain, client, hash type) fold into one
+# session that keeps at most this many distinct payloads by default.
+DEDUP_MAX_SAMPLES = 8
+
+# Several processes (CLI, web UI) may share the store files. Session ids are
+# handed out in blocks of ID_BLOCK from a shared counter file so they stay
+# unique across processes.
+ID_BLOCK = 256
+
+# Sessions evicted by the retention policy are archived here
+ARCHIVE_FILE = os.path.join(os.path.dirname(__file__), "sessions.archive.gz")
+
+# Eviction works in passes of at most EVICT_BATCH sessions, and a size limit
+# that is exceeded is brought down to EVICT_LOW_WATER of the limit so the
+# row list is not rebuilt for every single capture. Age limits are checked
+# at least every RETENTION_INTERVAL seconds even when nothing is captured.
+EVICT_BATCH = 1000
+EVICT_LOW_WATER = 0.9
+RETENTION_INTERVAL = 30.0
+
+# changes_since() can catch a client up on this many changed or removed
+# sessions; a client further behind gets the full table again.
+CHANGE_LOG_MAX = 10000
+
+# Default database for the "sqlite" session backend
+SESS_DB_FILE = os.path.join(os.path.dirname(__file__), "sessions.db")
+
+
+# String fields that repeat heavily across captures (same handful of hosts,
+# domains, users, notes); each distinct value is kept once.
+_INTERNED_FIELDS = (
+    "source_ip",
+    "dest_ip",
+    "direction",
+    "note",
+    "message_type_name",
+    "username",
+    "domain",
+    "workstation",
+    "hash_type",
+    "interface",
+)
+
+
+@dataclass(slots=True)
 class NTLMSession:
     id: int
     created_at: float
     source_ip: str
     dest_ip: str
     direction: str
-    raw_data: bytes
+    # None for sessions loaded from the binary snapshot until their payload
+    # is needed; use SessionStore.load_raw() / get_session() to read it.
+    raw_data: Optional[bytes]
     note: str = ""
 
     message_type: Optional[int] = None
@@ -31,58 +118,1058 @@ class NTLMSession:
     workstation: Optional[str] = None
     hash_type: Optional[str] = None   # e.g. NetNTLMv2
 
+    # Capture interface for sessions from Responder (None = unknown)
+    interface: Optional[str] = None
+
+    raw_size: int = 0
+
+    # Dedup bookkeeping: created_at is first-seen. samples holds distinct
+    # payloads captured after raw_data and, like raw_data, is None while
+    # they are only in the snapshot; sample_count counts raw_data too.
+    hit_count: int = 1
+    last_seen: float = 0.0
+    sample_count: int = 1
+    samples: Optional[List[bytes]] = field(default=None, repr=False)
+
+    def __post_init__(self) -> None:
+        if self.raw_data is not None:
+            self.raw_size = len(self.raw_data)
+        if not self.last_seen:
+            self.last_seen = self.created_at
+
+        for name in _INTERNED_FIELDS:
+            value = getattr(self, name)
+            if value:
+                setattr(self, name, sys.intern(value))
+
+
+# Flat field copy; dataclasses.asdict() deep-copies and is several times
+# slower, which shows when journaling large batches
+_FIELD_NAMES = tuple(f.name for f in fields(NTLMSession))
+
+
+def _asdict(sess: NTLMSession) -> Dict[str, Any]:
+    return {name: getattr(sess, name) for name in _FIELD_NAMES}
+
+
+def _session_to_dict(sess: NTLMSession) -> Dict[str, Any]:
+    entry = _asdict(sess)
+    entry["raw_data"] = sess.raw_data.hex()
+    entry["samples"] = [p.hex() for p in sess.samples or ()]
+    return entry
+
+
+def _session_meta(sess: NTLMSession) -> Dict[str, Any]:
+    # Everything the snapshot keeps outside the fixed index and raw section
+    entry = _asdict(sess)
+    for k in ("id", "created_at", "raw_data", "samples"):
+        del entry[k]
+    return entry
+
+
+# add_sessions() entry keys that override the metadata parsed from raw_data
+_META_OVERRIDES = ("username", "domain", "workstation", "hash_type")
+
+
+def _journal_bytes(record: Dict[str, Any]) -> bytes:
+    return json.dumps(record, separators=(",", ":")).encode() + b"\n"
+
+
+def _dedup_key(sess: NTLMSession) -> Optional[Tuple[str, str, str, Optional[str]]]:
+    if not sess.username:
+        return None
+    return (sess.username.lower(), (sess.domain or "").lower(), sess.source_ip, sess.hash_type)
+
+
+def _session_from_dict(s: Dict[str, Any], raw_data: Optional[bytes] = None) -> NTLMSession:
+    if raw_data is None and "raw_data" in s:
+        raw_data = bytes.fromhex(s["raw_data"])
+
+    samples = None
+    if raw_data is not None and s.get("samples"):
+        samples = [bytes.fromhex(p) for p in s["samples"]]
+
+    return NTLMSession(
+        id=int(s["id"]),
+        created_at=s["created_at"],
+        source_ip=s["source_ip"],
+        dest_ip=s["dest_ip"],
+        direction=s["direction"],
+        raw_data=raw_data,
+        note=s.get("note", ""),
+        message_type=s.get("message_type"),
+        message_type_name=s.get("message_type_name"),
+        username=s.get("username"),
+        domain=s.get("domain"),
+        workstation=s.get("workstation"),
+        hash_type=s.get("hash_type"),
+        interface=s.get("interface"),
+        raw_size=s.get("raw_size", 0),
+        hit_count=s.get("hit_count", 1),
+        last_seen=s.get("last_seen", 0.0),
+        sample_count=s.get("sample_count", 1),
+        samples=samples,
+    )
+
+
+class SessionSnapshot:
+    """
+    Immutable, versioned view of the session table.
+
+    Backed by the store's append-only row list: later appends land past
+    `count` and are never seen, and removals make the store start a new
+    list. Readers therefore need no lock and nothing is copied until they
+    ask for a list.
+    """
+
+    __slots__ = ("_rows", "count", "version")
+
+    def __init__(self, rows: List[NTLMSession], count: int, version: int) -> None:
+        self._rows = rows
+        self.count = count
+        self.version = version
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[NTLMSession]:
+        return islice(self._rows, self.count)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self._rows[: self.count][i]
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError("session snapshot index out of range")
+        return self._rows[i]
+
+
+@dataclass
+class SessionDelta:
+    """
+    What changed after a cursor (see SessionStore.changes_since()). With
+    full set, `sessions` is the whole table and the client should drop
+    what it has.
+    """
+    version: int
+    full: bool
+    sessions: List[NTLMSession]
+    removed: List[int] = field(default_factory=list)
+
+
+class CaptureIngest:
+    """
+    Non-blocking front door of a session store, for threads that must not
+    wait on it (SOCKS relays, event loops).
+
+    put() appends to a deque and returns: no lock is taken (deque.append is
+    atomic) and the worker is only signalled when it is asleep. The worker
+    thread, started on first use, parses and stores what is pending with
+    store.add_sessions(), one batch per lock round and journal write. When
+    `maxlen` captures are already waiting, put() drops the new one and
+    counts it.
+    """
+
+    def __init__(self, store: Any, maxlen: int = INGEST_QUEUE_MAX,
+                 batch_max: int = INGEST_BATCH_MAX) -> None:
+        self._store = store
+        self.maxlen = maxlen
+        self._batch_max = batch_max
+        self._pending: Deque[Dict[str, Any]] = deque()
+        self._wake = threading.Event()
+        self._sleeping = False
+        self._idle = threading.Condition()
+        self._busy = False
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._drop_lock = threading.Lock()
+        self.stored = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def put(self, entry: Dict[str, Any]) -> bool:
+        if self._thread is None:
+            self._start()
+        if len(self._pending) >= self.maxlen:
+            # Only the overflow path takes a lock, to keep the count exact
+            with self._drop_lock:
+                self.dropped += 1
+            return False
+        self._pending.append(entry)
+        if self._sleeping:
+            self._wake.set()
+        return True
+
+    def _start(self) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="ghostrelay-session-ingest", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        pending = self._pending
+        while True:
+            if not pending:
+                # Re-check after announcing sleep: a put() in between either
+                # sees _sleeping or left its entry for us to find
+                self._sleeping = True
+                if not pending:
+                    with self._idle:
+                        self._busy = False
+                        self._idle.notify_all()
+                    self._wake.wait()
+                self._wake.clear()
+                self._sleeping = False
+                continue
+
+            with self._idle:
+                self._busy = True
+            batch = []
+            while pending and len(batch) < self._batch_max:
+                batch.append(pending.popleft())
+            try:
+                self._store.add_sessions(batch)
+                self.stored += len(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                print(f"[GhostRelay][Sessions] Failed to store {len(batch)} capture(s): {e}")
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until everything put so far has been handed to the store.
+        """
+        if self._thread is None:
+            return True
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "ingest_pending": len(self._pending),
+            "ingest_stored": self.stored,
+            "ingest_dropped": self.dropped,
+            "ingest_failed": self.failed,
+        }
+
+
+class _Waiter:
+    """
+    A flush(), compact() or close() call waiting on the writer thread.
+    error is set if the writer failed while doing what was asked.
+    """
+
+    __slots__ = ("done", "error")
 
-class SessionStore:
     def __init__(self) -> None:
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        if not self.done.is_set():
+            self.error = error
+            self.done.set()
+
+
+class SessionStore:
+    """
+    In-memory session table persisted as snapshot + write-ahead journal.
+
+    add_session() updates memory and queues one JSON journal line for the
+    writer thread, which group-commits queued lines (one write + fsync per
+    batch) so ingest cost does not grow with the size of the store and
+    capture threads never wait on the disk. Once the journal gets long the
+    writer compacts it into the binary snapshot. _load() replays snapshot,
+    then journal.
+
+    Only session metadata is loaded from the snapshot; raw_data stays in the
+    memory-mapped file until get_session() or load_raw() asks for it.
+
+    Every change publishes a new SessionSnapshot; snapshot(), count(),
+    version and list_sessions() read it without taking the lock.
+
+    changes_since(version) lists the sessions added, hit or removed after
+    a version, so pollers can fetch deltas instead of the whole table. Each
+    new version is also announced on EVENT_BUS as a "sessions" event.
+
+    search(), filter_sessions() and facet_counts() are answered from
+    inverted indexes (see session_index.py) kept up to date as sessions
+    are added and evicted.
+
+    With dedup on, a capture whose (username, domain, source_ip, hash_type)
+    matches an existing session bumps that session's hit_count/last_seen and
+    keeps its payload as an extra sample (up to max_samples distinct ones)
+    instead of creating a new session.
+
+    A RetentionConfig bounds the table by count, age and total raw bytes.
+    The writer thread evicts incrementally, appends evicted sessions to a
+    gzip archive (see search_archive()) and journals the eviction.
+
+    Other processes may write the same files. Every file update happens
+    under an inter-process lock, after first applying whatever the other
+    processes appended. A watcher (inotify, else polling) applies their new
+    journal records as they land, and reloads everything only when someone
+    else compacted.
+    """
+
+    def __init__(
+        self,
+        path: str = SNAPSHOT_FILE,
+        journal_path: str = JOURNAL_FILE,
+        legacy_path: str = SESS_FILE,
+        persist_window: float = PERSIST_WINDOW,
+        persist_batch_max: int = PERSIST_BATCH_MAX,
+        persist_queue_max: int = PERSIST_QUEUE_MAX,
+        dedup: bool = True,
+        max_samples: int = DEDUP_MAX_SAMPLES,
+        retention: Optional[RetentionConfig] = None,
+        archive_path: str = ARCHIVE_FILE,
+        watch: bool = True,
+        ingest_queue_max: int = INGEST_QUEUE_MAX,
+    ) -> None:
         self._lock = threading.Lock()
         self._sessions: Dict[int, NTLMSession] = {}
+        self._index = SessionIndex()
+
+        # Highest id seen, and the block of ids reserved for this process
         self._counter = 0
-        self._load()
+        self._next_id = 0
+        self._id_limit = 0
+
+        self._dedup_enabled = dedup
+        self._max_samples = max_samples
+        self._dedup: Dict[Tuple[str, str, str, Optional[str]], NTLMSession] = {}
+        # Duplicate sessions folded into another process's copy: id -> the
+        # id its hits now go to (see _add_folding())
+        self._aliases: Dict[int, int] = {}
+
+        self._retention = retention or RetentionConfig()
+        if self._retention.policy not in RETENTION_POLICIES:
+            raise ValueError(f"Unknown retention policy: {self._retention.policy}")
+        self._archive_path = self._retention.archive_path or archive_path
+        # Least recently seen first; only maintained for the "lru" policy
+        self._lru: "OrderedDict[int, NTLMSession]" = OrderedDict()
+        self._raw_bytes = 0
+
+        # Append-only; replaced (never shrunk in place) when sessions go away
+        self._rows: List[NTLMSession] = []
+        # Starts from the clock so versions (and changes_since() cursors)
+        # from an earlier run of the store are never mistaken for current
+        self._version = int(time.time() * 1000)
+        self._snap = SessionSnapshot(self._rows, 0, self._version)
+
+        # sid -> (version of its last change, removed?), oldest change first.
+        # Versions before _horizon are no longer covered.
+        self._changes: "OrderedDict[int, Tuple[int, bool]]" = OrderedDict()
+        self._horizon = 0
+
+        self._path = path
+        self._journal_path = journal_path
+        self._legacy_path = legacy_path
+
+        base = os.path.splitext(path)[0]
+        self._flock = FileLock(base + ".lock")
+        self._seq_path = base + ".seq"
+
+        # How far into which files this process has read; a different inode
+        # means another process compacted and we must reload.
+        self._snap_ino: Optional[int] = None
+        self._journal_ino: Optional[int] = None
+        self._journal_offset = 0
+        self._evicted_ids: set = set()
+
+        # Sessions added here whose journal line is not written yet; kept
+        # across a reload triggered by another process's compaction.
+        self._unwritten: Dict[int, NTLMSession] = {}
+
+        # Snapshot payload locations for sessions whose raw_data is not loaded
+        self._reader: Optional[SnapshotReader] = None
+        self._raw_refs: Dict[int, Tuple[int, int]] = {}
+
+        # Only the writer thread touches the journal file after _load()
+        self._journal = None
+        self._journal_records = 0
+
+        # Bumped by clear(); journal lines queued before it are dropped
+        self._generation = 0
+
+        # Bumped (under the lock) when _save() copies the table. Queued
+        # journal lines carry the epoch their change was applied in; once a
+        # snapshot is saved, lines from before its copy are already in it and
+        # are dropped rather than written to the new journal, where replay
+        # would count their hits twice.
+        self._epoch = 0
+        self._saved_epoch = 0
+
+        self._persist_window = persist_window
+        self._persist_batch_max = persist_batch_max
+        self._queue: "queue.Queue[Tuple[str, Any, Any]]" = queue.Queue(maxsize=persist_queue_max)
+        self._stats = {
+            "batches": 0,
+            "records": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+        self._ingest = CaptureIngest(self, ingest_queue_max)
 
+        with self._flock:
+            self._load()
+        self._reset_changes()
+
+        self._closed = False
+        self._writer = threading.Thread(
+            target=self._writer_loop, name="ghostrelay-session-writer", daemon=True
+        )
+        self._writer.start()
+
+        self._watcher: Optional[FileWatcher] = None
+        if watch:
+            self._watcher = FileWatcher(
+                os.path.dirname(os.path.abspath(path)),
+                [os.path.basename(path), os.path.basename(journal_path)],
+                self._on_files_changed,
+            )
+
+    # ---------------------------
+    # Loading
+    # ---------------------------
     def _load(self):
-        if not os.path.exists(SESS_FILE):
-            return
+        # Caller holds self._flock
+        self._snap_ino = _inode(self._path)
+        if self._snap_ino is not None:
+            self._load_snapshot()
+        elif os.path.exists(self._legacy_path):
+            self._load_legacy()
+
+        self._journal_ino = _inode(self._journal_path)
+        self._journal_offset = 0
+        self._read_journal()
+
+        if self._lru:
+            self._lru = OrderedDict(
+                (s.id, s) for s in sorted(self._lru.values(), key=lambda s: s.last_seen)
+            )
+
+        self._rows = list(self._sessions.values())
+        self._publish()
 
+    def _load_snapshot(self):
         try:
-            with open(SESS_FILE, "r") as f:
+            self._reader = SnapshotReader(self._path)
+
+            for sid, created_at, meta, roff, rlen in self._reader:
+                meta.update(id=sid, created_at=created_at)
+                self._apply_add(_session_from_dict(meta))
+                self._raw_refs[sid] = (roff, rlen)
+
+        except Exception as e:
+            print(f"[GhostRelay][Sessions] Failed to load {self._path}: {e}")
+
+    def _load_legacy(self):
+        try:
+            with open(self._legacy_path, "r") as f:
                 data = json.load(f)
 
             for sid, s in data.items():
-                sid = int(sid)
-                sess = NTLMSession(
-                    id=sid,
-                    created_at=s["created_at"],
-                    source_ip=s["source_ip"],
-                    dest_ip=s["dest_ip"],
-                    direction=s["direction"],
-                    raw_data=bytes.fromhex(s["raw_data"]),
-                    note=s.get("note", ""),
-                    message_type=s.get("message_type"),
-                    message_type_name=s.get("message_type_name"),
-                    username=s.get("username"),
-                    domain=s.get("domain"),
-                    workstation=s.get("workstation"),
-                    hash_type=s.get("hash_type"),
-                )
-                self._sessions[sid] = sess
-                self._counter = max(self._counter, sid)
+                s = dict(s, id=int(sid))
+                self._apply_add(_session_from_dict(s))
+
+        except Exception as e:
+            print(f"[GhostRelay][Sessions] Failed to load {self._legacy_path}: {e}")
+
+    def _read_journal(self) -> Tuple[List[NTLMSession], bool]:
+        """
+        Apply journal records past self._journal_offset. Returns the sessions
+        added and whether any were removed. Caller holds self._flock, so any
+        incomplete trailing record is from a writer that crashed.
+        """
+        added: List[NTLMSession] = []
+        removed = False
+        if self._journal_ino is None:
+            return added, removed
+
+        good_end = self._journal_offset
+        evicted = self._evicted_ids
+        try:
+            with open(self._journal_path, "rb") as f:
+                f.seek(good_end)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # Torn write from a crash: drop the partial record
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+
+                    op = record.get("op")
+                    if op == "add":
+                        # An add can land in the journal after the eviction
+                        # of the same session, or after a compaction that
+                        # already saved it; ids are never reused.
+                        sid = record["session"]["id"]
+                        if sid not in evicted and sid not in self._sessions and sid not in self._aliases:
+                            sess = _session_from_dict(record["session"])
+                            removed |= self._add_folding(sess)
+                            if self._sessions.get(sid) is sess:
+                                added.append(sess)
+                    elif op == "hit":
+                        self._apply_hit(record)
+                    elif op == "evict":
+                        evicted.update(record["ids"])
+                        self._apply_evict(record["ids"])
+                        removed = True
+                    elif op == "alias":
+                        self._aliases.update((int(k), v) for k, v in record["ids"].items())
+                    self._journal_records += 1
+
+                    good_end += len(line)
+
+            # Cut off anything after the last complete record so new appends
+            # do not get glued onto a half-written line.
+            if good_end != os.path.getsize(self._journal_path):
+                with open(self._journal_path, "r+b") as f:
+                    f.truncate(good_end)
+
+        except Exception as e:
+            print(f"[GhostRelay][Sessions] Failed to replay {self._journal_path}: {e}")
+
+        self._journal_offset = good_end
+        return added, removed
+
+    def _reload(self) -> None:
+        # Caller holds self._flock and self._lock
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        self._raw_refs = {}
+        self._sessions = {}
+        self._index = SessionIndex()
+        self._dedup = {}
+        self._lru = OrderedDict()
+        self._raw_bytes = 0
+        self._evicted_ids = set()
+        self._journal_records = 0
+        self._close_journal()
+
+        self._load()
+        for sess in self._unwritten.values():
+            if sess.id not in self._sessions:
+                self._add_folding(sess)
+        self._rows = list(self._sessions.values())
+        self._publish()
+        self._reset_changes()
+
+    def _catch_up(self) -> None:
+        """
+        Apply whatever other processes wrote since we last looked.
+        Caller holds self._flock.
+        """
+        snap_ino = _inode(self._path)
+        journal_ino = _inode(self._journal_path)
+
+        with self._lock:
+            if snap_ino != self._snap_ino or (
+                self._journal_ino is not None and journal_ino != self._journal_ino
+            ):
+                self._reload()
+                return
+
+            self._journal_ino = journal_ino
+            added, removed = self._read_journal()
+            if removed:
+                self._rows = list(self._sessions.values())
+            else:
+                self._rows.extend(added)
+            if added or removed:
+                self._publish()
 
+    def _on_files_changed(self) -> None:
+        if self._closed:
+            return
+        with self._flock:
+            self._catch_up()
+
+    def _alloc_id(self) -> int:
+        # Called with self._lock held
+        if self._next_id >= self._id_limit:
+            self._reserve_ids()
+        sid = self._next_id
+        self._next_id += 1
+        return sid
+
+    def _reserve_ids(self) -> None:
+        fd = os.open(self._seq_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            raw = os.pread(fd, 32, 0).strip()
+            start = max(int(raw) if raw else 1, self._counter + 1)
+            data = str(start + ID_BLOCK).encode()
+            os.pwrite(fd, data.ljust(32), 0)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        self._next_id = start
+        self._id_limit = start + ID_BLOCK
+
+    def _mark_changed(self, sid: int, removed: bool = False) -> None:
+        # Called with the lock held, before the _publish() that exposes it
+        self._changes[sid] = (self._version + 1, removed)
+        self._changes.move_to_end(sid)
+        if len(self._changes) > CHANGE_LOG_MAX:
+            _, (v, _) = self._changes.popitem(last=False)
+            self._horizon = v
+
+    def _reset_changes(self) -> None:
+        # Called with the lock held (or before any reader exists)
+        self._changes.clear()
+        self._horizon = self._version
+
+    def _apply_add(self, sess: NTLMSession) -> None:
+        self._sessions[sess.id] = sess
+        self._index.add(sess)
+        self._mark_changed(sess.id)
+        self._counter = max(self._counter, sess.id)
+
+        key = _dedup_key(sess)
+        if key is not None:
+            self._dedup.setdefault(key, sess)
+
+        if self._retention.policy == "lru":
+            self._lru[sess.id] = sess
+            self._lru.move_to_end(sess.id)
+        self._raw_bytes += sess.raw_size
+
+    def _add_folding(self, sess: NTLMSession) -> bool:
+        """
+        _apply_add() for a session that may duplicate one already here.
+        Dedup only sees one process's memory, so two processes can each
+        create a session for the same key. Every process keeps the one with
+        the lowest id and folds the other into it, whatever order it learns
+        of them in, so they all agree. True if a session was removed.
+        """
+        key = _dedup_key(sess) if self._dedup_enabled else None
+        canon = self._dedup.get(key) if key is not None else None
+        if canon is None:
+            self._apply_add(sess)
+            return False
+        if canon.id < sess.id:
+            self._fold(sess, canon)
+            return False
+
+        self._apply_add(sess)
+        self._fold(canon, sess)
+        self._apply_evict([canon.id])
+        self._dedup[key] = sess
+        return True
+
+    def _fold(self, dup: NTLMSession, canon: NTLMSession) -> None:
+        # canon is in the table; dup's hits and payloads move over to it
+        self._aliases[dup.id] = canon.id
+        self._apply_hit({"id": canon.id, "ts": dup.last_seen, "n": dup.hit_count})
+        for payload in self._payloads(dup):
+            if canon.sample_count >= self._max_samples:
+                break
+            self._add_sample(canon, payload)
+
+    def _apply_evict(self, ids: List[int]) -> None:
+        for sid in ids:
+            sess = self._sessions.pop(sid, None)
+            if sess is None:
+                continue
+            self._index.remove(sess)
+            self._mark_changed(sid, removed=True)
+            key = _dedup_key(sess)
+            if key is not None and self._dedup.get(key) is sess:
+                del self._dedup[key]
+            self._lru.pop(sid, None)
+            self._raw_refs.pop(sid, None)
+            self._raw_bytes -= sess.raw_size
+
+    def _apply_hit(self, record: Dict[str, Any]) -> None:
+        sid = record["id"]
+        while sid in self._aliases:
+            sid = self._aliases[sid]
+        sess = self._sessions.get(sid)
+        if sess is None:
+            return
+        sess.hit_count += record.get("n", 1)
+        self._mark_changed(sess.id)
+        if record["ts"] >= sess.last_seen:
+            sess.last_seen = record["ts"]
+            if sess.id in self._lru:
+                self._lru.move_to_end(sess.id)
+        if "sample" in record:
+            self._add_sample(sess, bytes.fromhex(record["sample"]))
+
+    def _add_sample(self, sess: NTLMSession, payload: bytes) -> bool:
+        # Pull every payload into memory (they go back to the snapshot at the
+        # next compaction) and add this one if it is new.
+        payloads = self._payloads(sess)
+        if payload in payloads:
+            return False
+        sess.raw_data = payloads[0]
+        sess.samples = payloads[1:] + [payload]
+        sess.sample_count = len(payloads) + 1
+        return True
+
+    def _publish(self) -> None:
+        # Called with the lock held (or before any reader exists)
+        self._version += 1
+        self._snap = SessionSnapshot(self._rows, len(self._rows), self._version)
+        # Listeners fetch the actual change with changes_since()
+        EVENT_BUS.publish("sessions", {"version": self._version})
+
+    # ---------------------------
+    # Persistence (writer thread)
+    # ---------------------------
+    def _writer_loop(self) -> None:
+        # One failed round (an unreadable lock file, a full disk) must not
+        # kill the thread: everything after it would wait forever.
+        while True:
+            batch: List[Tuple[str, Any, Any]] = []
+            try:
+                if self._writer_round(batch):
+                    return
+            except Exception as e:
+                # The round's journal lines are lost; memory still has them
+                print(f"[GhostRelay][Sessions] Writer error, batch not persisted: {e}")
+                for op, _, arg in batch:
+                    if op != "lines" and arg is not None:
+                        arg.finish(e)
+                if any(op == "stop" for op, _, _ in batch):
+                    self._close_journal()
+                    return
+
+    def _writer_round(self, batch: List[Tuple[str, Any, Any]]) -> bool:
+        """
+        Take one batch off the queue (into `batch`, so a failure can be
+        reported to its waiters) and persist it. True once stopped.
+        """
+        try:
+            batch.append(self._queue.get(timeout=RETENTION_INTERVAL))
+        except queue.Empty:
+            self._enforce_retention()
+            return False
+        deadline = time.monotonic() + self._persist_window
+
+        while len(batch) < self._persist_batch_max and batch[-1][0] == "lines":
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        lines: List[Tuple[bytes, Optional[int]]] = []
+        for op, gen, arg in batch:
+            if op == "lines":
+                epoch, item = arg
+                if gen != self._generation:
+                    continue
+                if epoch < self._saved_epoch:
+                    for _, sid in item:
+                        if sid is not None:
+                            self._unwritten.pop(sid, None)
+                    continue
+                lines.extend(item)
+                continue
+
+            # Control ops apply after everything queued before them
+            self._write_batch(lines)
+            lines = []
+
+            if op == "compact":
+                self._compact()
+            elif op == "flush":
+                # Whatever retention the flushed lines call for is part
+                # of the flush
+                self._enforce_retention()
+            elif op == "stop":
+                self._close_journal()
+                arg.finish()
+                return True
+
+            if arg is not None:
+                arg.finish()
+
+        self._write_batch(lines)
+        self._enforce_retention()
+
+        if self._journal_records >= JOURNAL_COMPACT_EVERY:
+            self._compact()
+        return False
+
+    def _write_batch(self, lines: List[Tuple[bytes, Optional[int]]]) -> None:
+        if not lines:
+            return
+
+        t0 = time.perf_counter()
+        with self._flock:
+            self._catch_up()
+            if not self._append_locked([line for line, _ in lines]):
+                return
+
+        for _, sid in lines:
+            if sid is not None:
+                self._unwritten.pop(sid, None)
+
+        ms = (time.perf_counter() - t0) * 1000.0
+        self._record_flush(len(lines), ms)
+
+    def _append_locked(self, lines: List[bytes]) -> bool:
+        # Caller holds self._flock and has caught up with the journal
+        try:
+            if self._journal is None:
+                self._journal = open(self._journal_path, "ab")
+                self._journal_ino = os.fstat(self._journal.fileno()).st_ino
+
+            self._journal.write(b"".join(lines))
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._journal_records += len(lines)
+            self._journal_offset = self._journal.tell()
+            return True
+
+        except Exception as e:
+            print(f"[GhostRelay][Sessions] Failed to append to journal: {e}")
+            return False
+
+    def _record_flush(self, n: int, ms: float) -> None:
+        st = self._stats
+        st["batches"] += 1
+        st["records"] += n
+        st["last_flush_ms"] = ms
+        st["max_flush_ms"] = max(st["max_flush_ms"], ms)
+        st["total_flush_ms"] += ms
+
+    # ---------------------------
+    # Retention (writer thread)
+    # ---------------------------
+    def _over_limits(self) -> bool:
+        r = self._retention
+        return bool(
+            (r.max_sessions and len(self._sessions) > r.max_sessions)
+            or (r.max_raw_bytes and self._raw_bytes > r.max_raw_bytes)
+        )
+
+    def _pick_victims(self) -> List[NTLMSession]:
+        # Called with the lock held
+        r = self._retention
+        lru = r.policy == "lru"
+        order = self._lru.values() if lru else self._sessions.values()
+
+        target_count = int(r.max_sessions * EVICT_LOW_WATER) if r.max_sessions else None
+        target_bytes = int(r.max_raw_bytes * EVICT_LOW_WATER) if r.max_raw_bytes else None
+        shrink = self._over_limits()
+        cutoff = time.time() - r.max_age if r.max_age else None
+
+        victims: List[NTLMSession] = []
+        count, nbytes = len(self._sessions), self._raw_bytes
+        for sess in order:
+            if len(victims) >= EVICT_BATCH:
+                break
+
+            expired = cutoff is not None and (sess.last_seen if lru else sess.created_at) < cutoff
+            too_many = shrink and target_count is not None and count > target_count
+            too_big = shrink and target_bytes is not None and nbytes > target_bytes
+            if not (expired or too_many or too_big):
+                break
+
+            victims.append(sess)
+            count -= 1
+            nbytes -= sess.raw_size
+        return victims
+
+    def _enforce_retention(self) -> None:
+        r = self._retention
+        if not (r.max_sessions or r.max_age or r.max_raw_bytes):
+            return
+
+        while True:
+            with self._lock:
+                victims = self._pick_victims()
+                if not victims:
+                    return
+                archived = [dict(_session_meta(s), id=s.id, created_at=s.created_at,
+                                 payloads=[p.hex() for p in self._payloads(s)])
+                            for s in victims]
+                gen = self._generation
+
+            ids = [s.id for s in victims]
+            with self._flock:
+                self._catch_up()
+
+                # Archive first: a crash between the two steps leaves a
+                # session both live and archived rather than lost.
+                if not self._archive(archived):
+                    return
+
+                with self._lock:
+                    if gen != self._generation:
+                        return
+                    self._apply_evict(ids)
+                    gone = set(ids)
+                    self._rows = [s for s in self._rows if s.id not in gone]
+                    self._publish()
+
+                self._append_locked([json.dumps({"op": "evict", "ids": ids}).encode() + b"\n"])
+
+            if len(victims) < EVICT_BATCH:
+                return
+
+    def _archive(self, entries: List[Dict[str, Any]]) -> bool:
+        return _append_archive(self._archive_path, entries)
+
+    def _close_journal(self) -> None:
+        if self._journal is None:
+            return
+        try:
+            self._journal.close()
         except Exception as e:
-            print(f"[GhostRelay][Sessions] Failed to load sessions.json: {e}")
+            print(f"[GhostRelay][Sessions] Failed to close journal: {e}")
+        self._journal = None
+
+    def _put(self, item: Tuple[str, Any, Any]) -> None:
+        # A full queue drains as long as the writer runs; never wait on a
+        # writer that is gone
+        while True:
+            try:
+                self._queue.put(item, timeout=WRITER_CHECK_INTERVAL)
+                return
+            except queue.Full:
+                if not self._writer.is_alive():
+                    raise RuntimeError("session writer thread is not running")
+
+    def _enqueue(self, op: str, arg: Any = None) -> None:
+        self._put((op, self._generation, arg))
+
+    def _wait_for_writer(self, op: str) -> None:
+        """
+        Have the writer do `op` after everything queued so far. Raises
+        RuntimeError if it failed to, or is no longer running.
+        """
+        waiter = _Waiter()
+        self._enqueue(op, waiter)
+        while not waiter.done.wait(WRITER_CHECK_INTERVAL):
+            if not self._writer.is_alive():
+                raise RuntimeError(f"session writer thread is not running; {op} not done")
+        if waiter.error is not None:
+            raise RuntimeError(f"session writer failed during {op}: {waiter.error}") from waiter.error
 
     def _save(self):
-        data: Dict[str, Any] = {}
-        for sid, sess in self._sessions.items():
-            entry = asdict(sess)
-            entry["raw_data"] = sess.raw_data.hex()
-            data[str(sid)] = entry
+        # Copy the metadata and start a new epoch in one lock round, so each
+        # hit is either in this snapshot or journaled after it, never both.
+        with self._lock:
+            items = list(self._snap)
+            metas = [_session_meta(sess) for sess in items]
+            epoch = self._epoch = self._epoch + 1
+
+        records = [
+            (sess.id, sess.created_at, meta,
+             lambda s=sess, n=meta["sample_count"]: self._payloads(s)[:n])
+            for sess, meta in zip(items, metas)
+        ]
 
         try:
-            with open(SESS_FILE, "w") as f:
-                json.dump(data, f, indent=2)
+            offsets = write_snapshot(self._path, records)
+            reader = SnapshotReader(self._path)
         except Exception as e:
-            print(f"[GhostRelay][Sessions] Failed to save sessions.json: {e}")
+            print(f"[GhostRelay][Sessions] Failed to save {self._path}: {e}")
+            return False
+
+        # Everything is on disk now: point at the new file and let go of
+        # payloads that were only held in memory since the last compaction.
+        # Sessions that gained a sample since the copy keep their payloads in
+        # memory until the next compaction.
+        with self._lock:
+            old, self._reader = self._reader, reader
+            self._raw_refs = offsets
+            for sess, meta in zip(items, metas):
+                if sess.sample_count == meta["sample_count"]:
+                    sess.raw_data = None
+                    sess.samples = None
+            if old is not None:
+                old.close()
+            self._saved_epoch = epoch
+        return True
+
+    def _compact(self) -> None:
+        # The journal is only dropped once the snapshot holding its records
+        # is safely on disk. Every record already in the journal belongs to a
+        # session that was in memory when _save() copied the table.
+        with self._flock:
+            self._catch_up()
+            if not self._save():
+                return
+
+            # Swap in a fresh journal (new inode) rather than truncating, so
+            # other processes can tell their read offset no longer applies.
+            try:
+                self._close_journal()
+                tmp = self._journal_path + ".tmp"
+                with open(tmp, "wb"):
+                    pass
+                os.replace(tmp, self._journal_path)
+            except Exception as e:
+                print(f"[GhostRelay][Sessions] Failed to reset journal: {e}")
+
+            self._snap_ino = _inode(self._path)
+            self._journal_ino = _inode(self._journal_path)
+            self._journal_offset = 0
+            self._journal_records = 0
+            self._evicted_ids = set()
+
+            # Hits for a folded session may still be queued in another process
+            if self._aliases:
+                self._append_locked([_journal_bytes({"op": "alias", "ids": self._aliases})])
+
+    def compact(self) -> None:
+        if not self._closed:
+            self._wait_for_writer("compact")
 
+    def flush(self) -> None:
+        """
+        Block until everything submitted or queued so far is fsynced, and
+        the retention limits have been enforced on the result. Raises
+        RuntimeError if the writer could not.
+        """
+        if not self._closed:
+            self._ingest.join()
+            self._wait_for_writer("flush")
+
+    def close(self) -> None:
+        """
+        Store what was submitted, drain the writer queue and stop the writer
+        thread.
+        """
+        if self._closed:
+            return
+        self._ingest.join()
+        self._closed = True
+        if self._watcher is not None:
+            self._watcher.stop()
+        try:
+            self._wait_for_writer("stop")
+        except RuntimeError as e:
+            print(f"[GhostRelay][Sessions] Close did not persist everything: {e}")
+        self._writer.join()
+
+    def persistence_stats(self) -> Dict[str, Any]:
+        st = dict(self._stats)
+        st["queue_depth"] = self._queue.qsize()
+        st["avg_flush_ms"] = st["total_flush_ms"] / st["batches"] if st["batches"] else 0.0
+        st.update(self._ingest.stats())
+        return st
+
+    # ---------------------------
+    # Public API
+    # ---------------------------
     def add_session(
         self,
         source_ip: str,
@@ -90,57 +1177,380 @@ class SessionStore:
         direction: str,
         raw_data: bytes,
         note: str = "",
+        interface: Optional[str] = None,
     ) -> NTLMSession:
+        return self.add_sessions([{
+            "source_ip": source_ip,
+            "dest_ip": dest_ip,
+            "direction": direction,
+            "raw_data": raw_data,
+            "note": note,
+            "interface": interface,
+        }])[0]
 
-        meta = _parse_ntlm_metadata(raw_data)
+    def submit(
+        self,
+        source_ip: str,
+        dest_ip: str,
+        direction: str,
+        raw_data: bytes,
+        note: str = "",
+        interface: Optional[str] = None,
+    ) -> bool:
+        """
+        add_session() without waiting for it: the capture is parsed and
+        stored on the ingest thread (see CaptureIngest). False if it was
+        dropped because INGEST_QUEUE_MAX captures were already waiting.
+        """
+        return self._ingest.put({
+            "source_ip": source_ip,
+            "dest_ip": dest_ip,
+            "direction": direction,
+            "raw_data": raw_data,
+            "note": note,
+            "interface": interface,
+        })
+
+    def add_sessions(
+        self,
+        entries: Iterable[Dict[str, Any]],
+        created: Optional[List[NTLMSession]] = None,
+    ) -> List[NTLMSession]:
+        """
+        add_session() for a batch: one lock round and one published version.
+        Each entry holds add_session()'s arguments; username, domain,
+        workstation and hash_type, when given, override what is parsed out
+        of raw_data (for callers that know them exactly). Entries replayed
+        from an earlier store may also carry created_at, last_seen and
+        hit_count, which are kept instead of dating the capture now; such an
+        entry whose payload the matching session already holds was imported
+        before and changes nothing.
+
+        Returns the session each entry went to. The sessions this call
+        created, as opposed to folded entries into, are appended to
+        `created` when it is given.
+        """
+        prepared = []
+        for entry in entries:
+            meta = _parse_ntlm_metadata(entry["raw_data"])
+            for k in _META_OVERRIDES:
+                if entry.get(k):
+                    meta[k] = entry[k]
+            prepared.append((entry, meta))
+        if not prepared:
+            return []
+
+        now = time.time()
+        added: List[NTLMSession] = []
+        records: List[Tuple[Dict[str, Any], Optional[int]]] = []
 
         with self._lock:
-            self._counter += 1
-            session = NTLMSession(
-                id=self._counter,
-                created_at=time.time(),
-                source_ip=source_ip,
-                dest_ip=dest_ip,
-                direction=direction,
-                raw_data=raw_data,
-                note=note,
-                message_type=meta.get("message_type"),
-                message_type_name=meta.get("message_type_name"),
-                username=meta.get("username"),
-                domain=meta.get("domain"),
-                workstation=meta.get("workstation"),
-                hash_type=meta.get("hash_type"),
+            for entry, meta in prepared:
+                session, record, sid = self._add_locked(entry, meta, now)
+                added.append(session)
+                if record is not None:
+                    records.append((record, sid))
+                if sid is not None and created is not None:
+                    created.append(session)
+            self._publish()
+            gen = self._generation
+            epoch = self._epoch
+
+        # One queue item for the whole batch
+        self._put(("lines", gen, (epoch, [(_journal_bytes(r), sid) for r, sid in records])))
+        return added
+
+    def _add_locked(
+        self, entry: Dict[str, Any], meta: Dict[str, Any], now: float
+    ) -> Tuple[NTLMSession, Optional[Dict[str, Any]], Optional[int]]:
+        # Called with the lock held; the caller publishes and journals
+        source_ip = entry["source_ip"]
+        raw_data = entry["raw_data"]
+        created_at = entry.get("created_at") or now
+        last_seen = entry.get("last_seen") or created_at
+        hits = entry.get("hit_count") or 1
+
+        if self._dedup_enabled and meta.get("username"):
+            key = (
+                meta["username"].lower(),
+                (meta.get("domain") or "").lower(),
+                source_ip,
+                meta.get("hash_type"),
             )
-            self._sessions[self._counter] = session
-            self._save()
-            return session
+            canon = self._dedup.get(key)
+            if canon is not None:
+                if entry.get("created_at") and raw_data in self._payloads(canon):
+                    return canon, None, None
+                return canon, self._record_hit(canon, raw_data, last_seen, hits), None
+
+        session = NTLMSession(
+            id=self._alloc_id(),
+            created_at=created_at,
+            source_ip=source_ip,
+            dest_ip=entry["dest_ip"],
+            direction=entry["direction"],
+            raw_data=raw_data,
+            note=entry.get("note", ""),
+            message_type=meta.get("message_type"),
+            message_type_name=meta.get("message_type_name"),
+            username=meta.get("username"),
+            domain=meta.get("domain"),
+            workstation=meta.get("workstation"),
+            hash_type=meta.get("hash_type"),
+            interface=entry.get("interface"),
+            hit_count=hits,
+            last_seen=last_seen,
+        )
+        self._apply_add(session)
+        self._unwritten[session.id] = session
+        self._rows.append(session)
+        return session, {"op": "add", "session": _session_to_dict(session)}, session.id
+
+    def _record_hit(
+        self, canon: NTLMSession, raw_data: bytes, ts: float, n: int = 1
+    ) -> Dict[str, Any]:
+        # Called with the lock held; returns the journal record. n > 1 folds
+        # in an imported session's hits; ts may then be in the past.
+        canon.hit_count += n
+        self._mark_changed(canon.id)
+        if ts >= canon.last_seen:
+            canon.last_seen = ts
+            if canon.id in self._lru:
+                self._lru.move_to_end(canon.id)
+
+        record: Dict[str, Any] = {"op": "hit", "id": canon.id, "ts": ts}
+        if n != 1:
+            record["n"] = n
+        if canon.sample_count < self._max_samples and self._add_sample(canon, raw_data):
+            record["sample"] = raw_data.hex()
+        return record
+
+    def _raw(self, sess: NTLMSession) -> bytes:
+        if sess.raw_data is not None:
+            return sess.raw_data
+        ref = self._raw_refs.get(sess.id)
+        if ref is None or self._reader is None:
+            return b""
+        return self._reader.read_raw(*ref)
+
+    def _payloads(self, sess: NTLMSession) -> List[bytes]:
+        if sess.raw_data is not None:
+            return [sess.raw_data] + (sess.samples or [])
+        ref = self._raw_refs.get(sess.id)
+        if ref is None or self._reader is None:
+            return [b""]
+        return self._reader.read_payloads(*ref) or [b""]
+
+    def load_samples(self, sess: NTLMSession) -> List[bytes]:
+        """
+        Every distinct payload kept for a session, raw_data first.
+        """
+        with self._lock:
+            return self._payloads(sess)
+
+    def load_raw(self, sess: NTLMSession) -> bytes:
+        """
+        raw_data for a session returned by list_sessions(), read from the
+        snapshot if it is not in memory. Nothing is cached.
+        """
+        with self._lock:
+            return self._raw(sess)
+
+    def snapshot(self) -> SessionSnapshot:
+        return self._snap
+
+    @property
+    def version(self) -> int:
+        """
+        Changes whenever a session is added or removed.
+        """
+        return self._snap.version
 
     def list_sessions(self) -> List[NTLMSession]:
+        return list(self._snap)
+
+    def changes_since(self, version: int) -> SessionDelta:
+        """
+        Sessions added or changed (hit count, samples) and ids removed after
+        `version`, a value previously returned as SessionDelta.version or
+        read from .version. Cost is proportional to the number of changes,
+        not the size of the store. A cursor that is too old or from another
+        run of the store gets a full delta.
+        """
         with self._lock:
-            return list(self._sessions.values())
+            current = self._version
+            if version < self._horizon or version > current:
+                return SessionDelta(current, True, list(self._snap))
+
+            changed: List[NTLMSession] = []
+            removed: List[int] = []
+            for sid in reversed(self._changes):
+                v, gone = self._changes[sid]
+                if v <= version:
+                    break
+                if gone:
+                    removed.append(sid)
+                else:
+                    changed.append(self._sessions[sid])
+
+        changed.reverse()
+        removed.reverse()
+        return SessionDelta(current, False, changed, removed)
 
     def get_session(self, sid: int) -> Optional[NTLMSession]:
+        sess = self._sessions.get(sid)
+        if sess is None or sess.raw_data is not None:
+            return sess
+        # Hand out a copy with the payload filled in; the stored session
+        # keeps its payload on disk.
         with self._lock:
-            return self._sessions.get(sid)
+            payloads = self._payloads(sess)
+            return replace(sess, raw_data=payloads[0], samples=payloads[1:])
 
     def clear(self) -> None:
         with self._lock:
             self._sessions.clear()
-            self._counter = 0
-            self._save()
+            self._index.clear()
+            self._dedup.clear()
+            self._lru.clear()
+            self._raw_bytes = 0
+            self._unwritten.clear()
+            self._generation += 1
+            self._rows = []
+            self._publish()
+            self._reset_changes()
+        self.compact()
+
+    def filter_sessions(
+        self,
+        username: Optional[str] = None,
+        domain: Optional[str] = None,
+        source_ip: Optional[str] = None,
+        hash_type: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: Optional[int] = None,
+    ) -> List[NTLMSession]:
+        """
+        Sessions matching every given field (exact, case-insensitive for
+        username/domain) with since <= created_at < until, oldest first.
+        """
+        return self.search(
+            username=username, domain=domain, source_ip=source_ip,
+            hash_type=hash_type, since=since, until=until, limit=limit,
+        )
 
+    def search(self, limit: Optional[int] = None, **query: Any) -> List[NTLMSession]:
+        """
+        Indexed search, oldest first. Accepts the filter_sessions() fields
+        plus username_prefix, cidr (e.g. "10.0.0.0/24") and the facets
+        domain, hash_type, direction and interface, each of which may be a list of
+        accepted values. See SessionIndex.query(); raises ValueError for a
+        bad facet name or network.
+        """
+        with self._lock:
+            ids = self._index.query(**query)
+            if limit is not None:
+                ids = ids[:limit]
+            return [self._sessions[sid] for sid in ids]
+
+    def facet_counts(self, **query: Any) -> Dict[str, Dict[str, int]]:
+        """
+        {facet: {value: count}} over the sessions matching `query` (all
+        sessions without one), for building drill-down filters.
+        """
+        with self._lock:
+            ids = self._index.query(**query) if query else None
+            return self._index.facet_counts(ids)
+
+    def sessions_between(self, start: float, end: float) -> List[NTLMSession]:
+        return self.filter_sessions(since=start, until=end)
+
+    def count(self, **filters: Any) -> int:
+        if not filters:
+            return self._snap.count
+        with self._lock:
+            return len(self._index.query(**filters))
+
+    def search_archive(self, limit: Optional[int] = None, **filters: Any) -> List[NTLMSession]:
+        """
+        Scan the eviction archive for sessions matching search() filters,
+        in eviction order. Archived sessions come back with their payloads.
+        Raises ValueError for a bad facet name or network, like search().
+        """
+        return _scan_archive(self._archive_path, limit, filters)
+
+
+def _append_archive(path: str, entries: List[Dict[str, Any]]) -> bool:
+    # One gzip member per call; entries are session metadata plus "payloads"
+    try:
+        with gzip.open(path, "ab") as f:
+            f.write(b"".join(json.dumps(e, separators=(",", ":")).encode() + b"\n" for e in entries))
+        return True
+    except Exception as e:
+        print(f"[GhostRelay][Sessions] Failed to archive evicted sessions: {e}")
+        return False
+
+
+def _scan_archive(path: str, limit: Optional[int], filters: Dict[str, Any]) -> List[NTLMSession]:
+    out: List[NTLMSession] = []
+    if not os.path.exists(path):
+        return out
+
+    # Each block goes through a throwaway SessionIndex, so archived
+    # sessions match exactly as live ones do. Bad filters are rejected
+    # up front, not mistaken below for a damaged archive.
+    SessionIndex().query(**filters)
+    block: List[NTLMSession] = []
+
+    def take() -> bool:
+        index = SessionIndex()
+        for sess in block:
+            index.add(sess)
+        hits = set(index.query(**filters))
+        out.extend(sess for sess in block if sess.id in hits)
+        block.clear()
+        if limit is not None and len(out) >= limit:
+            del out[limit:]
+            return True
+        return False
+
+    try:
+        with gzip.open(path, "rb") as f:
+            for line in f:
+                entry = json.loads(line)
+                payloads = [bytes.fromhex(p) for p in entry.pop("payloads")]
+                sess = _session_from_dict(entry, raw_data=payloads[0])
+                sess.samples = payloads[1:]
+                block.append(sess)
+                if len(block) >= EVICT_BATCH and take():
+                    return out
+    except (OSError, EOFError, ValueError) as e:
+        # A torn final gzip member still leaves the earlier ones readable
+        print(f"[GhostRelay][Sessions] Archive read stopped early: {e}")
+
+    take()
+    return out
 
-SESSION_STORE = SessionStore()
+
+def _inode(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
 
 
 def _parse_ntlm_metadata(raw: bytes) -> Dict[str, Any]:
     """
     Try to pull out useful info from what we stored in raw_data.
 
-    For Responder captures, raw_data is typically a NetNTLMv2 line:
-        username::DOMAIN:server_chal:response:blob
+    For Responder captures and proxied AUTHENTICATE messages, raw_data is
+    a hashcat line:
+        username::DOMAIN:server_chal:ntproofstr:blob    (NetNTLMv2)
+        username::DOMAIN:lm_resp:nt_resp:server_chal    (NetNTLMv1)
 
-    For future use, we keep the old NTLMSSP parser as a fallback.
+    Captures stored by earlier versions may be binary NTLMSSP messages;
+    those are decoded by ntlmssp.parse().
     """
     meta: Dict[str, Any] = {
         "message_type": None,
@@ -151,7 +1561,12 @@ def _parse_ntlm_metadata(raw: bytes) -> Dict[str, Any]:
         "hash_type": None,
     }
 
-    # First try: treat as ASCII NetNTLMv2 line
+    idx = raw.find(NTLM_MAGIC)
+    if idx != -1:
+        _parse_ntlmssp(memoryview(raw)[idx:], meta)
+        return meta
+
+    # Otherwise treat as ASCII NetNTLMv2 line
     try:
         line = raw.decode(errors="ignore").strip()
     except Exception:
@@ -171,23 +1586,60 @@ def _parse_ntlm_metadata(raw: bytes) -> Dict[str, Any]:
 
             meta["username"] = username
             meta["domain"] = domain
-            meta["hash_type"] = "NetNTLMv2"
+            # A NetNTLMv1 line has the 24-byte NT response where v2 has
+            # the 16-byte NTProofStr
+            v1 = len(parts) == 6 and len(parts[4]) == 48
+            meta["hash_type"] = "NetNTLMv1" if v1 else "NetNTLMv2"
             # Nothing else to do here, this is enough for the UI
             return meta
 
-    # Fallback: if we ever store real binary NTLM messages, try to classify
-    idx = raw.find(NTLM_MAGIC)
-    if idx == -1:
-        return meta
+    return meta
 
-    if len(raw) < idx + 12:
-        return meta
 
-    msg_type = int.from_bytes(raw[idx + 8: idx + 12], "little")
-    mapping = {1: "NEGOTIATE", 2: "CHALLENGE", 3: "AUTHENTICATE"}
+def _parse_ntlmssp(view: memoryview, meta: Dict[str, Any]) -> None:
+    try:
+        msg = ntlmssp.parse(view)
+    except ntlmssp.NTLMSSPError:
+        # Truncated or mangled: the type is all we can vouch for
+        if len(view) >= 12:
+            msg_type = int.from_bytes(view[8:12], "little")
+            meta["message_type"] = msg_type
+            meta["message_type_name"] = ntlmssp.MESSAGE_TYPE_NAMES.get(msg_type, f"UNKNOWN_{msg_type}")
+        return
+
+    meta["message_type"] = msg.message_type
+    meta["message_type_name"] = msg.message_type_name
+    if msg.message_type == ntlmssp.AUTHENTICATE:
+        meta["username"] = msg.user
+        meta["domain"] = msg.domain
+        meta["workstation"] = msg.workstation
+        meta["hash_type"] = msg.hash_type
+    elif msg.message_type == ntlmssp.NEGOTIATE:
+        meta["domain"] = msg.domain
+        meta["workstation"] = msg.workstation
+    else:
+        meta["domain"] = msg.target_name
+
+
+def open_session_store(cfg=CONFIG):
+    """
+    Build the session store selected by cfg.session_backend.
+    """
+    if cfg.session_backend == "sqlite":
+        from ghostrelay.session_sqlite import SQLiteSessionStore
+        return SQLiteSessionStore(
+            cfg.session_db_path or SESS_DB_FILE,
+            dedup=cfg.dedup_sessions,
+            max_samples=cfg.dedup_max_samples,
+            retention=cfg.retention,
+        )
+
+    return SessionStore(
+        dedup=cfg.dedup_sessions,
+        max_samples=cfg.dedup_max_samples,
+        retention=cfg.retention,
+    )
 
-    meta["message_type"] = msg_type
-    meta["message_type_name"] = mapping.get(msg_type, f"UNKNOWN_{msg_type}")
-    # no username/domain parsing for this fallback yet
-    return meta
 
+SESSION_STORE = open_session_store()
+atexit.register(SESSION_STORE.close)
@@ -0,0 +1,442 @@
+# socks_async.py
+#
+# SOCKS5 server on a single asyncio event loop (--proxy --engine asyncio).
+#
+# Same handshake and CONNECT semantics as GhostRelaySocksServer (no-auth
+# only, CONNECT only, IPv4 / domain / IPv6 targets, same reply codes), but
+# a tunnel costs two transports and a timer instead of a thread. Built on
+# protocols rather than streams: data goes from data_received() straight
+# to the peer's transport, and reading pauses while the peer's write
+# buffer is full.
+#
+# On top of the threaded server:
+#   - at most max_connections tunnels; clients past that are refused
+#   - tunnels idle for idle_timeout seconds (no bytes either way) are closed
+#   - stop() stops accepting and lets open tunnels finish for up to
+#     drain_timeout seconds before closing them
+
+from __future__ import annotations
+import asyncio
+import logging
+import socket
+import struct
+import threading
+from typing import Dict, Optional, Set, Tuple
+
+from config import CONFIG
+from socks_proxy import (
+    REP_COMMAND_NOT_SUPPORTED,
+    REP_GENERAL_FAILURE,
+    REP_HOST_UNREACHABLE,
+    REP_SUCCEEDED,
+    connect_error_reply,
+    socks5_reply,
+)
+from ntlm_dissector import FlowDissector
+
+LISTEN_BACKLOG = 4096
+
+# Handshake states
+_GREETING, _REQUEST, _CONNECTING, _RELAY, _CLOSED = range(5)
+
+
+class _Tunnel:
+    """
+    One client and, once connected, its upstream connection.
+    """
+
+    __slots__ = (
+        "server", "client", "remote", "client_addr", "dest", "state", "buf",
+        "last_active", "timer", "dissector", "client_eof", "remote_eof", "up", "down",
+    )
+
+    def __init__(self, server: "AsyncSocksServer") -> None:
+        self.server = server
+        self.client: Optional[asyncio.Transport] = None
+        self.remote: Optional[asyncio.Transport] = None
+        self.client_addr: Tuple[str, int] = ("", 0)
+        self.dest: Tuple[str, int] = ("", 0)
+        self.state = _GREETING
+        self.buf = bytearray()
+        self.last_active = 0.0
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.dissector: Optional[FlowDissector] = None
+        self.client_eof = False
+        self.remote_eof = False
+        self.up = 0         # bytes client -> upstream
+        self.down = 0       # bytes upstream -> client
+
+    # ---------------------------
+    # Idle timeout
+    # ---------------------------
+    def arm_idle_timer(self) -> None:
+        idle = self.server.idle_timeout
+        if idle:
+            loop = self.server.loop
+            self.timer = loop.call_at(self.last_active + idle, self._check_idle)
+
+    def _check_idle(self) -> None:
+        # Traffic only stamps last_active; the timer re-arms itself from it
+        if self.state == _CLOSED:
+            return
+        if self.server.loop.time() - self.last_active >= self.server.idle_timeout:
+            self.server.logger.debug(
+                f"[GhostRelay] Idle tunnel {self.client_addr[0]} → {self.dest[0]}:{self.dest[1]} closed"
+            )
+            self.close()
+        else:
+            self.arm_idle_timer()
+
+    # ---------------------------
+    # Handshake
+    # ---------------------------
+    def negotiate(self) -> None:
+        buf = self.buf
+        if self.state == _GREETING:
+            if len(buf) < 2 or len(buf) < 2 + buf[1]:
+                return
+            nmethods = buf[1]
+            methods = buf[2:2 + nmethods]
+            del buf[:2 + nmethods]
+            if 0x00 not in methods:
+                self.client.write(b"\x05\xff")
+                self.close()
+                return
+            self.client.write(b"\x05\x00")
+            self.state = _REQUEST
+
+        if self.state == _REQUEST:
+            request = self._parse_request()
+            if request is None:
+                return
+            self.dest = request
+            self.state = _CONNECTING
+            # Anything sent early waits in buf until the upstream is up
+            self.client.pause_reading()
+            self.server._spawn(self.connect())
+
+    def _parse_request(self) -> Optional[Tuple[str, int]]:
+        buf = self.buf
+        if len(buf) < 5:
+            return None
+        ver, cmd, _, atyp = buf[0], buf[1], buf[2], buf[3]
+        if ver != 0x05:
+            self.client.write(socks5_reply(REP_GENERAL_FAILURE))
+            raise RuntimeError("Bad SOCKS version")
+
+        if atyp == 0x01:
+            end = 4 + 4
+        elif atyp == 0x03:
+            end = 5 + buf[4]
+        elif atyp == 0x04:
+            end = 4 + 16
+        else:
+            raise RuntimeError("Bad ATYP")
+        if len(buf) < end + 2:
+            return None
+
+        if cmd != 0x01:
+            self.client.write(socks5_reply(REP_COMMAND_NOT_SUPPORTED))
+            raise RuntimeError("Only CONNECT supported")
+
+        if atyp == 0x01:
+            addr = socket.inet_ntoa(bytes(buf[4:end]))
+        elif atyp == 0x03:
+            addr = bytes(buf[5:end]).decode()
+        else:
+            addr = socket.inet_ntop(socket.AF_INET6, bytes(buf[4:end]))
+        port = struct.unpack("!H", buf[end:end + 2])[0]
+        del buf[:end + 2]
+        return addr, port
+
+    async def connect(self) -> None:
+        server = self.server
+        host, port = self.dest
+        server.logger.info(
+            f"[GhostRelay] CONNECT {self.client_addr[0]}:{self.client_addr[1]} → {host}:{port}"
+        )
+        try:
+            transport, _ = await asyncio.wait_for(
+                server.loop.create_connection(lambda: _RemoteProtocol(self), host, port),
+                CONFIG.socks_connect_timeout,
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            server.logger.debug(f"[GhostRelay] Error: {e!r}")
+            if self.state != _CLOSED:
+                if isinstance(e, asyncio.TimeoutError):
+                    rep = REP_HOST_UNREACHABLE
+                else:
+                    rep = connect_error_reply(e)
+                self.client.write(socks5_reply(rep))
+                self.close()
+            return
+
+        if self.state == _CLOSED:
+            # Client went away (or we are shutting down) meanwhile
+            transport.close()
+            return
+
+        self.remote = transport
+        self.state = _RELAY
+        if CONFIG.log_ntlm:
+            self.dissector = FlowDissector(self.client_addr[0], host)
+        self.client.write(socks5_reply(REP_SUCCEEDED, transport.get_extra_info("sockname")))
+        if self.buf:
+            self.forward(self.client, bytes(self.buf))
+            self.buf.clear()
+        self.client.resume_reading()
+
+    # ---------------------------
+    # Relay
+    # ---------------------------
+    def forward(self, source: asyncio.Transport, data: bytes) -> None:
+        self.last_active = self.server.loop.time()
+        if source is self.client:
+            self.remote.write(data)
+            self.up += len(data)
+            direction = "client->server"
+        else:
+            self.client.write(data)
+            self.down += len(data)
+            direction = "server->client"
+        dissector = self.dissector
+        if dissector is not None:
+            dissector.feed(direction, data)
+            if not dissector.active:
+                self.dissector = None
+
+    def half_close(self, source: asyncio.Transport) -> bool:
+        """
+        `source` sent FIN: pass it on and keep the other direction open
+        until that side closes too. Returns whether to keep `source` open.
+        """
+        if self.state != _RELAY:
+            self.close()
+            return False
+        if source is self.client:
+            self.client_eof, peer = True, self.remote
+        else:
+            self.remote_eof, peer = True, self.client
+        if self.client_eof and self.remote_eof:
+            self.close()
+            return False
+        if peer.can_write_eof():
+            peer.write_eof()
+        return True
+
+    def close(self) -> None:
+        if self.state == _CLOSED:
+            return
+        self.state = _CLOSED
+        if self.timer is not None:
+            self.timer.cancel()
+        # close() flushes what is already buffered
+        for transport in (self.client, self.remote):
+            if transport is not None:
+                transport.close()
+        self.server._forget(self)
+
+    def abort(self) -> None:
+        transports = (self.client, self.remote)
+        self.close()
+        for transport in transports:
+            if transport is not None:
+                transport.abort()
+
+
+class _ClientProtocol(asyncio.Protocol):
+    def __init__(self, server: "AsyncSocksServer") -> None:
+        self.server = server
+        self.tunnel = _Tunnel(server)
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        tunnel = self.tunnel
+        tunnel.client = transport
+        if not self.server._admit(tunnel):
+            transport.abort()
+            tunnel.state = _CLOSED
+            return
+        tunnel.client_addr = (transport.get_extra_info("peername") or ("", 0))[:2]
+        tunnel.last_active = self.server.loop.time()
+        tunnel.arm_idle_timer()
+
+    def data_received(self, data: bytes) -> None:
+        tunnel = self.tunnel
+        if tunnel.state == _RELAY:
+            tunnel.forward(tunnel.client, data)
+            return
+        if tunnel.state == _CLOSED:
+            return
+
+        tunnel.buf += data
+        tunnel.last_active = self.server.loop.time()
+        if tunnel.state == _CONNECTING:
+            return
+        try:
+            tunnel.negotiate()
+        except Exception as e:
+            self.server.logger.debug(f"[GhostRelay] Error: {e}")
+            tunnel.close()
+
+    def eof_received(self) -> bool:
+        return self.tunnel.half_close(self.tunnel.client)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.tunnel.close()
+
+    # The client is not taking data: stop reading from the upstream
+    def pause_writing(self) -> None:
+        if self.tunnel.remote is not None:
+            self.tunnel.remote.pause_reading()
+
+    def resume_writing(self) -> None:
+        if self.tunnel.remote is not None and self.tunnel.state == _RELAY:
+            self.tunnel.remote.resume_reading()
+
+
+class _RemoteProtocol(asyncio.Protocol):
+    def __init__(self, tunnel: _Tunnel) -> None:
+        self.tunnel = tunnel
+        self.transport: Optional[asyncio.Transport] = None
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self.transport = transport
+
+    def data_received(self, data: bytes) -> None:
+        if self.tunnel.state == _RELAY:
+            self.tunnel.forward(self.transport, data)
+
+    def eof_received(self) -> bool:
+        return self.tunnel.half_close(self.transport)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        if self.tunnel.remote is self.transport:
+            self.tunnel.close()
+
+    # The upstream is not taking data: stop reading from the client
+    def pause_writing(self) -> None:
+        self.tunnel.client.pause_reading()
+
+    def resume_writing(self) -> None:
+        if self.tunnel.state == _RELAY:
+            self.tunnel.client.resume_reading()
+
+
+class AsyncSocksServer:
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        logger: logging.Logger,
+        max_connections: Optional[int] = None,
+        idle_timeout: Optional[float] = None,
+        drain_timeout: Optional[float] = None,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.logger = logger
+        self.max_connections = max_connections or CONFIG.socks_max_connections
+        self.idle_timeout = CONFIG.socks_idle_timeout if idle_timeout is None else idle_timeout
+        self.drain_timeout = CONFIG.socks_drain_timeout if drain_timeout is None else drain_timeout
+
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._tunnels: Set[_Tunnel] = set()
+        self._tasks: Set[asyncio.Task] = set()     # upstream connects in flight
+        self._stop_requested: Optional[asyncio.Event] = None
+        self._drained: Optional[asyncio.Event] = None
+        self._ready = threading.Event()
+
+        self.accepted = 0
+        self.refused = 0
+        self.peak = 0
+        # Bytes relayed by tunnels that have closed
+        self.bytes_up = 0
+        self.bytes_down = 0
+
+    # ---------------------------
+    def start(self) -> None:
+        """
+        Serve until stop(), then drain; blocks like GhostRelaySocksServer.start().
+        """
+        asyncio.run(self.serve())
+
+    async def serve(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self._stop_requested = asyncio.Event()
+        self._drained = asyncio.Event()
+
+        self._server = await self.loop.create_server(
+            lambda: _ClientProtocol(self),
+            self.host,
+            self.port,
+            reuse_address=True,
+            backlog=LISTEN_BACKLOG,
+        )
+        self.logger.info(
+            f"[GhostRelay] SOCKS5 listening on {self.host}:{self.port} "
+            f"(asyncio, max {self.max_connections} tunnels)"
+        )
+        self._ready.set()
+
+        try:
+            await self._stop_requested.wait()
+        finally:
+            await self._drain()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def stop(self) -> None:
+        """
+        Stop accepting and drain. Safe to call from any thread or a signal
+        handler.
+        """
+        loop = self.loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._stop_requested.set)
+
+    async def _drain(self) -> None:
+        self._server.close()
+        if self._tunnels:
+            self.logger.info(f"[GhostRelay] Draining {len(self._tunnels)} tunnel(s)...")
+            try:
+                await asyncio.wait_for(self._drained.wait(), self.drain_timeout)
+            except asyncio.TimeoutError:
+                self.logger.info(f"[GhostRelay] Closing {len(self._tunnels)} tunnel(s) still open")
+                for tunnel in list(self._tunnels):
+                    tunnel.abort()
+        await self._server.wait_closed()
+
+    # ---------------------------
+    def _admit(self, tunnel: _Tunnel) -> bool:
+        if len(self._tunnels) >= self.max_connections or self._stop_requested.is_set():
+            self.refused += 1
+            return False
+        self._tunnels.add(tunnel)
+        self.accepted += 1
+        self.peak = max(self.peak, len(self._tunnels))
+        return True
+
+    def _spawn(self, coro) -> None:
+        # The loop only keeps weak references to tasks
+        task = self.loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _forget(self, tunnel: _Tunnel) -> None:
+        self._tunnels.discard(tunnel)
+        self.bytes_up += tunnel.up
+        self.bytes_down += tunnel.down
+        if not self._tunnels and self._stop_requested.is_set():
+            self._drained.set()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "active": len(self._tunnels),
+            "accepted": self.accepted,
+            "refused": self.refused,
+            "peak": self.peak,
+            "bytes_up": self.bytes_up + sum(t.up for t in self._tunnels),
+            "bytes_down": self.bytes_down + sum(t.down for t in self._tunnels),
+        }
@@ -1,15 +1,249 @@
 # socks_proxy.py
 
 from __future__ import annotations
+import os
+import select
 import socket
 import threading
 import struct
 import logging
-from typing import Tuple
+import mmap
+from typing import Dict, Optional, Set, Tuple
 
-from sessions import SESSION_STORE
+from config import CONFIG
+from ntlm_dissector import FlowDissector
 
-NTLM_MAGIC = b"NTLMSSP\x00"
+RELAY_BUFSIZE = 65536
+
+# Linux: relay through a pipe with splice(2) so the payload never leaves the
+# kernel. Only once the tunnel's NTLM dissector is done with it, since that
+# has to see the bytes, and once a direction has carried SPLICE_AFTER bytes:
+# the pipe costs two descriptors, which thousands of mostly idle tunnels
+# cannot spare.
+SPLICE = hasattr(os, "splice")
+SPLICE_AFTER = 1 << 20
+_SPLICE_FLAGS = getattr(os, "SPLICE_F_MOVE", 0) | getattr(os, "SPLICE_F_NONBLOCK", 0)
+
+# SOCKS5 reply codes
+REP_SUCCEEDED = 0x00
+REP_GENERAL_FAILURE = 0x01
+REP_HOST_UNREACHABLE = 0x04
+REP_CONNECTION_REFUSED = 0x05
+REP_COMMAND_NOT_SUPPORTED = 0x07
+
+
+def socks5_reply(rep: int, bind_addr: Tuple[str, int] = ("0.0.0.0", 0)) -> bytes:
+    """
+    VER REP RSV ATYP BND.ADDR BND.PORT for `bind_addr`.
+    """
+    host, port = bind_addr[0], bind_addr[1]
+    try:
+        addr = b"\x01" + socket.inet_aton(host)
+    except OSError:
+        addr = b"\x04" + socket.inet_pton(socket.AF_INET6, host)
+    return b"\x05" + bytes([rep]) + b"\x00" + addr + struct.pack("!H", port)
+
+
+def connect_error_reply(e: OSError) -> int:
+    if isinstance(e, ConnectionRefusedError):
+        return REP_CONNECTION_REFUSED
+    if isinstance(e, (socket.gaierror, socket.timeout)):
+        return REP_HOST_UNREACHABLE
+    return REP_GENERAL_FAILURE
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = b""
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("Client closed during SOCKS negotiation")
+        buf += chunk
+    return buf
+
+
+class _Direction:
+    """
+    One direction of a tunnel: bytes read from `src` are written to `dst`.
+
+    At most one chunk is in flight. It is read with recv_into() into a
+    buffer mapped once per direction, or, with `splice`, moved through a
+    pipe once the direction has carried SPLICE_AFTER bytes; `pending`
+    bytes of it are still to be written.
+    """
+
+    __slots__ = ("src", "dst", "src_fd", "dst_fd", "name", "buf", "view",
+                 "splice", "pipe", "start", "end", "eof", "shut", "count")
+
+    def __init__(self, src: socket.socket, dst: socket.socket, name: str,
+                 splice: bool = False) -> None:
+        self.src, self.dst = src, dst
+        self.src_fd, self.dst_fd = src.fileno(), dst.fileno()
+        self.name = name
+        # Anonymous mapping rather than bytearray: pages only become
+        # resident once a read reaches them, so an idle tunnel costs a page
+        self.buf = mmap.mmap(-1, RELAY_BUFSIZE)
+        self.view = memoryview(self.buf)
+        self.splice = splice
+        self.pipe: Optional[Tuple[int, int]] = None
+        self.start = self.end = 0
+        self.eof = False        # src has sent FIN
+        self.shut = False       # FIN passed on to dst
+        self.count = 0
+
+    @property
+    def pending(self) -> int:
+        return self.end - self.start
+
+    def read(self) -> int:
+        """
+        Read the next chunk from src; 0 at EOF. Raises BlockingIOError if
+        there is nothing to read after all.
+        """
+        if self.splice and self.pipe is None and self.count >= SPLICE_AFTER:
+            try:
+                self.pipe = os.pipe()
+            except OSError:
+                # Out of descriptors: stay in userspace
+                self.splice = False
+        if self.pipe is None:
+            n = self.src.recv_into(self.buf)
+        else:
+            n = os.splice(self.src_fd, self.pipe[1], RELAY_BUFSIZE, flags=_SPLICE_FLAGS)
+        self.start, self.end = 0, n
+        self.count += n
+        if not n:
+            self.eof = True
+        return n
+
+    def write(self) -> None:
+        """
+        Write as much of the pending chunk as dst takes without blocking.
+        """
+        while self.start < self.end:
+            try:
+                if self.pipe is None:
+                    sent = self.dst.send(self.view[self.start:self.end])
+                else:
+                    sent = os.splice(self.pipe[0], self.dst_fd, self.end - self.start,
+                                     flags=_SPLICE_FLAGS)
+            except BlockingIOError:
+                return
+            self.start += sent
+
+    def close(self) -> None:
+        self.view.release()
+        self.buf.close()
+        if self.pipe is not None:
+            os.close(self.pipe[0])
+            os.close(self.pipe[1])
+            self.pipe = None
+
+    def shutdown(self) -> None:
+        """
+        Pass src's FIN on to dst; called once everything before it is out.
+        """
+        self.shut = True
+        try:
+            self.dst.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+
+class _Tunnel:
+    """
+    Relays one client <-> remote connection on the calling thread. Both
+    directions are driven by one poll() loop over non-blocking sockets, so
+    a peer that stops reading stalls only its own direction. A FIN from
+    either side is passed on and the other direction keeps running until
+    it closes too.
+    """
+
+    def __init__(self, client_sock: socket.socket, remote_sock: socket.socket,
+                 client_addr: Tuple[str, int], dest: Tuple[str, int], splice: bool = False) -> None:
+        self.client_addr = client_addr
+        self.dest = dest
+        self.up = _Direction(client_sock, remote_sock, "client->server", splice)
+        self.down = _Direction(remote_sock, client_sock, "server->client", splice)
+
+    def run(self, dissector: Optional[FlowDissector] = None) -> None:
+        dirs = (self.up, self.down)
+        for d in dirs:
+            d.src.setblocking(False)
+
+        # poll(), not select(): descriptors go past 1024 under load
+        poller = select.poll()
+        masks: Dict[int, int] = {}
+        for d in dirs:
+            poller.register(d.src_fd, 0)
+            masks[d.src_fd] = 0
+        # Descriptors poll() reported hung up: reads and writes on them
+        # return at once, so they are no longer polled
+        hup: Set[int] = set()
+
+        while not (self.up.shut and self.down.shut):
+            want = dict.fromkeys(masks, 0)
+            ready = []
+            for d in dirs:
+                if d.pending:
+                    if d.dst_fd in hup:
+                        ready.append((d, select.POLLOUT))
+                    else:
+                        want[d.dst_fd] |= select.POLLOUT
+                elif d.eof:
+                    if not d.shut:
+                        d.shutdown()
+                elif d.src_fd in hup:
+                    ready.append((d, select.POLLIN))
+                else:
+                    want[d.src_fd] |= select.POLLIN
+
+            if not ready and any(want.values()):
+                for fd, mask in want.items():
+                    if masks[fd] != mask:
+                        poller.modify(fd, mask)
+                        masks[fd] = mask
+                for fd, ev in poller.poll():
+                    if ev & select.POLLHUP:
+                        hup.add(fd)
+                        poller.unregister(fd)
+                        del masks[fd]
+                    for d in dirs:
+                        if fd == d.src_fd and want[fd] & select.POLLIN:
+                            ready.append((d, select.POLLIN))
+                        if fd == d.dst_fd and want[fd] & select.POLLOUT:
+                            ready.append((d, select.POLLOUT))
+
+            # A socket error (reset) surfaces from the read or write below
+            for d, ev in ready:
+                if ev == select.POLLIN:
+                    try:
+                        n = d.read()
+                    except BlockingIOError:
+                        continue
+                    if not n:
+                        continue
+                    if dissector is not None:
+                        dissector.feed(d.name, d.view[:n])
+                        if not dissector.active:
+                            # Handshake over: nothing needs the bytes now
+                            dissector = None
+                            self.up.splice = self.down.splice = SPLICE
+                # Write straight away: dst usually has room
+                d.write()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "client": f"{self.client_addr[0]}:{self.client_addr[1]}",
+            "dest": f"{self.dest[0]}:{self.dest[1]}",
+            "up": self.up.count,
+            "down": self.down.count,
+            "splice": self.up.pipe is not None or self.down.pipe is not None,
+        }
+
+    def close(self) -> None:
+        self.up.close()
+        self.down.close()
 
 
 class GhostRelaySocksServer:
@@ -19,6 +253,11 @@ class GhostRelaySocksServer:
         self.logger = logger
         self._server_sock = None
         self._running = False
+        self._lock = threading.Lock()
+        self._tunnels: Set[_Tunnel] = set()
+        # Bytes relayed by tunnels that have closed
+        self.bytes_up = 0
+        self.bytes_down = 0
 
     def start(self) -> None:
         self._server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -30,7 +269,13 @@ class GhostRelaySocksServer:
 
         try:
             while self._running:
-                client_sock, addr = self._server_sock.accept()
+                try:
+                    client_sock, addr = self._server_sock.accept()
+                except OSError:
+                    # stop() closed the socket under accept(): a clean exit
+                    if not self._running:
+                        return
+                    raise
                 t = threading.Thread(
                     target=self._handle_client,
                     args=(client_sock, addr),
@@ -54,8 +299,14 @@ class GhostRelaySocksServer:
                 f"[GhostRelay] CONNECT {addr[0]}:{addr[1]} → {dest_host}:{dest_port}"
             )
 
-            remote_sock = socket.create_connection((dest_host, dest_port), timeout=10)
-            self._send_socks5_reply(client_sock, 0x00, remote_sock.getsockname())
+            try:
+                remote_sock = socket.create_connection(
+                    (dest_host, dest_port), timeout=CONFIG.socks_connect_timeout
+                )
+            except OSError as e:
+                self._send_socks5_reply(client_sock, connect_error_reply(e))
+                raise
+            self._send_socks5_reply(client_sock, REP_SUCCEEDED, remote_sock.getsockname())
 
             self._relay(client_sock, remote_sock, addr, (dest_host, dest_port))
 
@@ -68,10 +319,9 @@ class GhostRelaySocksServer:
                 pass
 
     def _socks5_handshake(self, client_sock: socket.socket) -> None:
-        data = client_sock.recv(2)
-        ver, nmethods = data[0], data[1]
+        ver, nmethods = _recv_exact(client_sock, 2)
 
-        methods = client_sock.recv(nmethods)
+        methods = _recv_exact(client_sock, nmethods)
         if 0x00 not in methods:
             client_sock.sendall(b"\x05\xff")
             raise RuntimeError("NO AUTH unsupported")
@@ -79,25 +329,66 @@ class GhostRelaySocksServer:
         client_sock.sendall(b"\x05\x00")
 
     def _socks5_connect_request(self, client_sock: socket.socket) -> Tuple[str, int]:
-        header = client_sock.recv(4)
+        header = _recv_exact(client_sock, 4)
         ver, cmd, _, atyp = header
+        if ver != 0x05:
+            self._send_socks5_reply(client_sock, REP_GENERAL_FAILURE)
+            raise RuntimeError("Bad SOCKS version")
 
         if cmd != 0x01:
+            self._send_socks5_reply(client_sock, REP_COMMAND_NOT_SUPPORTED)
             raise RuntimeError("Only CONNECT supported")
 
         if atyp == 0x01:
-            addr = socket.inet_ntoa(client_sock.recv(4))
+            addr = socket.inet_ntoa(_recv_exact(client_sock, 4))
         elif atyp == 0x03:
-            ln = client_sock.recv(1)[0]
-            addr = client_sock.recv(ln).decode()
+            ln = _recv_exact(client_sock, 1)[0]
+            addr = _recv_exact(client_sock, ln).decode()
         elif atyp == 0x04:
-            addr = socket.inet_ntop(socket.AF_INET6, client_sock.recv(16))
+            addr = socket.inet_ntop(socket.AF_INET6, _recv_exact(client_sock, 16))
         else:
             raise RuntimeError("Bad ATYP")
 
-        port = struct.unpack("!H", client_sock.recv(2))[0]
+        port = struct.unpack("!H", _recv_exact(client_sock, 2))[0]
         return addr, port
 
-    def _send_socks5_reply(self, client_sock, rep, bind_addr):
-        client_sock._
+    def _send_socks5_reply(self, client_sock: socket.socket, rep: int, bind_addr=("0.0.0.0", 0)) -> None:
+        client_sock.sendall(socks5_reply(rep, bind_addr))
+
+    def _relay(
+        self,
+        client_sock: socket.socket,
+        remote_sock: socket.socket,
+        client_addr: Tuple[str, int],
+        dest: Tuple[str, int],
+    ) -> None:
+        dissector = None
+        if CONFIG.log_ntlm:
+            dissector = FlowDissector(client_addr[0], dest[0])
+        tunnel = _Tunnel(client_sock, remote_sock, client_addr, dest,
+                         splice=SPLICE and dissector is None)
+        with self._lock:
+            self._tunnels.add(tunnel)
+        try:
+            tunnel.run(dissector)
+        finally:
+            with self._lock:
+                self._tunnels.discard(tunnel)
+                self.bytes_up += tunnel.up.count
+                self.bytes_down += tunnel.down.count
+            tunnel.close()
+            remote_sock.close()
+            self.logger.debug(
+                f"[GhostRelay] Closed {client_addr[0]}:{client_addr[1]} → {dest[0]}:{dest[1]} "
+                f"(up {tunnel.up.count} B, down {tunnel.down.count} B)"
+            )
 
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            tunnels = [t.stats() for t in self._tunnels]
+            return {
+                "active": len(tunnels),
+                "bytes_up": self.bytes_up + sum(t["up"] for t in tunnels),
+                "bytes_down": self.bytes_down + sum(t["down"] for t in tunnels),
+                "tunnels": tunnels,
+            }
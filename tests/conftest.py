@@ -0,0 +1,37 @@
+# conftest.py
+#
+# The checkout is the ghostrelay package, whatever its directory is
+# called: register it under that name so `from ghostrelay import ...`
+# works, and put it on sys.path for the proxy-side modules, which import
+# each other bare.
+#
+# Importing ghostrelay.sessions opens the shared SESSION_STORE; point it
+# at a throwaway database so a test run never touches the checkout's
+# sessions files.
+
+import importlib.util
+import os
+import sys
+import tempfile
+
+PKG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if "ghostrelay" not in sys.modules:
+    _spec = importlib.util.spec_from_file_location(
+        "ghostrelay", os.path.join(PKG_DIR, "__init__.py"), submodule_search_locations=[PKG_DIR]
+    )
+    _pkg = importlib.util.module_from_spec(_spec)
+    sys.modules["ghostrelay"] = _pkg
+    _spec.loader.exec_module(_pkg)
+
+if PKG_DIR not in sys.path:
+    sys.path.append(PKG_DIR)
+
+from ghostrelay.config import CONFIG  # noqa: E402
+
+CONFIG.session_backend = "sqlite"
+CONFIG.session_db_path = os.path.join(tempfile.mkdtemp(prefix="ghostrelay-tests-"), "sessions.db")
+
+# Open it now: with the sqlite backend, a test module importing
+# session_sqlite first would otherwise re-enter it half-initialised
+import ghostrelay.sessions  # noqa: E402,F401
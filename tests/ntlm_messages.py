@@ -0,0 +1,64 @@
+# ntlm_messages.py
+#
+# Well-formed NTLMSSP messages for the tests, as a current Windows client
+# and server send them.
+
+import os
+import struct
+
+from ghostrelay import ntlmssp
+
+VERSION = struct.pack("<BBH3xB", 10, 0, 19041, 15)
+CLIENT_FLAGS = 0xE2088297
+SERVER_FLAGS = 0xE2898215
+
+
+def _secbufs(base, fields):
+    hdrs, payload = b"", b""
+    for f in fields:
+        hdrs += struct.pack("<HHI", len(f), len(f), base + len(payload))
+        payload += f
+    return hdrs, payload
+
+
+def _av_pairs(pairs):
+    out = b"".join(struct.pack("<HH", i, len(v)) + v for i, v in pairs)
+    return out + struct.pack("<HH", ntlmssp.MSV_AV_EOL, 0)
+
+
+def _target_info(domain, host):
+    return _av_pairs([
+        (ntlmssp.MSV_AV_NB_DOMAIN_NAME, domain.encode("utf-16-le")),
+        (ntlmssp.MSV_AV_NB_COMPUTER_NAME, host.encode("utf-16-le")),
+        (ntlmssp.MSV_AV_TIMESTAMP, struct.pack("<Q", 133000000000000000)),
+    ])
+
+
+def negotiate(domain=b"", workstation=b""):
+    hdrs, payload = _secbufs(40, (domain, workstation))
+    return ntlmssp.NTLM_MAGIC + struct.pack("<II", 1, CLIENT_FLAGS) + hdrs + VERSION + payload
+
+
+def challenge(domain="CORP", host="FS01", server_challenge=None):
+    hdrs, payload = _secbufs(56, (domain.encode("utf-16-le"), _target_info(domain, host)))
+    return (ntlmssp.NTLM_MAGIC + struct.pack("<I", 2) + hdrs[:8] + struct.pack("<I", SERVER_FLAGS)
+            + (server_challenge or os.urandom(8)) + bytes(8) + hdrs[8:] + VERSION + payload)
+
+
+def ntlmv2_response(domain="CORP", host="FS01"):
+    blob = (struct.pack("<BB6xQ", 1, 1, 133000000000000000) + os.urandom(8) + bytes(4)
+            + _target_info(domain, host)[:-4]
+            + _av_pairs([(ntlmssp.MSV_AV_TARGET_NAME, f"cifs/{host}".encode("utf-16-le"))])
+            + bytes(4))
+    return os.urandom(16) + blob
+
+
+def authenticate(user="alice", domain="CORP", workstation="WS01", nt_response=b"", mic=True):
+    nt = nt_response or ntlmv2_response(domain)
+    fields = (bytes(24), nt, domain.encode("utf-16-le"), user.encode("utf-16-le"),
+              workstation.encode("utf-16-le"), os.urandom(16))
+    hdrs, payload = _secbufs(88 if mic else 72, fields)
+    msg = ntlmssp.NTLM_MAGIC + struct.pack("<I", 3) + hdrs + struct.pack("<I", CLIENT_FLAGS) + VERSION
+    if mic:
+        msg += os.urandom(16)
+    return msg + payload
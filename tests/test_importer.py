@@ -0,0 +1,56 @@
+import json
+
+from ghostrelay.importer import import_paths
+from ghostrelay.session_sqlite import SQLiteSessionStore
+from ghostrelay.sessions import NTLMSession, _session_to_dict
+from ntlm_messages import authenticate
+
+
+def _sessions_json(path, n):
+    data = {}
+    for i in range(1, n + 1):
+        sess = NTLMSession(
+            id=i, created_at=1000.0 + i, source_ip="10.0.0.5", dest_ip="10.0.0.1",
+            direction="client->server", raw_data=authenticate(f"user{i}"),
+            hit_count=4, last_seen=5000.0,
+        )
+        data[str(i)] = _session_to_dict(sess)
+    path.write_text(json.dumps(data))
+
+
+def test_sessions_json_keeps_history(tmp_path):
+    src = tmp_path / "in"
+    src.mkdir()
+    _sessions_json(src / "sessions.json", 3)
+
+    db = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    try:
+        r = import_paths([str(src)], store=db, workers=1)
+        assert (r.added, r.merged) == (3, 0)
+        assert sorted((s.created_at, s.last_seen, s.hit_count) for s in db.list_sessions()) == [
+            (1001.0, 5000.0, 4), (1002.0, 5000.0, 4), (1003.0, 5000.0, 4),
+        ]
+
+        # Importing again finds every session already there
+        r = import_paths([str(src / "sessions.json")], store=db, workers=1)
+        assert (r.added, r.merged) == (0, 3)
+        assert {s.hit_count for s in db.list_sessions()} == {4}
+    finally:
+        db.close()
+
+
+def test_foreign_json_is_skipped(tmp_path):
+    src = tmp_path / "in"
+    src.mkdir()
+    _sessions_json(src / "sessions.json", 1)
+    (src / "package.json").write_text(json.dumps({"name": "x", "dependencies": {}}))
+    (src / "broken.json").write_text("{")
+
+    db = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    try:
+        r = import_paths([str(src)], store=db, workers=1)
+        assert sorted(p.rsplit("/", 1)[1] for p in r.skipped) == ["broken.json", "package.json"]
+        assert (r.files, r.added) == (1, 1)
+        assert r.bytes == (src / "sessions.json").stat().st_size
+    finally:
+        db.close()
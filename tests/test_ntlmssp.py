@@ -0,0 +1,151 @@
+import base64
+
+import pytest
+
+from ghostrelay import ntlmssp
+from ghostrelay.benchmarks import fuzz_ntlmssp
+from ghostrelay.sessions import _parse_ntlm_metadata
+from ntlm_dissector import FlowDissector, hash_line
+import ntlm_messages as build
+
+SERVER_CHALLENGE = bytes.fromhex("1122334455667788")
+
+
+def _handshake():
+    nt = build.ntlmv2_response("CORP", "FS01")
+    return (
+        build.negotiate(b"CORP", b"WS01"),
+        build.challenge("CORP", "FS01", SERVER_CHALLENGE),
+        build.authenticate("alice", "CORP", "WS01", nt_response=nt),
+    )
+
+
+def _expected_line(auth):
+    nt = bytes(ntlmssp.parse(auth).nt_response)
+    return f"alice::CORP:1122334455667788:{nt[:16].hex()}:{nt[16:].hex()}".encode()
+
+
+def _feed(dissector, direction, data, size):
+    for pos in range(0, len(data), size):
+        dissector.feed(direction, data[pos:pos + size])
+
+
+def test_parse_negotiate():
+    msg = ntlmssp.parse(build.negotiate(b"CORP", b"WS01"))
+    assert isinstance(msg, ntlmssp.Negotiate)
+    assert (msg.domain, msg.workstation) == ("CORP", "WS01")
+    assert msg.version == (10, 0, 19041, 15)
+
+
+def test_parse_challenge():
+    msg = ntlmssp.parse(build.challenge("CORP", "FS01"))
+    assert isinstance(msg, ntlmssp.Challenge)
+    assert msg.target_name == "CORP"
+    assert msg.av_text(ntlmssp.MSV_AV_NB_COMPUTER_NAME) == "FS01"
+    assert len(msg.server_challenge) == 8
+
+
+def test_parse_authenticate_ntlmv2():
+    nt = build.ntlmv2_response("CORP", "FS01")
+    msg = ntlmssp.parse(build.authenticate("alice", "CORP", "WS01", nt_response=nt))
+    assert isinstance(msg, ntlmssp.Authenticate)
+    assert (msg.user, msg.domain, msg.workstation) == ("alice", "CORP", "WS01")
+    assert msg.hash_type == "NetNTLMv2"
+    assert msg.mic is not None
+    assert bytes(msg.nt_response) == nt
+    assert bytes(msg.ntlmv2.client_challenge) == nt[32:40]
+
+
+def test_parse_authenticate_ntlmv1():
+    msg = ntlmssp.parse(build.authenticate("bob", nt_response=bytes(24), mic=False))
+    assert msg.hash_type == "NetNTLMv1"
+    assert msg.ntlmv2 is None and msg.mic is None
+
+
+@pytest.mark.parametrize("blob", _handshake(), ids=["negotiate", "challenge", "authenticate"])
+def test_truncated_message_is_rejected(blob):
+    for end in range(len(blob)):
+        with pytest.raises(ntlmssp.NTLMSSPError):
+            ntlmssp.parse(blob[:end])
+
+
+@pytest.mark.parametrize("blob", _handshake(), ids=["negotiate", "challenge", "authenticate"])
+def test_message_length_across_reads(blob):
+    # Each prefix a read might deliver either needs more bytes or already
+    # knows the full length
+    for end in range(len(blob) + 1):
+        n = ntlmssp.message_length(blob[:end])
+        assert n is None or n == len(blob), (end, n)
+    assert ntlmssp.message_length(blob) == len(blob)
+    assert ntlmssp.message_length(b"\x00" * 4 + blob, 4) == len(blob)
+
+
+def test_message_length_not_ntlmssp():
+    assert ntlmssp.message_length(ntlmssp.NTLM_MAGIC + b"\x09\x00\x00\x00") == -1
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 64, 4096])
+def test_dissector_reassembles_raw_messages(size):
+    neg, chal, auth = _handshake()
+    seen = []
+    d = FlowDissector("10.0.0.5", "10.0.0.1", sink=lambda *a: seen.append(a))
+
+    _feed(d, "client->server", b"\x00\x00\x00\x90\xfeSMB" + bytes(60) + neg, size)
+    _feed(d, "server->client", b"\x00\x00\x01\x00\xfeSMB" + bytes(60) + chal, size)
+    assert d.active
+    _feed(d, "client->server", b"\x00\x00\x02\x00\xfeSMB" + bytes(60) + auth, size)
+
+    assert seen == [("10.0.0.5", "10.0.0.1", "client->server", _expected_line(auth))]
+    assert not d.active
+
+
+@pytest.mark.parametrize("size", [1, 5, 64])
+def test_dissector_reassembles_http_tokens(size):
+    neg, chal, auth = _handshake()
+    seen = []
+    d = FlowDissector("a", "b", sink=lambda *a: seen.append(a[3]))
+
+    _feed(d, "client->server", b"GET / HTTP/1.1\r\nAuthorization: NTLM "
+          + base64.b64encode(neg) + b"\r\n\r\n", size)
+    _feed(d, "server->client", b"HTTP/1.1 401 Unauthorized\r\nWWW-Authenticate: Negotiate "
+          + base64.b64encode(chal) + b"\r\n\r\n", size)
+    _feed(d, "client->server", b"GET / HTTP/1.1\r\nauthorization: NTLM "
+          + base64.b64encode(auth) + b"\r\n\r\n", size)
+
+    assert seen == [_expected_line(auth)]
+    assert not d.active
+
+
+def test_hash_line_ntlmv1():
+    nt = bytes(range(24))
+    auth = build.authenticate("bob", "LAB", nt_response=nt, mic=False)
+    line = hash_line(auth, SERVER_CHALLENGE)
+    assert line == f"bob::LAB:{bytes(24).hex()}:{nt.hex()}:1122334455667788".encode()
+    meta = _parse_ntlm_metadata(line)
+    assert (meta["username"], meta["domain"], meta["hash_type"]) == ("bob", "LAB", "NetNTLMv1")
+
+
+def test_hash_line_needs_challenge_and_response():
+    neg, _, auth = _handshake()
+    assert hash_line(auth, None) is None
+    assert hash_line(neg, SERVER_CHALLENGE) is None
+    assert hash_line(auth[:60], SERVER_CHALLENGE) is None
+
+
+def test_dissector_without_challenge_submits_nothing():
+    _, _, auth = _handshake()
+    d = FlowDissector("a", "b", sink=lambda *a: pytest.fail("no challenge seen"))
+    _feed(d, "client->server", auth, 64)
+    assert not d.active
+
+
+def test_dissector_gives_up_on_bulk_traffic():
+    d = FlowDissector("a", "b", sink=lambda *a: pytest.fail("nothing to capture"),
+                      inspect_bytes=4096)
+    _feed(d, "client->server", bytes(8192), 1000)
+    assert not d.active
+
+
+def test_fuzz_mutants(capsys):
+    fuzz_ntlmssp.main(["3000", "1"])
+    assert "no failures" in capsys.readouterr().out
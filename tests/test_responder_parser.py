@@ -0,0 +1,34 @@
+from ghostrelay.responder_parser import Capture, ResponderOutputParser
+
+
+def _feed(lines):
+    parser = ResponderOutputParser()
+    return parser, [c for c in map(parser.feed, lines) if c is not None]
+
+
+def test_ntlm_capture():
+    parser, captures = _feed([
+        "[*] [NBT-NS] Poisoned answer sent to 10.0.0.5 for name FS (service: File Server)",
+        "[SMB] NTLMv2-SSP Client   : 10.0.0.6",
+        "[SMB] NTLMv2-SSP Username : CORP\\alice",
+        "[SMB] NTLMv2-SSP Hash     : alice::CORP:1122334455667788:aa:bb",
+        "[SMB] NTLMv2-SSP Hash     : alice::CORP:1122334455667788:cc:dd",
+    ])
+    assert captures == [Capture("10.0.0.6", "File", "CORP\\alice", "alice::CORP:1122334455667788:aa:bb")]
+
+
+def test_poisoned_answer():
+    parser, _ = _feed(["[*] [LLMNR]  Poisoned answer sent to 10.0.0.7 for name wpad"])
+    assert (parser.source_ip, parser.service) == ("10.0.0.7", None)
+    parser.feed("[*] [MDNS] Poisoned answer sent to 10.0.0.8 for name x (service: ldap)")
+    assert (parser.source_ip, parser.service) == ("10.0.0.8", "ldap")
+
+
+def test_basic_capture():
+    _, captures = _feed([
+        "[+] Listening for events...",
+        "[HTTP] Basic Authentication Password : ignored",
+        "[HTTP] HTTP Basic Authentication Username : carol",
+        "[HTTP] Basic Authentication Password : hunter2",
+    ])
+    assert captures == [Capture(None, None, "carol", "hunter2")]
@@ -0,0 +1,312 @@
+import threading
+
+import pytest
+
+from ghostrelay import sessions
+from ghostrelay.config import RetentionConfig
+from ghostrelay.session_sqlite import SQLiteSessionStore
+from ghostrelay.sessions import SessionStore
+from ntlm_messages import authenticate
+
+
+def _open(tmp_path, **kw):
+    return SessionStore(
+        path=str(tmp_path / "sessions.bin"),
+        journal_path=str(tmp_path / "sessions.journal"),
+        legacy_path=str(tmp_path / "sessions.json"),
+        archive_path=str(tmp_path / "sessions.archive.gz"),
+        watch=False,
+        **kw,
+    )
+
+
+def _capture(user, domain="CORP", source_ip="10.0.0.1", hash_type=None):
+    entry = {
+        "source_ip": source_ip,
+        "dest_ip": "10.0.1.1",
+        "direction": "client->server",
+        "raw_data": authenticate(user, domain or ""),
+        "username": user,
+        "domain": domain,
+    }
+    if hash_type:
+        entry["hash_type"] = hash_type
+    return entry
+
+
+# Same users, domains spelled three ways, a missing domain, two networks
+_PARITY = [
+    _capture(f"{name}{i}", domain, f"{net}.{i}", hash_type)
+    for i, (name, domain, net, hash_type) in enumerate([
+        ("admin", "CORP", "10.0.0", None),
+        ("admin", "corp", "10.0.1", None),
+        ("user", "Corp", "192.168.1", None),
+        ("user", None, "10.0.2", "NetNTLMv1"),
+        ("svc", "LAB", "192.168.2", None),
+        ("Admin", "LAB", "10.1.0", "NetNTLMv1"),
+    ])
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    st = _open(tmp_path)
+    yield st
+    st.close()
+
+
+def test_hits_survive_reload(tmp_path):
+    st = _open(tmp_path)
+    for _ in range(5):
+        st.add_sessions([_capture("alice"), _capture("bob")])
+    st.close()
+
+    st = _open(tmp_path)
+    assert sorted((s.username, s.hit_count) for s in st.list_sessions()) == [("alice", 5), ("bob", 5)]
+    st.close()
+
+
+def test_hits_counted_once_across_compactions(tmp_path, monkeypatch):
+    monkeypatch.setattr(sessions, "JOURNAL_COMPACT_EVERY", 50)
+    st = _open(tmp_path)
+    entries = [_capture(f"user{i}") for i in range(10)]
+
+    def capture():
+        for k in range(1000):
+            st.add_sessions([entries[k % 10]])
+
+    threads = [threading.Thread(target=capture) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    live = sum(s.hit_count for s in st.list_sessions())
+    st.close()
+
+    st = _open(tmp_path)
+    assert live == 4000
+    assert sum(s.hit_count for s in st.list_sessions()) == 4000
+    st.close()
+
+
+def test_imported_history_survives_reload(tmp_path):
+    st = _open(tmp_path)
+    created = []
+    st.add_sessions([dict(_capture("carol"), created_at=1000.0, last_seen=2000.0, hit_count=7)],
+                    created=created)
+    st.add_sessions([dict(_capture("carol"), created_at=500.0, last_seen=1500.0, hit_count=3)],
+                    created=created)
+    assert len(created) == 1
+    st.close()
+
+    st = _open(tmp_path)
+    (sess,) = st.list_sessions()
+    assert (sess.created_at, sess.last_seen, sess.hit_count) == (1000.0, 2000.0, 10)
+    st.close()
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_reimport_changes_nothing(tmp_path, backend):
+    st = _open(tmp_path) if backend == "memory" else SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    history = [dict(_capture("dave"), created_at=1000.0, last_seen=2000.0, hit_count=7),
+               dict(_capture("dave"), created_at=1100.0, last_seen=1500.0, hit_count=2)]
+    for _ in range(3):
+        st.add_sessions(history)
+    st.add_sessions([_capture("dave")])
+    ((created_at, hit_count),) = [(s.created_at, s.hit_count) for s in st.list_sessions()]
+    st.close()
+    assert (created_at, hit_count) == (1000.0, 10)
+
+
+def test_duplicates_from_two_processes_are_folded(tmp_path):
+    a, b = _open(tmp_path), _open(tmp_path)
+    # Neither has seen the other's session when it creates its own
+    for st in (a, b):
+        st.add_sessions([_capture("alice")])
+        st.flush()
+    a._on_files_changed()
+
+    for st in (a, b):
+        st.add_sessions([_capture("alice")])
+        st.flush()
+    a._on_files_changed()
+    b._on_files_changed()
+
+    for st in (a, b):
+        assert [(s.username, s.hit_count) for s in st.list_sessions()] == [("alice", 4)]
+    a.compact()
+    b.add_sessions([_capture("alice")])
+    b.close()
+    a.close()
+
+    st = _open(tmp_path)
+    assert [(s.username, s.hit_count) for s in st.list_sessions()] == [("alice", 5)]
+    st.close()
+
+
+@pytest.mark.parametrize("query", [
+    {"domain": "corp"},
+    {"domain": "CORP"},
+    {"domain": ""},
+    {"domain": ["lab", ""]},
+    {"hash_type": "NetNTLMv1"},
+    {"username": "ADMIN0"},
+    {"username_prefix": "adm"},
+    {"cidr": "10.0.0.0/8"},
+    {"cidr": "192.168.0.0/16", "domain": "lab"},
+    {"domain": "corp", "source_ip": "192.168.1.2"},
+])
+def test_sqlite_filters_match_memory(tmp_path, store, query):
+    db = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    try:
+        for st in (store, db):
+            st.add_sessions(_PARITY)
+
+        def found(st):
+            return sorted(s.username for s in st.search(**query))
+
+        assert found(db) == found(store)
+        assert found(store)
+        assert db.count(**query) == store.count(**query)
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize("facet, index", [
+    ("domain", "idx_sessions_domain"),
+    ("hash_type", "idx_sessions_hash_type"),
+])
+def test_sqlite_facet_filters_use_indexes(tmp_path, facet, index):
+    db = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    try:
+        where, params = db._where(**{facet: ["a", "b"]})
+        plan = db._db.execute(f"EXPLAIN QUERY PLAN SELECT * FROM sessions{where}", params).fetchall()
+        assert any(row[-1].startswith("SEARCH") and index in row[-1] for row in plan), plan
+    finally:
+        db.close()
+
+
+def test_sqlite_changes_from_another_process(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    a = SQLiteSessionStore(path)
+    b = SQLiteSessionStore(path, retention=RetentionConfig(max_sessions=2),
+                           archive_path=str(tmp_path / "sessions.archive.gz"))
+    try:
+        first = a.add_sessions([_capture("alice"), _capture("bob")])
+        cursor = a.version
+        assert a.changes_since(cursor) == sessions.SessionDelta(cursor, False, [])
+
+        b.add_sessions([_capture("bob")])
+        assert a.version > cursor
+        delta = a.changes_since(cursor)
+        assert not delta.full
+        assert [(s.username, s.hit_count) for s in delta.sessions] == [("bob", 2)]
+
+        cursor = delta.version
+        b.add_sessions([_capture("carol")])
+        delta = a.changes_since(cursor)
+        assert [s.username for s in delta.sessions] == ["carol"]
+        # Over the limit of 2, b evicts down to 1
+        assert delta.removed == [s.id for s in first]
+        assert a.changes_since(delta.version).sessions == []
+    finally:
+        a.close()
+        b.close()
+
+
+def test_flush_enforces_retention(tmp_path):
+    st = _open(tmp_path, retention=RetentionConfig(max_sessions=10))
+    for i in range(30):
+        st.add_sessions([_capture(f"user{i}")])
+        st.flush()
+        assert st.count() <= 10
+    assert len(st.search_archive()) == 30 - st.count()
+    st.close()
+
+
+@pytest.mark.parametrize("policy", ["lru", "oldest"])
+def test_sqlite_retention_matches_memory(tmp_path, policy):
+    retention = RetentionConfig(max_sessions=3, policy=policy)
+    mem = _open(tmp_path, retention=retention)
+    db = SQLiteSessionStore(str(tmp_path / "sessions.db"), retention=retention,
+                            archive_path=str(tmp_path / "sqlite.archive.gz"))
+    try:
+        for st in (mem, db):
+            for entry in _PARITY + [_PARITY[4]]:
+                st.add_sessions([entry])
+                st.flush()
+
+        def users(sessions_):
+            return sorted(s.username for s in sessions_)
+
+        assert users(db.list_sessions()) == users(mem.list_sessions())
+        assert db.count() <= 3
+        assert users(db.search_archive()) == users(mem.search_archive())
+        assert users(db.search_archive(domain="lab")) == users(mem.search_archive(domain="lab"))
+    finally:
+        db.close()
+        mem.close()
+
+
+def test_unknown_retention_policy():
+    with pytest.raises(ValueError):
+        RetentionConfig(policy="fifo")
+
+
+def test_archive_filters(tmp_path):
+    st = _open(tmp_path, retention=RetentionConfig(max_sessions=1))
+    st.add_sessions(_PARITY)
+    st.flush()
+    archived = st.search_archive()
+    assert 0 < len(archived) == len(_PARITY) - st.count()
+
+    def users(sessions_):
+        return sorted(s.username for s in sessions_)
+
+    assert users(st.search_archive(cidr="10.0.0.0/8")) == users(
+        s for s in archived if s.source_ip.startswith("10."))
+    assert users(st.search_archive(username_prefix="ADM")) == users(
+        s for s in archived if s.username.lower().startswith("adm"))
+    assert users(st.search_archive(domain=["corp", ""])) == users(
+        s for s in archived if (s.domain or "").lower() in ("corp", ""))
+    assert len(st.search_archive(limit=2)) == 2
+
+    with pytest.raises(ValueError):
+        st.search_archive(cidr="not-a-network")
+    with pytest.raises(ValueError):
+        st.search_archive(colour="red")
+    st.close()
+
+
+def test_writer_survives_errors(tmp_path, monkeypatch):
+    st = _open(tmp_path)
+    real = st._write_batch
+
+    def broken(lines):
+        if lines:
+            raise OSError(13, "Permission denied")
+
+    monkeypatch.setattr(st, "_write_batch", broken)
+    st.add_sessions([_capture("alice")])
+    with pytest.raises(RuntimeError, match="Permission denied"):
+        st.flush()
+    assert st._writer.is_alive()
+
+    monkeypatch.setattr(st, "_write_batch", real)
+    st.add_sessions([_capture("bob")])
+    st.flush()
+    st.close()
+
+    st = _open(tmp_path)
+    assert "bob" in [s.username for s in st.list_sessions()]
+    st.close()
+
+
+def test_no_wait_on_a_dead_writer(tmp_path, monkeypatch):
+    monkeypatch.setattr(sessions, "WRITER_CHECK_INTERVAL", 0.05)
+    st = _open(tmp_path)
+    st._enqueue("stop", sessions._Waiter())
+    st._writer.join()
+    with pytest.raises(RuntimeError, match="not running"):
+        st.flush()
+    st.close()
@@ -0,0 +1,60 @@
+import logging
+import socket
+import threading
+import time
+
+import pytest
+
+from socks_async import AsyncSocksServer
+from socks_proxy import REP_GENERAL_FAILURE, GhostRelaySocksServer
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(params=["threads", "asyncio"])
+def server(request):
+    port = _free_port()
+    logger = logging.getLogger("ghostrelay-tests")
+    if request.param == "asyncio":
+        srv = AsyncSocksServer("127.0.0.1", port, logger)
+    else:
+        srv = GhostRelaySocksServer("127.0.0.1", port, logger)
+    t = threading.Thread(target=srv.start, daemon=True)
+    t.start()
+    if request.param == "asyncio":
+        srv.wait_ready(5)
+    else:
+        deadline = time.monotonic() + 5
+        while not srv._running and time.monotonic() < deadline:
+            time.sleep(0.01)
+    yield port
+    srv.stop()
+    # The threaded server's accept() only notices on its next connection
+    if request.param == "asyncio":
+        t.join(5)
+
+
+def _recv_all(sock):
+    # Until the server closes; closing on unread bytes sends a reset
+    data = b""
+    while True:
+        try:
+            chunk = sock.recv(64)
+        except ConnectionResetError:
+            chunk = b""
+        if not chunk:
+            return data
+        data += chunk
+
+
+def test_bad_request_version_is_refused(server):
+    with socket.create_connection(("127.0.0.1", server), timeout=5) as sock:
+        sock.sendall(b"\x05\x01\x00")
+        assert sock.recv(2) == b"\x05\x00"
+        sock.sendall(b"\x04\x01\x00\x01" + socket.inet_aton("127.0.0.1") + b"\x00\x50")
+        reply = _recv_all(sock)
+    assert reply[:2] == bytes([0x05, REP_GENERAL_FAILURE])
@@ -1,10 +1,10 @@
 import os
 from flask import Flask, render_template, jsonify
 from ghostrelay.sessions import SESSION_STORE
-from ghostrelay.responder_manager import ResponderManager
+from ghostrelay.events import EVENT_BUS
 
-# Global responder manager instance
-RESP = ResponderManager()
+# The capture blueprint owns the one ResponderManager of the web UI
+from ghostrelay.web.routes.capture import RESP
 
 
 def create_app():
@@ -15,7 +15,7 @@ def create_app():
     # ---------------------
     @app.route("/")
     def dashboard():
-        session_count = len(SESSION_STORE.list_sessions())
+        session_count = SESSION_STORE.count()
         responder_running = RESP.running
 
         return render_template(
@@ -30,8 +30,11 @@ def create_app():
     @app.route("/api/dashboard")
     def api_dashboard():
         return jsonify({
-            "session_count": len(SESSION_STORE.list_sessions()),
+            "session_count": SESSION_STORE.count(),
             "responder_running": RESP.running,
+            "responder_state": RESP.state,
+            "persistence": SESSION_STORE.persistence_stats(),
+            "event_subscribers": EVENT_BUS.subscriber_count(),
         })
 
     # ---------------------
@@ -41,11 +44,13 @@ def create_app():
     from ghostrelay.web.routes.sessions import sessions_bp
     from ghostrelay.web.routes.targets import targets_bp
     from ghostrelay.web.routes.relay import relay_bp
+    from ghostrelay.web.routes.events import events_bp
 
     app.register_blueprint(capture_bp, url_prefix="/capture")
     app.register_blueprint(sessions_bp, url_prefix="/sessions")
     app.register_blueprint(targets_bp, url_prefix="/targets")
     app.register_blueprint(relay_bp, url_prefix="/relay")
+    app.register_blueprint(events_bp)
 
     return app
 
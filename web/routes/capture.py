@@ -1,18 +1,22 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
+from ghostrelay.log_tail import read_tail
 from ghostrelay.responder_manager import ResponderManager
-import os
 import re
 
 capture_bp = Blueprint("capture", __name__)
 RESP = ResponderManager()
 
+ANSI_RE = re.compile(r"\x1B\[[0-9;]*[A-Za-z]")
+
 # -------------------------------
 # Start Responder capture
 # -------------------------------
 @capture_bp.route("/start", methods=["POST"])
 def start_capture():
+    # Optional JSON body: {"interfaces": ["eth0", "eth1"], "ingest": "db"}
+    body = request.get_json(silent=True) or {}
     try:
-        RESP.start_capture_mode()
+        RESP.start_capture_mode(body.get("interfaces"), body.get("ingest"))
         return jsonify({"status": "started"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -36,29 +40,41 @@ def stop_capture():
 @capture_bp.route("/status")
 def status():
     return jsonify({
-        "running": RESP.running
+        "running": RESP.running,
+        "state": RESP.state,
+        "interfaces": RESP.interface_stats(),
+        "ingest": RESP.ingest,
+        "db": RESP.db_reader.stats() if RESP.db_reader else None,
     })
 
 
 # -------------------------------
 # Return latest log lines
+#   no args  : recent lines as text, served from memory
+#   ?after=N : JSON {"lines", "seq", "reset"}, lines after seq N
+#   ?cursor= : JSON {"data", "cursor", "reset"}, read from ghostrelay.log
+#              by byte offset (for logs written by another process)
 # -------------------------------
 @capture_bp.route("/logs")
 def logs():
-    try:
-        # Our log lives inside ghostrelay/
-        base = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        log_file = os.path.join(base, "ghostrelay.log")
-
-        if not os.path.exists(log_file):
-            return "Log error: log file not found", 500
+    after = request.args.get("after", type=int)
+    if after is not None:
+        lines, seq, reset = RESP.lines.after(after)
+        return jsonify({"lines": lines, "seq": seq, "reset": reset})
 
-        with open(log_file, "r", errors="ignore") as f:
-            data = f.read()[-12000:]  # last 12KB
-
-        clean = re.sub(r"\x1B\[[0-9;]*[A-Za-z]", "", data)
-        return clean, 200, {"Content-Type": "text/plain"}
+    cursor = request.args.get("cursor")
+    if cursor is None:
+        lines, seq, _ = RESP.lines.after(0)
+        text = "".join(line + "\n" for line in lines)
+        return text, 200, {"Content-Type": "text/plain", "X-Log-Seq": str(seq)}
 
+    try:
+        chunk = read_tail(RESP.log_path, cursor)
+    except FileNotFoundError:
+        return "Log error: log file not found", 500
     except Exception as e:
         return f"Log error: {e}", 500
 
+    # Lines are cleaned as they are logged; this only catches stragglers
+    text = ANSI_RE.sub("", chunk.data.decode(errors="ignore"))
+    return jsonify({"data": text, "cursor": chunk.cursor, "reset": chunk.reset})
@@ -0,0 +1,47 @@
+from flask import Blueprint, Response, request, stream_with_context
+from ghostrelay.events import EVENT_BUS
+import json
+
+events_bp = Blueprint("events", __name__)
+
+# Comment line sent when nothing happened for this long, so proxies and
+# the browser keep the connection open
+HEARTBEAT_INTERVAL = 15.0
+
+
+def _format(event):
+    return f"id: {event.id}\nevent: {event.topic}\ndata: {json.dumps(event.data)}\n\n"
+
+
+# ---------------------------------
+# Server-Sent Events: "sessions", "log", "status" and "resync"
+# (refetch everything) events. Browsers resume with Last-Event-ID.
+# ---------------------------------
+@events_bp.route("/events")
+def event_stream():
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        last_id = None
+
+    sub = EVENT_BUS.subscribe(last_id)
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                event = sub.get(timeout=HEARTBEAT_INTERVAL)
+                if event is None:
+                    yield ": ping\n\n"
+                    continue
+                yield _format(event)
+        finally:
+            # Runs when the client disconnects and the generator is closed
+            EVENT_BUS.unsubscribe(sub)
+
+    return Response(
+        stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
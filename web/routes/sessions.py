@@ -1,5 +1,7 @@
-from flask import Blueprint, jsonify, render_template
+from flask import Blueprint, jsonify, render_template, request
+from ghostrelay.session_index import FACETS
 from ghostrelay.sessions import SESSION_STORE
+from ghostrelay.web.routes.capture import RESP
 import re
 import os
 
@@ -7,39 +9,173 @@ sessions_bp = Blueprint("sessions", __name__)
 
 ANSI_RE = re.compile(r"\x1B\[[0-9;]*[A-Za-z]")
 
+# Query-string filters pushed down to SESSION_STORE.filter_sessions()
+FILTER_ARGS = ("username", "domain", "source_ip", "hash_type")
+
+
+def _filters_from_request():
+    filters = {k: request.args[k] for k in FILTER_ARGS if request.args.get(k)}
+    for k in ("since", "until"):
+        if request.args.get(k):
+            filters[k] = float(request.args[k])
+    return filters
+
 
 # ---------------------------------
 # Legacy page view (not dashboard)
 # ---------------------------------
 @sessions_bp.route("/")
 def list_sessions_page():
-    sessions = SESSION_STORE.list_sessions()
+    sessions = SESSION_STORE.snapshot()
     return render_template("sessions.html", sessions=sessions)
 
 
+def _session_row(s):
+    return {
+        "id": s.id,
+        "created_at": s.created_at,
+        "source_ip": s.source_ip,
+        "dest_ip": s.dest_ip,
+        "direction": s.direction,
+        "username": s.username,
+        "domain": s.domain,
+        "message_type": s.message_type_name,
+        "hash_type": s.hash_type,
+        "interface": s.interface,
+        "hit_count": s.hit_count,
+        "last_seen": s.last_seen,
+    }
+
+
 # ---------------------------------
 # JSON API used by dashboard
+#   ?cursor=<version> returns only what changed since that version:
+#   {"cursor", "full", "sessions", "removed"}
 # ---------------------------------
 @sessions_bp.route("/api")
 def list_sessions_api():
+    try:
+        filters = _filters_from_request()
+        limit = request.args.get("limit", type=int)
+        cursor = request.args.get("cursor", type=int)
+    except ValueError:
+        return jsonify({"error": "since/until must be unix timestamps"}), 400
+
+    if cursor is not None:
+        delta = SESSION_STORE.changes_since(cursor)
+        return jsonify(
+            {
+                "cursor": delta.version,
+                "full": delta.full,
+                "sessions": [_session_row(s) for s in delta.sessions],
+                "removed": delta.removed,
+            }
+        )
+
+    if filters or limit is not None:
+        sessions = SESSION_STORE.filter_sessions(limit=limit, **filters)
+    else:
+        sessions = SESSION_STORE.snapshot()
+
+    return jsonify([_session_row(s) for s in sessions])
+
+
+# ---------------------------------
+# Indexed faceted search
+#   ?domain=CORP&domain=LAB&hash_type=NetNTLMv2&direction=capture
+#   &username_prefix=adm&cidr=10.0.0.0/24&since=...&until=...&limit=...
+# ---------------------------------
+@sessions_bp.route("/search")
+def search_api():
+    query = {f: request.args.getlist(f) for f in FACETS if request.args.getlist(f)}
+    for k in ("username", "username_prefix", "source_ip", "cidr"):
+        if request.args.get(k):
+            query[k] = request.args[k]
+
+    try:
+        for k in ("since", "until"):
+            if request.args.get(k):
+                query[k] = float(request.args[k])
+        limit = request.args.get("limit", default=500, type=int)
+
+        total = SESSION_STORE.count(**query)
+        sessions = SESSION_STORE.search(limit=limit, **query)
+        facets = SESSION_STORE.facet_counts(**query)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     out = []
-    for s in SESSION_STORE.list_sessions():
+    for s in sessions:
         out.append(
             {
                 "id": s.id,
                 "created_at": s.created_at,
+                "last_seen": s.last_seen,
                 "source_ip": s.source_ip,
                 "dest_ip": s.dest_ip,
                 "direction": s.direction,
                 "username": s.username,
                 "domain": s.domain,
-                "message_type": s.message_type_name,
                 "hash_type": s.hash_type,
+                "interface": s.interface,
+                "hit_count": s.hit_count,
+            }
+        )
+    return jsonify({"total": total, "sessions": out, "facets": facets})
+
+
+# ---------------------------------
+# Search sessions evicted by retention
+#   same arguments as /search
+# ---------------------------------
+@sessions_bp.route("/archive")
+def archive_api():
+    query = {f: request.args.getlist(f) for f in FACETS if request.args.getlist(f)}
+    for k in ("username", "username_prefix", "source_ip", "cidr"):
+        if request.args.get(k):
+            query[k] = request.args[k]
+
+    try:
+        for k in ("since", "until"):
+            if request.args.get(k):
+                query[k] = float(request.args[k])
+        limit = request.args.get("limit", default=500, type=int)
+        sessions = SESSION_STORE.search_archive(limit=limit, **query)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    out = []
+    for s in sessions:
+        out.append(
+            {
+                "id": s.id,
+                "created_at": s.created_at,
+                "last_seen": s.last_seen,
+                "source_ip": s.source_ip,
+                "dest_ip": s.dest_ip,
+                "username": s.username,
+                "domain": s.domain,
+                "hash_type": s.hash_type,
+                "hit_count": s.hit_count,
+                "hashes": [p.decode(errors="ignore").strip() for p in [s.raw_data] + (s.samples or [])],
             }
         )
     return jsonify(out)
 
 
+# ---------------------------------
+# Session count (optionally filtered)
+# ---------------------------------
+@sessions_bp.route("/count")
+def count_sessions_api():
+    try:
+        filters = _filters_from_request()
+    except ValueError:
+        return jsonify({"error": "since/until must be unix timestamps"}), 400
+
+    return jsonify({"count": SESSION_STORE.count(**filters)})
+
+
 # ---------------------------------
 # Clear all sessions + responder log
 # ---------------------------------
@@ -48,16 +184,13 @@ def clear_sessions():
     # Clear in-memory + persistent session store
     SESSION_STORE.clear()
 
-    # Also truncate ghostrelay.log so a new run starts visually clean
+    # Also truncate ghostrelay.log (and the in-memory copy the log view is
+    # served from) so a new run starts visually clean
+    RESP.lines.clear()
     try:
-        # This file lives in ghostrelay/web/routes/
-        # Go up to ghostrelay/ and point at ghostrelay.log
-        base_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-        log_path = os.path.join(base_dir, "ghostrelay.log")
-
-        if os.path.exists(log_path):
+        if os.path.exists(RESP.log_path):
             # Truncate in place
-            with open(log_path, "w", encoding="utf8"):
+            with open(RESP.log_path, "w", encoding="utf8"):
                 pass
     except Exception:
         # Best-effort only – do not break the API if log clearing fails
@@ -68,23 +201,26 @@ def clear_sessions():
 
 # ---------------------------------
 # Export captured hashes
-# (cleaned, ANSI stripped)
+# (cleaned, ANSI stripped; binary payloads skipped)
 # ---------------------------------
 @sessions_bp.route("/hashes")
 def hashes_export():
     lines = []
 
-    for s in SESSION_STORE.list_sessions():
-        try:
-            raw = s.raw_data.decode(errors="ignore").strip()
-            clean = ANSI_RE.sub("", raw)
-
-            if clean:
+    for s in SESSION_STORE.snapshot():
+        # Deduplicated sessions carry every distinct hash seen for them
+        for payload in SESSION_STORE.load_samples(s):
+            try:
+                raw = payload.decode()
+            except UnicodeDecodeError:
+                continue
+            clean = ANSI_RE.sub("", raw).strip()
+
+            # Raw NTLMSSP messages stored by older proxy captures are
+            # not hash lines
+            if clean and clean.isprintable():
                 lines.append(clean)
 
-        except Exception:
-            continue
-
     output = "\n".join(lines)
     return output, 200, {"Content-Type": "text/plain"}
 